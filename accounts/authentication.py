@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+
+
+class UserCache:
+    """Bounded LRU of resolved users keyed by token ``jti``.
+
+    Entries expire with their token or after ``ttl`` seconds, whichever comes
+    first, and are dropped for a user as soon as that user is saved or deleted
+    in this process. Deactivation and role changes apply to the next request
+    here and, in other worker processes, within ``ttl`` seconds.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[User, float]] = OrderedDict()
+        self._by_user: dict[int, set[str]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, jti: str) -> User | None:
+        with self._lock:
+            entry = self._entries.get(jti)
+            if entry is None:
+                self.misses += 1
+                return None
+            user, expires_at = entry
+            if expires_at <= time.time():
+                self._discard(jti)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(jti)
+            self.hits += 1
+        return copy.copy(user)
+
+    def set(self, jti: str, user: User, expires_at: float) -> None:
+        expires_at = min(expires_at, time.time() + self.ttl)
+        with self._lock:
+            self._discard(jti)
+            self._entries[jti] = (copy.copy(user), expires_at)
+            self._by_user.setdefault(user.pk, set()).add(jti)
+            while len(self._entries) > self.max_size:
+                self._discard(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            for jti in list(self._by_user.get(user_id, ())):
+                self._discard(jti)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+    def _discard(self, jti: str) -> None:
+        entry = self._entries.pop(jti, None)
+        if entry is None:
+            return
+        user_id = entry[0].pk
+        jtis = self._by_user.get(user_id)
+        if jtis is not None:
+            jtis.discard(jti)
+            if not jtis:
+                del self._by_user[user_id]
+
+
+user_cache = UserCache(settings.AUTH_USER_CACHE_SIZE, settings.AUTH_USER_CACHE_TTL_SECONDS)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that resolves each token's user once per cache lifetime."""
+
+    def get_cached_user(self, validated_token) -> User | None:
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        return user_cache.get(jti) if jti else None
+
+    def get_user(self, validated_token):
+        user = self.get_cached_user(validated_token)
+        if user is not None:
+            return user
+        user = super().get_user(validated_token)
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        expires_at = validated_token.get("exp")
+        if jti and expires_at:
+            user_cache.set(jti, user, expires_at)
+        return user
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate_user(instance.pk)
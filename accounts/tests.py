@@ -1,5 +1,10 @@
+import time
+from unittest import mock
+
 from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
+from .authentication import user_cache
 from .models import User
 
 
@@ -13,3 +18,34 @@ class AuthTests(APITestCase):
         refresh = response.data["refresh"]
         refresh_response = self.client.post("/api/auth/refresh/", {"refresh": refresh}, format="json")
         self.assertEqual(refresh_response.status_code, 200)
+
+
+class CachedAuthenticationTests(APITestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user(username="cached", password="Pass123!", role="STUDENT")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def test_user_lookup_is_cached_per_token(self):
+        self.assertEqual(self.client.get("/api/auth/me/").status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/auth/me/")
+        self.assertEqual(response.data["role"], "STUDENT")
+        self.assertEqual(user_cache.stats()["hits"], 1)
+
+    def test_role_change_and_deactivation_invalidate_cache(self):
+        self.client.get("/api/auth/me/")
+        self.user.role = User.Roles.INSTRUCTOR
+        self.user.save()
+        self.assertEqual(self.client.get("/api/auth/me/").data["role"], "INSTRUCTOR")
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get("/api/auth/me/").status_code, 401)
+
+    def test_entries_expire_for_changes_made_by_other_processes(self):
+        self.client.get("/api/auth/me/")
+        # A change made in another worker process sends no signal here.
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get("/api/auth/me/").status_code, 200)
+        with mock.patch("accounts.authentication.time.time", return_value=time.time() + user_cache.ttl + 1):
+            self.assertEqual(self.client.get("/api/auth/me/").status_code, 401)
@@ -5,11 +5,11 @@ import requests
 from rest_framework import generics, permissions, status
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.tokens import RefreshToken, TokenError
 
 from simulator.ai_providers import build_provider
 
+from .authentication import CachedJWTAuthentication
 from .models import AISettings
 from .serializers import AISettingsSerializer, RegisterSerializer
 from .utils import decrypt_api_key
@@ -22,7 +22,7 @@ class RegisterView(generics.CreateAPIView):
 
 class MeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
 
     def get(self, request):
         user = request.user
@@ -1,6 +1,16 @@
 from django.contrib import admin
 
-from .models import Attempt, Event, Procedure
+from .models import (
+    Attempt,
+    Event,
+    LearningCurve,
+    Procedure,
+    ProcedureDailyStats,
+    ReferenceTrajectory,
+    ShadowScore,
+    SpecialtyDailyStats,
+    TrajectoryChunk,
+)
 
 
 @admin.register(Procedure)
@@ -17,3 +27,37 @@ class AttemptAdmin(admin.ModelAdmin):
 @admin.register(Event)
 class EventAdmin(admin.ModelAdmin):
     list_display = ("attempt", "event_type", "timestamp_ms")
+
+
+@admin.register(TrajectoryChunk)
+class TrajectoryChunkAdmin(admin.ModelAdmin):
+    list_display = ("attempt", "sequence", "start_ms", "end_ms", "sample_count")
+
+
+@admin.register(ShadowScore)
+class ShadowScoreAdmin(admin.ModelAdmin):
+    list_display = ("attempt", "scorer", "algorithm_version", "score_total", "elapsed_ms")
+    list_filter = ("scorer",)
+
+
+@admin.register(ReferenceTrajectory)
+class ReferenceTrajectoryAdmin(admin.ModelAdmin):
+    list_display = ("name", "procedure", "source_attempt", "sample_count", "duration_ms")
+    exclude = ("samples",)
+
+
+@admin.register(LearningCurve)
+class LearningCurveAdmin(admin.ModelAdmin):
+    list_display = ("user", "procedure", "attempts", "mean_score", "best_score", "last_score")
+
+
+@admin.register(ProcedureDailyStats)
+class ProcedureDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ("procedure", "day", "attempts", "score_sum", "score_min", "score_max")
+    list_filter = ("procedure",)
+
+
+@admin.register(SpecialtyDailyStats)
+class SpecialtyDailyStatsAdmin(admin.ModelAdmin):
+    list_display = ("specialty", "day", "attempts", "score_sum", "score_min", "score_max")
+    list_filter = ("specialty",)
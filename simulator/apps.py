@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SimulatorConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "simulator"
+
+    def ready(self):
+        from . import plans, score_cache  # noqa: F401 - registers cache invalidation signals
@@ -0,0 +1,39 @@
+"""Work deferred until the current transaction commits, run in small named thread pools.
+
+Used for work that must not hold up a request (shadow scoring, report
+rendering). Each pool is created on first use; the worker closes its
+database connections after every task.
+"""
+from __future__ import annotations
+
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable
+
+from django.db import close_old_connections, transaction
+
+_pools: dict[str, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name: str, workers: int) -> ThreadPoolExecutor:
+    with _pools_lock:
+        if name not in _pools:
+            _pools[name] = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        return _pools[name]
+
+
+def _run(function: Callable[..., Any], args: tuple) -> Any:
+    try:
+        return function(*args)
+    finally:
+        close_old_connections()
+
+
+def submit(name: str, workers: int, function: Callable[..., Any], *args: Any) -> Future:
+    return get_pool(name, workers).submit(_run, function, args)
+
+
+def run_after_commit(name: str, workers: int, function: Callable[..., Any], *args: Any) -> None:
+    """Run ``function(*args)`` in the ``name`` pool once the current transaction commits."""
+    transaction.on_commit(lambda: submit(name, workers, function, *args))
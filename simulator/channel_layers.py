@@ -0,0 +1,357 @@
+"""Channel layer shared by several ASGI worker processes on one host.
+
+Messages and group memberships live in a SQLite database in WAL mode, so any
+process that opens the same file sees the same channels and groups without an
+external service. Each process runs one poller per event loop for all of its
+waiting receivers: it looks for messages on every waiting channel with a
+single read, backing off exponentially between ``poll_interval`` and
+``max_poll_interval`` seconds while nothing arrives, so idle sockets cost
+no database reads of their own.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import json
+import random
+import sqlite3
+import string
+import threading
+import time
+import weakref
+from collections import deque
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+from django.conf import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channel_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    expires REAL NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS channel_messages_channel ON channel_messages (channel, id);
+CREATE TABLE IF NOT EXISTS channel_groups (
+    group_name TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    joined REAL NOT NULL,
+    PRIMARY KEY (group_name, channel)
+);
+"""
+
+
+def _encode_value(value):
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+
+def _decode_object(value):
+    if len(value) == 1 and "__bytes__" in value:
+        return base64.b64decode(value["__bytes__"])
+    return value
+
+
+class _Receivers:
+    """Receivers of one event loop waiting on the layer, and messages taken for them."""
+
+    def __init__(self) -> None:
+        self.waiters: dict[str, deque[asyncio.Future]] = {}
+        self.ready: dict[str, deque[str]] = {}
+        self.wakeup = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+
+class SQLiteChannelLayer(BaseChannelLayer):
+    extensions = ["groups", "flush"]
+
+    def __init__(
+        self,
+        path=None,
+        expiry=60,
+        group_expiry=86400,
+        capacity=100,
+        channel_capacity=None,
+        poll_interval=0.005,
+        max_poll_interval=0.05,
+        cleanup_interval=5,
+        **kwargs,
+    ):
+        super().__init__(expiry=expiry, capacity=capacity, **kwargs)
+        self.channel_capacity = self.compile_capacities(channel_capacity or {})
+        self.path = str(path or settings.BASE_DIR / "channels.sqlite3")
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.cleanup_interval = cleanup_interval
+        self.client_prefix = "".join(random.choice(string.ascii_letters) for _ in range(8))
+        self._connection = None
+        self._lock = threading.Lock()
+        self._last_cleanup = 0.0
+        self._receivers: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    # Storage helpers
+
+    def _connect(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            self._connection = connection
+        return self._connection
+
+    def _run(self, operation, *args):
+        with self._lock:
+            connection = self._connect()
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = operation(connection, *args)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+            return result
+
+    def _read(self, operation, *args):
+        with self._lock:
+            return operation(self._connect(), *args)
+
+    async def _call(self, operation, *args):
+        return await asyncio.to_thread(self._run, operation, *args)
+
+    @staticmethod
+    def _serialize(message):
+        return json.dumps(message, default=_encode_value)
+
+    @staticmethod
+    def _deserialize(data):
+        return json.loads(data, object_hook=_decode_object)
+
+    def _insert(self, connection, channel, data, now):
+        (queued,) = connection.execute(
+            "SELECT COUNT(*) FROM channel_messages WHERE channel = ? AND expires >= ?", (channel, now)
+        ).fetchone()
+        if queued >= self.get_capacity(channel):
+            return False
+        connection.execute(
+            "INSERT INTO channel_messages (channel, expires, message) VALUES (?, ?, ?)",
+            (channel, now + self.expiry, data),
+        )
+        return True
+
+    def _cleanup(self, connection, now):
+        expired = [
+            row[0]
+            for row in connection.execute(
+                "SELECT DISTINCT channel FROM channel_messages WHERE expires < ?", (now,)
+            ).fetchall()
+        ]
+        if expired:
+            connection.execute("DELETE FROM channel_messages WHERE expires < ?", (now,))
+            connection.executemany("DELETE FROM channel_groups WHERE channel = ?", [(channel,) for channel in expired])
+        connection.execute("DELETE FROM channel_groups WHERE joined < ?", (now - self.group_expiry,))
+
+    def _maybe_cleanup(self, connection, now):
+        if now - self._last_cleanup >= self.cleanup_interval:
+            self._last_cleanup = now
+            self._cleanup(connection, now)
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+        assert "__asgi_channel__" not in message
+        data = self._serialize(message)
+
+        def operation(connection):
+            now = time.time()
+            self._maybe_cleanup(connection, now)
+            return self._insert(connection, channel, data, now)
+
+        if not await self._call(operation):
+            raise ChannelFull(channel)
+
+    # SQLite binds at most 999 parameters in older builds.
+    _CHANNELS_PER_QUERY = 500
+
+    def _pending_channels(self, connection, channels):
+        now = time.time()
+        pending = set()
+        for start in range(0, len(channels), self._CHANNELS_PER_QUERY):
+            batch = channels[start : start + self._CHANNELS_PER_QUERY]
+            pending.update(
+                row[0]
+                for row in connection.execute(
+                    "SELECT DISTINCT channel FROM channel_messages WHERE expires >= ? AND channel IN (%s)"
+                    % ", ".join("?" * len(batch)),
+                    (now, *batch),
+                ).fetchall()
+            )
+        return pending
+
+    def _take(self, connection, wanted):
+        """Pop up to ``wanted[channel]`` of the oldest messages of each channel."""
+        now = time.time()
+        self._maybe_cleanup(connection, now)
+        taken = {}
+        for channel, count in wanted.items():
+            rows = connection.execute(
+                "SELECT id, message FROM channel_messages WHERE channel = ? AND expires >= ? ORDER BY id LIMIT ?",
+                (channel, now, count),
+            ).fetchall()
+            if rows:
+                connection.executemany("DELETE FROM channel_messages WHERE id = ?", [(row[0],) for row in rows])
+                taken[channel] = [row[1] for row in rows]
+        return taken
+
+    async def _poll(self, receivers):
+        delay = self.poll_interval
+        while receivers.waiters:
+            receivers.wakeup.clear()
+            try:
+                # Idle polls only read, so they never take the database write lock.
+                pending = await asyncio.to_thread(self._read, self._pending_channels, list(receivers.waiters))
+                wanted = {channel: len(receivers.waiters[channel]) for channel in pending if channel in receivers.waiters}
+                taken = await self._call(self._take, wanted) if wanted else {}
+            except Exception as exc:
+                for waiters in receivers.waiters.values():
+                    for future in waiters:
+                        if not future.done():
+                            future.set_exception(exc)
+                receivers.waiters.clear()
+                break
+            for channel, messages in taken.items():
+                waiters = receivers.waiters.get(channel, deque())
+                for data in messages:
+                    while waiters and waiters[0].done():
+                        waiters.popleft()
+                    if waiters:
+                        waiters.popleft().set_result(data)
+                    else:
+                        # The receiver was cancelled while the message was taken; keep it for the next one.
+                        receivers.ready.setdefault(channel, deque()).append(data)
+                if not waiters:
+                    receivers.waiters.pop(channel, None)
+            if taken:
+                delay = self.poll_interval
+                continue
+            try:
+                await asyncio.wait_for(receivers.wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                delay = min(delay * 2, self.max_poll_interval)
+            else:
+                delay = self.poll_interval
+        receivers.task = None
+
+    async def receive(self, channel):
+        assert self.valid_channel_name(channel)
+        loop = asyncio.get_running_loop()
+        receivers = self._receivers.get(loop)
+        if receivers is None:
+            receivers = self._receivers[loop] = _Receivers()
+        ready = receivers.ready.get(channel)
+        if ready:
+            data = ready.popleft()
+            if not ready:
+                del receivers.ready[channel]
+            return self._deserialize(data)
+
+        future = loop.create_future()
+        receivers.waiters.setdefault(channel, deque()).append(future)
+        receivers.wakeup.set()
+        if receivers.task is None:
+            receivers.task = loop.create_task(self._poll(receivers))
+        try:
+            data = await future
+        finally:
+            waiters = receivers.waiters.get(channel)
+            if waiters is not None and future in waiters:
+                waiters.remove(future)
+                if not waiters:
+                    del receivers.waiters[channel]
+        return self._deserialize(data)
+
+    async def new_channel(self, prefix="specific."):
+        return "%s.sqlite.%s!%s" % (
+            prefix,
+            self.client_prefix,
+            "".join(random.choice(string.ascii_letters) for _ in range(12)),
+        )
+
+    # Flush extension
+
+    async def flush(self):
+        def operation(connection):
+            connection.execute("DELETE FROM channel_messages")
+            connection.execute("DELETE FROM channel_groups")
+
+        await self._call(operation)
+
+    async def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    # Groups extension
+
+    async def group_add(self, group, channel):
+        assert self.valid_group_name(group), "Group name not valid"
+        assert self.valid_channel_name(channel), "Channel name not valid"
+
+        def operation(connection):
+            connection.execute(
+                "INSERT OR REPLACE INTO channel_groups (group_name, channel, joined) VALUES (?, ?, ?)",
+                (group, channel, time.time()),
+            )
+
+        await self._call(operation)
+
+    async def group_discard(self, group, channel):
+        assert self.valid_channel_name(channel), "Invalid channel name"
+        assert self.valid_group_name(group), "Invalid group name"
+
+        def operation(connection):
+            connection.execute("DELETE FROM channel_groups WHERE group_name = ? AND channel = ?", (group, channel))
+
+        await self._call(operation)
+
+    async def group_channels(self, group):
+        """Channels currently in ``group``, whichever process added them."""
+        assert self.valid_group_name(group), "Invalid group name"
+
+        def operation(connection):
+            return [
+                row[0]
+                for row in connection.execute(
+                    "SELECT channel FROM channel_groups WHERE group_name = ? AND joined >= ?",
+                    (group, time.time() - self.group_expiry),
+                ).fetchall()
+            ]
+
+        return await asyncio.to_thread(self._read, operation)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        assert self.valid_group_name(group), "Invalid group name"
+        data = self._serialize(message)
+
+        def operation(connection):
+            now = time.time()
+            self._maybe_cleanup(connection, now)
+            channels = [
+                row[0]
+                for row in connection.execute(
+                    "SELECT channel FROM channel_groups WHERE group_name = ? AND joined >= ?",
+                    (group, now - self.group_expiry),
+                ).fetchall()
+            ]
+            for channel in channels:
+                # Full channels are skipped, like the other channel layers do.
+                self._insert(connection, channel, data, now)
+
+        await self._call(operation)
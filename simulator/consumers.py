@@ -1,15 +1,36 @@
+import asyncio
 import json
+import logging
+import time
 
 from asgiref.sync import sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
 from django.contrib.auth import get_user_model
 
-from .models import Attempt, Event
+from . import protocol
+from .ingest import EventBuffer, IngestPolicy, record_attempt_counters, register_buffer, unregister_buffer
+from .models import Attempt
+from .scoring import live_score
+from .zones import attempt_zone_tracker, move_samples
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+FORBIDDEN_WARNING = "Estás en una zona prohibida. Ajusta la trayectoria."
+RATE_LIMIT_CLOSE_CODE = 4429
 
 
 class AttemptConsumer(AsyncWebsocketConsumer):
+    buffer = None
+    policy = None
+    zone_tracker = None
+    flush_task = None
+    binary = False
+    throttle_notified = False
+    score_dirty = False
+    score_sent_at = 0.0
+
     async def connect(self):
         self.attempt_id = self.scope["url_route"]["kwargs"]["attempt_id"]
         self.user = self.scope.get("user")
@@ -19,31 +40,161 @@ class AttemptConsumer(AsyncWebsocketConsumer):
         if not await self._can_access_attempt(self.attempt_id, self.user):
             await self.close(code=4403)
             return
-        await self.accept()
+        self.buffer = EventBuffer(self.attempt_id)
+        self.policy = IngestPolicy(self.attempt_id, self.user.id)
+        self.zone_tracker = await sync_to_async(attempt_zone_tracker)(self.attempt_id)
+        register_buffer(self.buffer)
+        self.group_name = f"attempt_{self.attempt_id}"
+        if self.channel_layer is not None:
+            await self.channel_layer.group_add(self.group_name, self.channel_name)
+        if protocol.SUBPROTOCOL in self.scope.get("subprotocols", []):
+            self.binary = True
+            await self.accept(subprotocol=protocol.SUBPROTOCOL)
+        else:
+            await self.accept()
+        self.flush_task = asyncio.create_task(self._flush_periodically())
+
+    async def disconnect(self, code):
+        if self.flush_task:
+            self.flush_task.cancel()
+        if self.buffer:
+            try:
+                await self._buffer_events(self.policy.release())
+                await self._flush()
+            finally:
+                unregister_buffer(self.buffer)
+                if self.channel_layer is not None:
+                    await self.channel_layer.group_discard(self.group_name, self.channel_name)
 
     async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data:
+            await self._receive_frame(bytes_data)
+            return
         if not text_data:
             return
-        payload = json.loads(text_data)
-        event_type = payload.get("event_type")
-        timestamp_ms = payload.get("timestamp_ms", 0)
-        data = payload.get("payload", {})
-        await self._create_event(self.attempt_id, event_type, data, timestamp_ms)
+        try:
+            event_type, data, timestamp_ms = protocol.decode_text_frame(text_data)
+        except protocol.ProtocolError as exc:
+            await self.send(text_data=json.dumps({"status": "error", "detail": str(exc)}))
+            return
+        admitted = await self._admit([(event_type, data, timestamp_ms)])
+        if admitted is None:
+            return
         response = {"status": "ok"}
-        if event_type == "hit" and data.get("zone") == "forbidden":
-            response["warning"] = "Estás en una zona prohibida. Ajusta la trayectoria."
+        if self._enters_forbidden_zone(admitted):
+            response["warning"] = FORBIDDEN_WARNING
         if event_type == "action" and data.get("type"):
             response["hint"] = f"Verifica la técnica para {data.get('type').lower()}."
+        if self.binary and len(response) == 1:
+            return
         await self.send(text_data=json.dumps(response))
 
-    async def _create_event(self, attempt_id, event_type, data, timestamp_ms):
-        await sync_to_async(Event.objects.create)(
-            attempt_id=attempt_id,
-            event_type=event_type,
-            payload=data,
-            timestamp_ms=timestamp_ms,
+    async def _receive_frame(self, data):
+        try:
+            event_type, records = protocol.decode_frame(data)
+            events = []
+            for values in records:
+                payload, timestamp_ms = protocol.record_payload(event_type, values)
+                events.append((event_type, payload, timestamp_ms))
+        except protocol.ProtocolError as exc:
+            # A frame with any invalid record is rejected whole.
+            await self.send(text_data=json.dumps({"status": "error", "detail": str(exc)}))
+            return
+        admitted = await self._admit(events)
+        if admitted is None:
+            return
+        if self._enters_forbidden_zone(admitted):
+            await self.send(text_data=json.dumps({"status": "ok", "warning": FORBIDDEN_WARNING}))
+
+    def _enters_forbidden_zone(self, events):
+        """Whether the events enter a forbidden zone, derived from the samples when the procedure has zones."""
+        if self.zone_tracker is not None:
+            # Client-reported hits are not trusted; they are only stored for audit.
+            events = self.zone_tracker.feed(move_samples(events))
+        return any(
+            event_type == "hit" and isinstance(payload, dict) and payload.get("zone") == "forbidden"
+            for event_type, payload, _ in events
         )
 
+    async def _admit(self, events):
+        """Buffer the events the ingest policy lets through; None when the message should get no reply."""
+        admitted = self.policy.admit(events)
+        self.score_dirty = self.score_dirty or bool(admitted)
+        if await self._buffer_events(admitted):
+            await self._flush()
+        if not self.policy.throttled:
+            self.throttle_notified = False
+            return admitted
+        if self.policy.over_limit:
+            await self._flush()
+            await self.close(code=RATE_LIMIT_CLOSE_CODE)
+            return None
+        if not self.throttle_notified:
+            # Only the first message of a streak of dropped events is answered.
+            self.throttle_notified = True
+            await self.send(
+                text_data=json.dumps({"status": "throttled", "retry_after_ms": self.policy.retry_after_ms()})
+            )
+            return None
+        # Admitted discrete events are still acknowledged while the connection is throttled.
+        return admitted if any(event[0] != "move" for event in admitted) else None
+
+    async def _buffer_events(self, events):
+        """Add events to the buffer; returns True when it should be flushed."""
+        if self.buffer.spool is None:
+            return self.buffer.extend(events)
+        # Spool appends write and fsync the segment file, which must not block the event loop.
+        return await sync_to_async(self.buffer.extend, thread_sensitive=False)(events)
+
+    async def _flush(self):
+        counters = self.policy.take_counters()
+        if len(self.buffer) or any(counters):
+            await sync_to_async(self._persist)(counters)
+
+    def _persist(self, counters):
+        self.buffer.flush()
+        record_attempt_counters(self.attempt_id, *counters)
+
+    async def _flush_periodically(self):
+        interval = self.buffer.flush_interval_ms / 1000
+        score_interval = settings.LIVE_SCORE_INTERVAL_MS / 1000
+        while True:
+            await asyncio.sleep(min(interval, score_interval) / 2)
+            try:
+                if self.score_dirty and time.monotonic() - self.score_sent_at >= score_interval:
+                    await self._flush()
+                    await self._publish_score()
+                elif self.buffer.is_due() or self.policy.has_unsaved_counters:
+                    await self._flush()
+            except Exception:
+                # The buffer keeps its events; the next pass retries them.
+                logger.exception("Periodic flush failed for attempt %s", self.attempt_id)
+
+    async def _publish_score(self):
+        """Send the running score to every socket of the attempt (student and observing instructors)."""
+        self.score_dirty = False
+        self.score_sent_at = time.monotonic()
+        snapshot = await sync_to_async(live_score)(self.attempt_id)
+        if self.channel_layer is not None:
+            await self.channel_layer.group_send(self.group_name, {"type": "score.update", "score": snapshot})
+        else:
+            await self.send(text_data=json.dumps({"status": "score", **snapshot}))
+
+    async def attempt_flush(self, event):
+        """Store this socket's events for a worker completing the attempt, then acknowledge."""
+        try:
+            await self._flush()
+            if self.buffer.spool is not None:
+                await sync_to_async(self.buffer.spool.drain)(int(self.attempt_id))
+        except Exception:
+            # Without the acknowledgement the completing worker times out and logs it.
+            logger.exception("Requested flush failed for attempt %s", self.attempt_id)
+            return
+        await self.channel_layer.send(event["reply_channel"], {"type": "attempt.flushed"})
+
+    async def score_update(self, event):
+        await self.send(text_data=json.dumps({"status": "score", **event["score"]}))
+
     async def _can_access_attempt(self, attempt_id, user):
         try:
             attempt = await sync_to_async(Attempt.objects.select_related("user").get)(id=attempt_id)
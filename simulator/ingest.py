@@ -0,0 +1,540 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from itertools import islice
+from typing import Any, Iterable
+from weakref import WeakSet, WeakValueDictionary
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import OperationalError, transaction
+from django.db.models import F
+from rest_framework import serializers
+
+from .models import Attempt, Event
+from .scoring import update_live_state
+from .serializers import EventIngestSerializer
+from .spool import get_spool
+from .trajectory import append_moves, split_moves
+from .zones import apply_zone_engine
+
+logger = logging.getLogger(__name__)
+
+
+class IngestStats:
+    """Process-wide counters for event flushes, exposed through the metrics API."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.flushes = 0
+            self.events = 0
+            self.last_batch_size = 0
+            self.max_batch_size = 0
+            self.last_latency_ms = 0.0
+            self.max_latency_ms = 0.0
+            self.total_latency_ms = 0.0
+            self.rejected = 0
+
+    def record_flush(self, batch_size: int, latency_ms: float) -> None:
+        with self._lock:
+            self.flushes += 1
+            self.events += batch_size
+            self.last_batch_size = batch_size
+            self.max_batch_size = max(self.max_batch_size, batch_size)
+            self.last_latency_ms = latency_ms
+            self.max_latency_ms = max(self.max_latency_ms, latency_ms)
+            self.total_latency_ms += latency_ms
+
+    def record_rejected(self, count: int) -> None:
+        with self._lock:
+            self.rejected += count
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            flushes = self.flushes
+            return {
+                "flushes": flushes,
+                "events": self.events,
+                "last_batch_size": self.last_batch_size,
+                "max_batch_size": self.max_batch_size,
+                "avg_batch_size": round(self.events / flushes, 2) if flushes else 0,
+                "last_flush_latency_ms": round(self.last_latency_ms, 3),
+                "max_flush_latency_ms": round(self.max_latency_ms, 3),
+                "avg_flush_latency_ms": round(self.total_latency_ms / flushes, 3) if flushes else 0,
+                "rejected_events": self.rejected,
+            }
+
+
+ingest_stats = IngestStats()
+
+
+def persist_events(attempt_id: int, events: list[tuple[str, dict, int]], close_zones: bool = False) -> int:
+    """Store ``(event_type, payload, timestamp_ms)`` tuples for one attempt in bulk.
+
+    Move samples are appended to the packed trajectory store; every other
+    event becomes an ``Event`` row. Zone events are derived from the move
+    samples when the procedure has zones (``close_zones`` ends every open
+    contact), and the attempt's live scoring state is updated in the same
+    transaction.
+    """
+    if not events and not close_zones:
+        return 0
+    started = time.perf_counter()
+    with transaction.atomic():
+        events = apply_zone_engine(attempt_id, events, close=close_zones)
+        if not events:
+            return 0
+        moves, others = split_moves(events)
+        Event.objects.bulk_create(
+            [
+                Event(attempt_id=attempt_id, event_type=event_type, payload=payload, timestamp_ms=timestamp_ms)
+                for event_type, payload, timestamp_ms in others
+            ],
+            batch_size=settings.EVENT_BULK_BATCH_SIZE,
+        )
+        append_moves(attempt_id, moves)
+        update_live_state(attempt_id, events)
+    ingest_stats.record_flush(len(events), (time.perf_counter() - started) * 1000)
+    return len(events)
+
+
+def persist_events_isolating(attempt_id: int, events: list[tuple[str, dict, int]]) -> tuple[int, list]:
+    """``persist_events`` that sets aside the events which cannot be stored.
+
+    A failing batch is split in halves and each half retried, so one bad event
+    costs a few extra transactions and the rest are still stored. Returns the
+    number stored and the rejected events, which are logged and counted in
+    ``ingest_stats``. ``OperationalError`` (the database itself is unavailable)
+    is raised for the caller to retry.
+    """
+    try:
+        return persist_events(attempt_id, events), []
+    except OperationalError:
+        raise
+    except Exception as exc:
+        if len(events) > 1:
+            middle = len(events) // 2
+            stored_first, rejected_first = persist_events_isolating(attempt_id, events[:middle])
+            stored_second, rejected_second = persist_events_isolating(attempt_id, events[middle:])
+            return stored_first + stored_second, rejected_first + rejected_second
+        logger.warning("Rejected event of attempt %s: %r (%s: %s)", attempt_id, events[0][:3], type(exc).__name__, exc)
+        ingest_stats.record_rejected(1)
+        return 0, list(events)
+
+
+def store_events(attempt_id: int, events: list[tuple[str, dict, int]]) -> int:
+    """Entry point for ingested events: the write-ahead spool when enabled, else the database."""
+    spool = get_spool()
+    if spool is not None:
+        return spool.append(attempt_id, events)
+    return persist_events(attempt_id, events)
+
+
+def ingest_event_stream(attempt_id: int, items: Iterable[Any], chunk_size: int | None = None) -> list[dict[str, Any]]:
+    """Validate and insert raw event dicts chunk by chunk, returning per-chunk counts.
+
+    Invalid events are skipped and reported with their position in the
+    stream; valid events of the same chunk are still stored.
+    """
+    chunk_size = chunk_size or settings.EVENT_INGEST_CHUNK_SIZE
+    validator = EventIngestSerializer()
+    iterator = iter(items)
+    chunks = []
+    offset = 0
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            break
+        valid = []
+        errors = []
+        for position, item in enumerate(chunk, start=offset):
+            try:
+                data = validator.run_validation(item)
+            except serializers.ValidationError as exc:
+                errors.append({"index": position, "errors": exc.detail})
+                continue
+            valid.append((data["event_type"], data["payload"], data["timestamp_ms"]))
+        created = store_events(attempt_id, valid)
+        chunks.append(
+            {
+                "index": len(chunks),
+                "received": len(chunk),
+                "created": created,
+                "rejected": len(errors),
+                "errors": errors[:20],
+            }
+        )
+        offset += len(chunk)
+    return chunks
+
+
+class EventBuffer:
+    """Per-connection event buffer flushed on a size or age threshold.
+
+    ``add`` is called from the consumer's event loop while ``flush`` runs in a
+    worker thread (or in the request thread that completes the attempt), so the
+    pending list is swapped under a lock and concurrent flushes are serialized.
+    Events that cannot be stored are set aside (``persist_events_isolating``);
+    when the database itself fails the batch is put back for the next flush.
+    When the event spool is enabled the buffer writes through to it instead.
+    """
+
+    def __init__(
+        self,
+        attempt_id: int,
+        max_events: int | None = None,
+        flush_interval_ms: int | None = None,
+    ) -> None:
+        self.attempt_id = int(attempt_id)
+        self.max_events = max_events or settings.EVENT_BUFFER_MAX_EVENTS
+        self.flush_interval_ms = flush_interval_ms or settings.EVENT_BUFFER_FLUSH_INTERVAL_MS
+        self._pending: list[tuple[str, dict, int]] = []
+        self._oldest_at: float | None = None
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self.spool = get_spool()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, event_type: str, payload: dict, timestamp_ms: int) -> bool:
+        """Queue one event and return True when the buffer should be flushed."""
+        return self.extend([(event_type, payload, timestamp_ms)])
+
+    def extend(self, events: list[tuple[str, dict, int]]) -> bool:
+        """Queue several events and return True when the buffer should be flushed.
+
+        With the spool enabled this writes (and may fsync) a segment, so async
+        callers run it in a thread.
+        """
+        if self.spool is not None:
+            self.spool.append(self.attempt_id, events)
+            return False
+        if not events:
+            return False
+        with self._pending_lock:
+            if not self._pending:
+                self._oldest_at = time.monotonic()
+            self._pending.extend(events)
+            return len(self._pending) >= self.max_events
+
+    def is_due(self) -> bool:
+        oldest_at = self._oldest_at
+        if oldest_at is None or not self._pending:
+            return False
+        return (time.monotonic() - oldest_at) * 1000 >= self.flush_interval_ms
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, []
+                oldest_at, self._oldest_at = self._oldest_at, None
+            try:
+                return persist_events_isolating(self.attempt_id, pending)[0]
+            except Exception:
+                # The database is unavailable: put the batch back ahead of what arrived meanwhile.
+                with self._pending_lock:
+                    self._pending = pending + self._pending
+                    if pending:
+                        self._oldest_at = oldest_at
+                raise
+
+
+_buffers: dict[int, WeakSet] = {}
+_buffers_lock = threading.Lock()
+
+
+def register_buffer(buffer: EventBuffer) -> None:
+    with _buffers_lock:
+        _buffers.setdefault(buffer.attempt_id, WeakSet()).add(buffer)
+
+
+def unregister_buffer(buffer: EventBuffer) -> None:
+    with _buffers_lock:
+        buffers = _buffers.get(buffer.attempt_id)
+        if buffers is not None:
+            buffers.discard(buffer)
+            if not buffers:
+                del _buffers[buffer.attempt_id]
+
+
+def flush_attempt_buffers(attempt_id: int) -> int:
+    """Flush every live connection buffer of an attempt, e.g. before scoring it."""
+    with _buffers_lock:
+        buffers = list(_buffers.get(int(attempt_id), ()))
+    return sum(buffer.flush() for buffer in buffers)
+
+
+def flush_local_events(attempt_id: int) -> int:
+    """Store the events of an attempt held by this process, in connection buffers or the spool."""
+    flushed = flush_attempt_buffers(attempt_id)
+    spool = get_spool()
+    if spool is not None:
+        flushed += spool.drain(int(attempt_id))
+    return flushed
+
+
+def request_remote_flush(attempt_id: int, timeout_ms: int | None = None) -> int:
+    """Ask every socket of an attempt, in any worker, to store its events; returns the acknowledgements.
+
+    Only channel layers shared between processes (those with ``group_channels``)
+    need this: with the others every socket lives in this process and
+    ``flush_local_events`` reaches its buffer. Sockets that do not answer within
+    ``timeout_ms`` are logged and skipped.
+    """
+    layer = get_channel_layer()
+    if layer is None or not hasattr(layer, "group_channels"):
+        return 0
+    timeout_ms = settings.EVENT_FLUSH_ACK_TIMEOUT_MS if timeout_ms is None else timeout_ms
+    group = f"attempt_{int(attempt_id)}"
+
+    async def flush():
+        expected = len(await layer.group_channels(group))
+        if not expected:
+            return 0
+        reply_channel = await layer.new_channel("attempt.flushed.")
+        await layer.group_send(group, {"type": "attempt.flush", "reply_channel": reply_channel})
+        acknowledged = 0
+
+        async def collect():
+            nonlocal acknowledged
+            while acknowledged < expected:
+                await layer.receive(reply_channel)
+                acknowledged += 1
+
+        try:
+            await asyncio.wait_for(collect(), timeout_ms / 1000)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Only %s of %s sockets of attempt %s acknowledged the flush", acknowledged, expected, attempt_id
+            )
+        return acknowledged
+
+    return async_to_sync(flush)()
+
+
+def flush_pending_events(attempt_id: int) -> int:
+    """Make every event received for an attempt, by any worker, visible in the database."""
+    request_remote_flush(attempt_id)
+    flushed = flush_local_events(attempt_id)
+    return flushed + persist_events(attempt_id, [], close_zones=True)
+
+
+class TokenBucket:
+    """Refills ``rate`` tokens per second up to ``burst``; one token admits one event."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def take(self, count: int = 1) -> bool:
+        with self._lock:
+            self._refill(time.monotonic())
+            if self.tokens < count:
+                return False
+            self.tokens -= count
+            return True
+
+    def take_up_to(self, count: int) -> int:
+        """Take as many of ``count`` tokens as are available and return how many."""
+        with self._lock:
+            self._refill(time.monotonic())
+            granted = max(min(count, int(self.tokens)), 0)
+            self.tokens -= granted
+            return granted
+
+    def give_back(self, count: int) -> None:
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + count)
+
+    def retry_after_ms(self, count: int = 1) -> int:
+        with self._lock:
+            self._refill(time.monotonic())
+            missing = max(min(count, self.burst) - self.tokens, 0)
+            return int(missing / self.rate * 1000) + 1 if self.rate else 0
+
+
+# Buckets are shared by every connection of the same attempt or user in this
+# process and disappear once no connection holds them.
+_buckets: WeakValueDictionary = WeakValueDictionary()
+_buckets_lock = threading.Lock()
+
+
+def get_bucket(key: tuple[str, int], rate: float, burst: float) -> TokenBucket:
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+
+class IngestPolicy:
+    """Per-connection admission of incoming events.
+
+    Consecutive ``move`` samples closer than ``move_interval_ms`` (by client
+    timestamp) are coalesced: only the latest one is kept, and it is released
+    before the next discrete event so positions at actions are preserved.
+    Each remaining move then takes one token from the attempt and user
+    buckets; moves beyond the tokens available are dropped. Discrete events
+    (steps, actions, hits, errors, tool changes) take tokens from separate,
+    stricter attempt and user buckets, so a burst of moves never costs a step
+    and a flood of discrete events is still bounded. ``over_limit`` turns true
+    once a connection keeps sending through ``close_after`` dropped moves or
+    ``discrete_close_after`` dropped discrete events in a row.
+    """
+
+    def __init__(
+        self,
+        attempt_id: int,
+        user_id: int,
+        move_interval_ms: int | None = None,
+        close_after: int | None = None,
+        discrete_close_after: int | None = None,
+    ) -> None:
+        self.attempt_id = int(attempt_id)
+        self.move_interval_ms = (
+            settings.EVENT_MOVE_MIN_INTERVAL_MS if move_interval_ms is None else move_interval_ms
+        )
+        self.close_after = close_after or settings.EVENT_RATE_CLOSE_AFTER
+        self.discrete_close_after = discrete_close_after or settings.EVENT_DISCRETE_CLOSE_AFTER
+        self.buckets = [
+            get_bucket(("attempt", self.attempt_id), settings.EVENT_RATE_PER_ATTEMPT, settings.EVENT_BURST_PER_ATTEMPT),
+            get_bucket(("user", int(user_id)), settings.EVENT_RATE_PER_USER, settings.EVENT_BURST_PER_USER),
+        ]
+        self.discrete_buckets = [
+            get_bucket(
+                ("attempt-discrete", self.attempt_id),
+                settings.EVENT_DISCRETE_RATE_PER_ATTEMPT,
+                settings.EVENT_DISCRETE_BURST_PER_ATTEMPT,
+            ),
+            get_bucket(
+                ("user-discrete", int(user_id)),
+                settings.EVENT_DISCRETE_RATE_PER_USER,
+                settings.EVENT_DISCRETE_BURST_PER_USER,
+            ),
+        ]
+        self._pending_move: tuple[str, dict, int] | None = None
+        self._last_move_ms: int | None = None
+        self.dropped = 0
+        self.coalesced = 0
+        self.drop_streak = 0
+        self.discrete_drop_streak = 0
+        self._unsaved_dropped = 0
+        self._unsaved_coalesced = 0
+
+    @property
+    def throttled(self) -> bool:
+        return self.drop_streak > 0 or self.discrete_drop_streak > 0
+
+    @property
+    def over_limit(self) -> bool:
+        return self.drop_streak >= self.close_after or self.discrete_drop_streak >= self.discrete_close_after
+
+    def _coalesce(self, events: Iterable[tuple[str, dict, int]]) -> list[tuple[str, dict, int]]:
+        admitted = []
+        for event in events:
+            event_type, _, timestamp_ms = event
+            if event_type != "move" or not self.move_interval_ms or not isinstance(timestamp_ms, int):
+                if self._pending_move is not None:
+                    admitted.append(self._pending_move)
+                    self._last_move_ms = self._pending_move[2]
+                    self._pending_move = None
+                admitted.append(event)
+                continue
+            if self._pending_move is not None:
+                self._pending_move = None
+                self.coalesced += 1
+                self._unsaved_coalesced += 1
+            if self._last_move_ms is not None and 0 <= timestamp_ms - self._last_move_ms < self.move_interval_ms:
+                self._pending_move = event
+            else:
+                self._last_move_ms = timestamp_ms
+                admitted.append(event)
+        return admitted
+
+    @staticmethod
+    def _grant(buckets: list[TokenBucket], count: int) -> int:
+        """Take up to ``count`` tokens from every bucket; returns how many all of them granted."""
+        granted = count
+        grants = []
+        for bucket in buckets:
+            granted = bucket.take_up_to(granted)
+            grants.append((bucket, granted))
+        # Earlier buckets may have granted more than a later one had.
+        for bucket, taken in grants:
+            if taken > granted:
+                bucket.give_back(taken - granted)
+        return granted
+
+    def admit(self, events: Iterable[tuple[str, dict, int]]) -> list[tuple[str, dict, int]]:
+        """The events to buffer; the rest are counted as coalesced or dropped."""
+        admitted = self._coalesce(events)
+        moves = sum(1 for event in admitted if event[0] == "move")
+        discrete = len(admitted) - moves
+        granted_moves = self._grant(self.buckets, moves) if moves else 0
+        granted_discrete = self._grant(self.discrete_buckets, discrete) if discrete else 0
+        # A streak only ends when events of the same kind are admitted again.
+        if moves:
+            self.drop_streak = self.drop_streak + moves - granted_moves if granted_moves < moves else 0
+        if discrete:
+            self.discrete_drop_streak = (
+                self.discrete_drop_streak + discrete - granted_discrete if granted_discrete < discrete else 0
+            )
+        dropped = moves - granted_moves + discrete - granted_discrete
+        if not dropped:
+            return admitted
+        self.dropped += dropped
+        self._unsaved_dropped += dropped
+        kept = []
+        for event in admitted:
+            if event[0] == "move":
+                if not granted_moves:
+                    continue
+                granted_moves -= 1
+            else:
+                if not granted_discrete:
+                    continue
+                granted_discrete -= 1
+            kept.append(event)
+        return kept
+
+    def release(self) -> list[tuple[str, dict, int]]:
+        """The held-back move, if any, once the connection is closing."""
+        pending, self._pending_move = self._pending_move, None
+        return [pending] if pending is not None else []
+
+    def retry_after_ms(self) -> int:
+        return max(bucket.retry_after_ms() for bucket in self.buckets + self.discrete_buckets)
+
+    @property
+    def has_unsaved_counters(self) -> bool:
+        return bool(self._unsaved_dropped or self._unsaved_coalesced)
+
+    def take_counters(self) -> tuple[int, int]:
+        """Dropped and coalesced events counted since the last call."""
+        counters = (self._unsaved_dropped, self._unsaved_coalesced)
+        self._unsaved_dropped = self._unsaved_coalesced = 0
+        return counters
+
+
+def record_attempt_counters(attempt_id: int, dropped: int, coalesced: int) -> None:
+    if dropped or coalesced:
+        Attempt.objects.filter(id=attempt_id).update(
+            events_dropped=F("events_dropped") + dropped,
+            moves_coalesced=F("moves_coalesced") + coalesced,
+        )
@@ -0,0 +1,182 @@
+"""Kinematic metrics of an attempt's instrument trajectory.
+
+Packed ``TrajectoryChunk`` samples are viewed in place with ``np.frombuffer``
+and concatenated with any unpacked ``move`` rows into contiguous ``t`` (s)
+and ``xyz`` arrays; every metric is then computed in vectorized form:
+
+- ``path_length``: total distance travelled.
+- ``mean_speed``/``max_speed``, ``mean_acceleration``, ``rms_jerk``: finite
+  differences over the (possibly irregular) sample times.
+- ``tremor_energy``/``tremor_ratio``: velocity power inside
+  ``tremor_band_hz`` after resampling on a uniform grid, absolute and as a
+  share of all velocity power.
+- ``idle_seconds``: time spent below ``idle_speed`` or in gaps longer than
+  ``idle_gap_ms`` without samples.
+- ``economy_of_motion``: straight-line distance from the first to the last
+  sample over ``path_length`` (1 is a perfectly direct path).
+"""
+from __future__ import annotations
+
+from typing import Any
+
+import numpy as np
+
+from .models import Event, TrajectoryChunk
+from .protocol import MOVE_RECORD
+
+MOVE_DTYPE = np.dtype(
+    [("t_ms", "<u4"), ("x", "<f4"), ("y", "<f4"), ("z", "<f4"), ("tool", "u1"), ("screen_x", "<f4"), ("screen_y", "<f4")]
+)
+assert MOVE_DTYPE.itemsize == MOVE_RECORD.size
+
+DEFAULT_SETTINGS = {"tremor_band_hz": [4, 12], "idle_speed": 0.02, "idle_gap_ms": 500}
+METRICS = (
+    "samples",
+    "path_length",
+    "mean_speed",
+    "max_speed",
+    "mean_acceleration",
+    "rms_jerk",
+    "tremor_energy",
+    "tremor_ratio",
+    "idle_seconds",
+    "economy_of_motion",
+)
+
+
+def _is_coordinate(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _screen_position(payload: dict) -> tuple[float, float]:
+    screen = payload.get("screen")
+    if isinstance(screen, dict) and _is_coordinate(screen.get("x")) and _is_coordinate(screen.get("y")):
+        return screen["x"], screen["y"]
+    return np.nan, np.nan
+
+
+def load_samples(attempt_id: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Timestamps (ms), ``(n, 3)`` positions and ``(n, 2)`` screen positions (NaN when unknown), ordered by time."""
+    records = [
+        np.frombuffer(samples, dtype=MOVE_DTYPE)
+        for samples in TrajectoryChunk.objects.filter(attempt_id=attempt_id)
+        .order_by("start_ms", "sequence")
+        .values_list("samples", flat=True)
+    ]
+    packed = np.concatenate(records) if records else np.empty(0, dtype=MOVE_DTYPE)
+    t_ms = packed["t_ms"].astype(np.float64)
+    xyz = np.column_stack([packed["x"], packed["y"], packed["z"]]).astype(np.float64)
+    screen = np.column_stack([packed["screen_x"], packed["screen_y"]]).astype(np.float64)
+
+    rows = [
+        (timestamp_ms, payload["x"], payload["y"], payload["z"], *_screen_position(payload))
+        for timestamp_ms, payload in Event.objects.filter(attempt_id=attempt_id, event_type="move").values_list(
+            "timestamp_ms", "payload"
+        )
+        if isinstance(payload, dict)
+        and _is_coordinate(timestamp_ms)
+        and all(_is_coordinate(payload.get(axis)) for axis in ("x", "y", "z"))
+    ]
+    if rows:
+        extra = np.array(rows, dtype=np.float64)
+        t_ms = np.concatenate([t_ms, extra[:, 0]])
+        xyz = np.concatenate([xyz, extra[:, 1:4]])
+        screen = np.concatenate([screen, extra[:, 4:]])
+        order = np.argsort(t_ms, kind="stable")
+        t_ms, xyz, screen = t_ms[order], xyz[order], screen[order]
+    return t_ms, xyz, screen
+
+
+def load_trajectory(attempt_id: int) -> tuple[np.ndarray, np.ndarray]:
+    """Timestamps (seconds) and an ``(n, 3)`` array of positions, ordered by time."""
+    t_ms, xyz, _ = load_samples(attempt_id)
+    finite = np.isfinite(xyz).all(axis=1)
+    return np.ascontiguousarray(t_ms[finite] / 1000), np.ascontiguousarray(xyz[finite])
+
+
+def _tremor(t: np.ndarray, xyz: np.ndarray, band: tuple[float, float]) -> tuple[float, float]:
+    """Velocity power inside the band and its share of all velocity power.
+
+    Velocity rather than position keeps slow, large voluntary movements from
+    drowning out small fast oscillations.
+    """
+    span = t[-1] - t[0]
+    steps = np.diff(t)
+    steps = steps[steps > 0]
+    if span <= 0 or not len(steps):
+        return 0.0, 0.0
+    # The grid follows the typical sample rate, capped so long pauses do not blow it up.
+    step = max(float(np.median(steps)), span / (4 * len(t)))
+    grid = np.arange(t[0], t[-1], step)
+    if len(grid) < 4 or 1 / (2 * step) < band[0]:
+        return 0.0, 0.0
+    velocity = np.empty((3, len(grid) - 1))
+    for axis in range(3):
+        velocity[axis] = np.diff(np.interp(grid, t, xyz[:, axis])) / step
+    # The mean velocity stays in: steady motion dominates the total and tremor
+    # is measured against it, not against float32 rounding noise.
+    # A Hann window keeps the edges of a non-periodic trajectory from leaking into every band.
+    # Zero-padded to a power of two: odd lengths with large prime factors are slow to transform.
+    size = 1 << (velocity.shape[1] - 1).bit_length()
+    spectrum = np.fft.rfft(velocity * np.hanning(velocity.shape[1]), n=size, axis=1)
+    power = (spectrum.real**2 + spectrum.imag**2).sum(axis=0)
+    frequencies = np.fft.rfftfreq(size, step)
+    in_band = power[(frequencies >= band[0]) & (frequencies <= band[1])].sum()
+    total = power.sum()
+    energy = float(2 * in_band / velocity.shape[1] ** 2)
+    return energy, float(in_band / total) if total > 0 else 0.0
+
+
+def compute_kinematics(t: np.ndarray, xyz: np.ndarray, options: dict[str, Any] | None = None) -> dict[str, Any]:
+    """Metrics of a trajectory given sample times in seconds and ``(n, 3)`` positions."""
+    options = {**DEFAULT_SETTINGS, **(options or {})}
+    metrics = dict.fromkeys(METRICS, 0.0)
+    metrics["samples"] = len(t)
+    metrics["economy_of_motion"] = 1.0
+    if len(t) < 2:
+        return metrics
+
+    segments = np.diff(xyz, axis=0)
+    distances = np.sqrt(np.einsum("ij,ij->i", segments, segments))
+    dt = np.diff(t)
+    path_length = float(distances.sum())
+    metrics["path_length"] = path_length
+    if path_length > 0:
+        metrics["economy_of_motion"] = float(np.linalg.norm(xyz[-1] - xyz[0]) / path_length)
+
+    moving = dt > 0
+    if not moving.all():
+        # Samples sharing a timestamp add distance but no time.
+        segments, distances, dt = segments[moving], distances[moving], dt[moving]
+        midpoints = ((t[1:] + t[:-1]) / 2)[moving]
+    else:
+        midpoints = (t[1:] + t[:-1]) / 2
+    idle = dt > options["idle_gap_ms"] / 1000
+    if len(dt):
+        speed = distances / dt
+        metrics["mean_speed"] = float(path_length / dt.sum())
+        metrics["max_speed"] = float(speed.max())
+        idle |= speed < options["idle_speed"]
+        metrics["idle_seconds"] = float(dt[idle].sum())
+    if len(dt) > 1:
+        velocity = segments / dt[:, None]
+        acceleration = np.diff(velocity, axis=0) / np.maximum(np.diff(midpoints), 1e-6)[:, None]
+        metrics["mean_acceleration"] = float(np.sqrt(np.einsum("ij,ij->i", acceleration, acceleration)).mean())
+        if len(acceleration) > 1:
+            jerk = np.diff(acceleration, axis=0) / np.maximum(np.diff(midpoints[1:]), 1e-6)[:, None]
+            metrics["rms_jerk"] = float(np.sqrt(np.einsum("ij,ij->i", jerk, jerk).mean()))
+
+    band = options["tremor_band_hz"]
+    metrics["tremor_energy"], metrics["tremor_ratio"] = _tremor(t, xyz, (float(band[0]), float(band[1])))
+    return {name: round(value, 6) if isinstance(value, float) else value for name, value in metrics.items()}
+
+
+def motion_quality(metrics: dict[str, Any], duration_seconds: float) -> float:
+    """0–100 subscore: tremor share and idle share of the attempt lower it."""
+    idle_share = metrics["idle_seconds"] / duration_seconds if duration_seconds > 0 else 0
+    return max(0.0, min(100.0, 100 - metrics["tremor_ratio"] * 100 - min(idle_share, 1) * 50))
+
+
+def attempt_kinematics(attempt_id: int, options: dict[str, Any] | None = None) -> dict[str, Any]:
+    t, xyz = load_trajectory(attempt_id)
+    return compute_kinematics(t, xyz, options)
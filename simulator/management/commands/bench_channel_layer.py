@@ -0,0 +1,103 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from simulator.channel_layers import SQLiteChannelLayer
+
+
+def _receive_in_process(path, channel, count, ready):
+    async def run():
+        layer = SQLiteChannelLayer(path=path, capacity=count)
+        ready.set()
+        for _ in range(count):
+            await layer.receive(channel)
+        await layer.close()
+
+    asyncio.run(run())
+
+
+class Command(BaseCommand):
+    help = "Compare the throughput of the SQLite channel layer with the in-memory layer"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--messages", type=int, default=2000)
+        parser.add_argument("--group-size", type=int, default=10)
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+
+    def handle(self, *args, **options):
+        messages = options["messages"]
+        group_size = options["group_size"]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "channels.sqlite3")
+            layers = {
+                "memory": lambda: InMemoryChannelLayer(capacity=messages),
+                "sqlite": lambda: SQLiteChannelLayer(path=path, capacity=messages),
+            }
+            results = {}
+            for name, factory in layers.items():
+                results[name] = {
+                    "send_receive_msgs_per_s": asyncio.run(self._send_receive(factory(), messages)),
+                    "group_send_deliveries_per_s": asyncio.run(self._group_send(factory(), messages, group_size)),
+                }
+            results["sqlite"]["cross_process_msgs_per_s"] = self._cross_process(path, messages)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for name, metrics in results.items():
+            for metric, value in metrics.items():
+                self.stdout.write(f"{name:<8} {metric:<30} {value:>12,.0f}")
+
+    @staticmethod
+    async def _send_receive(layer, messages):
+        channel = await layer.new_channel()
+        started = time.perf_counter()
+        for index in range(messages):
+            await layer.send(channel, {"type": "bench.message", "index": index})
+        for _ in range(messages):
+            await layer.receive(channel)
+        elapsed = time.perf_counter() - started
+        await layer.flush()
+        return messages / elapsed
+
+    @staticmethod
+    async def _group_send(layer, messages, group_size):
+        channels = [await layer.new_channel() for _ in range(group_size)]
+        for channel in channels:
+            await layer.group_add("bench", channel)
+        rounds = max(messages // group_size, 1)
+        started = time.perf_counter()
+        for index in range(rounds):
+            await layer.group_send("bench", {"type": "bench.message", "index": index})
+        for channel in channels:
+            for _ in range(rounds):
+                await layer.receive(channel)
+        elapsed = time.perf_counter() - started
+        await layer.flush()
+        return rounds * group_size / elapsed
+
+    @staticmethod
+    def _cross_process(path, messages):
+        context = multiprocessing.get_context("spawn")
+        channel = "bench.cross.process"
+        ready = context.Event()
+        receiver = context.Process(target=_receive_in_process, args=(path, channel, messages, ready))
+        receiver.start()
+        ready.wait()
+
+        async def send_all():
+            layer = SQLiteChannelLayer(path=path, capacity=messages)
+            for index in range(messages):
+                await layer.send(channel, {"type": "bench.message", "index": index})
+            await layer.close()
+
+        started = time.perf_counter()
+        asyncio.run(send_all())
+        receiver.join()
+        return messages / (time.perf_counter() - started)
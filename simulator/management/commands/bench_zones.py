@@ -0,0 +1,80 @@
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from simulator.zones import ZoneIndex, ZoneTracker
+
+
+def random_regions(generator, count):
+    regions = []
+    for index in range(count):
+        center = generator.uniform(-1, 1, 3)
+        shape = ("sphere", "capsule", "box")[index % 3]
+        region = {"id": f"zone-{index}", "kind": ("target", "forbidden")[index % 2], "shape": shape}
+        if shape == "sphere":
+            region.update(center=center.tolist(), radius=float(generator.uniform(0.01, 0.08)))
+        elif shape == "capsule":
+            region.update(
+                a=center.tolist(),
+                b=(center + generator.uniform(-0.1, 0.1, 3)).tolist(),
+                radius=float(generator.uniform(0.01, 0.04)),
+            )
+        else:
+            region.update(center=center.tolist(), size=generator.uniform(0.02, 0.12, 3).tolist())
+        regions.append(region)
+    return regions
+
+
+class Command(BaseCommand):
+    help = "Measure the cost of zone queries per batch of move samples"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--zones", type=int, default=500)
+        parser.add_argument("--batch", type=int, default=64, help="Samples per batch")
+        parser.add_argument("--batches", type=int, default=2000)
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+
+    def handle(self, *args, **options):
+        generator = np.random.default_rng(0)
+        started = time.perf_counter()
+        index = ZoneIndex({"regions": random_regions(generator, options["zones"])})
+        compile_ms = (time.perf_counter() - started) * 1000
+
+        # A random walk through the zone volume, like a tool trajectory.
+        steps = generator.normal(0, 0.01, (options["batch"] * options["batches"], 3))
+        points = np.clip(np.cumsum(steps, axis=0), -1, 1)
+        batches = np.split(points, options["batches"])
+
+        started = time.perf_counter()
+        for batch in batches:
+            index.query(batch)
+        query_us = (time.perf_counter() - started) / len(batches) * 1e6
+
+        tracker = ZoneTracker(index)
+        timestamp_ms = 0
+        events = 0
+        started = time.perf_counter()
+        for batch in batches:
+            samples = []
+            for x, y, z in batch.tolist():
+                samples.append((timestamp_ms, {"x": x, "y": y, "z": z}))
+                timestamp_ms += 10
+            events += len(tracker.feed(samples))
+        track_us = (time.perf_counter() - started) / len(batches) * 1e6
+
+        results = {
+            "zones": len(index),
+            "grid_cells": int(len(index.cell_keys)),
+            "batch_samples": options["batch"],
+            "compile_ms": round(compile_ms, 3),
+            "query_us_per_batch": round(query_us, 1),
+            "track_us_per_batch": round(track_us, 1),
+            "derived_events": events,
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for metric, value in results.items():
+            self.stdout.write(f"{metric:<20} {value:>12}")
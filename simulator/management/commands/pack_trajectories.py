@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+
+from simulator.models import Event
+from simulator.trajectory import pack_attempt_moves
+
+
+class Command(BaseCommand):
+    help = "Convert stored move events into packed trajectory chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--attempt", type=int, action="append", help="Only convert these attempt ids")
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be converted")
+
+    def handle(self, *args, **options):
+        attempt_ids = (
+            Event.objects.filter(event_type="move").values_list("attempt_id", flat=True).distinct().order_by("attempt_id")
+        )
+        if options["attempt"]:
+            attempt_ids = attempt_ids.filter(attempt_id__in=options["attempt"])
+        attempt_ids = list(attempt_ids)
+
+        total = 0
+        for attempt_id in attempt_ids:
+            if options["dry_run"]:
+                count = Event.objects.filter(attempt_id=attempt_id, event_type="move").count()
+                self.stdout.write(f"Attempt {attempt_id}: {count} move events")
+            else:
+                count = pack_attempt_moves(attempt_id)
+                self.stdout.write(f"Attempt {attempt_id}: packed {count} move events")
+            total += count
+
+        verb = "would pack" if options["dry_run"] else "packed"
+        self.stdout.write(self.style.SUCCESS(f"{len(attempt_ids)} attempts, {verb} {total} move events"))
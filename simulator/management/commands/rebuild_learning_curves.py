@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from simulator.progress import rebuild_learning_curves
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-student learning curves from completed attempts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, action="append", help="Only rebuild the curves of these user ids")
+        parser.add_argument("--procedure", type=int, action="append", help="Only rebuild the curves of these procedure ids")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = rebuild_learning_curves(options["user"], options["procedure"])
+        self.stdout.write(self.style.SUCCESS(f"{count} learning curves rebuilt in {time.perf_counter() - started:.2f}s"))
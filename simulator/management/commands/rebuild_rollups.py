@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from simulator.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily score rollups per procedure and specialty from completed attempts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="Only days on or after this date (YYYY-MM-DD)")
+        parser.add_argument("--until", help="Only days on or before this date (YYYY-MM-DD)")
+
+    def handle(self, *args, **options):
+        since, until = (parse_date(options[name]) if options[name] else None for name in ("since", "until"))
+        if (options["since"] and since is None) or (options["until"] and until is None):
+            raise CommandError("Dates must be YYYY-MM-DD")
+        started = time.perf_counter()
+        count = rebuild_rollups(since, until)
+        self.stdout.write(self.style.SUCCESS(f"{count} rollup rows rebuilt in {time.perf_counter() - started:.2f}s"))
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from simulator.spool import QUARANTINE_SUFFIX, drain_segment, orphaned_segments, read_segment
+
+
+class Command(BaseCommand):
+    help = "Store the events of spool segments left behind by stopped processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dir", help="Spool directory (defaults to EVENT_SPOOL_DIR)")
+        parser.add_argument("--force", action="store_true", help="Also replay segments of running processes")
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be replayed")
+
+    def handle(self, *args, **options):
+        segments = orphaned_segments(options["dir"] or settings.EVENT_SPOOL_DIR, force=options["force"])
+        total = 0
+        for path in segments:
+            if options["dry_run"]:
+                count = sum(1 for _ in read_segment(path))
+                self.stdout.write(f"{path.name}: {count} events")
+            else:
+                count, quarantined = drain_segment(path)
+                message = f"{path.name}: stored {count} events"
+                if quarantined:
+                    message += f", {quarantined} moved to {path.name}{QUARANTINE_SUFFIX}"
+                self.stdout.write(message)
+            total += count
+
+        verb = "would store" if options["dry_run"] else "stored"
+        self.stdout.write(self.style.SUCCESS(f"{len(segments)} segments, {verb} {total} events"))
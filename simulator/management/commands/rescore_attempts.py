@@ -0,0 +1,151 @@
+import multiprocessing
+import time
+from dataclasses import asdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from simulator.models import Attempt
+from simulator.progress import rebuild_learning_curves
+from simulator.rollups import rebuild_rollups
+from simulator.rescoring import batched, rescore_batch
+
+SCORE_FIELDS = ["score_total", "subscores", "score_breakdown", "feedback", "algorithm_version"]
+
+
+def _rescore_in_process(args):
+    attempt_ids, chunk_size, use_cache, update_cache = args
+    try:
+        return rescore_batch(attempt_ids, chunk_size, use_cache, update_cache)
+    finally:
+        close_old_connections()
+
+
+def _date_option(options, name):
+    try:
+        value = parse_date(options[name])
+    except ValueError:
+        value = None
+    if value is None:
+        raise CommandError(f"--{name} must be a valid date in YYYY-MM-DD format, got {options[name]!r}.")
+    return value
+
+
+class Command(BaseCommand):
+    help = "Recompute the scores of completed attempts from their stored events"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--procedure", type=int, action="append", help="Only rescore attempts of these procedure ids")
+        parser.add_argument("--attempt", type=int, action="append", help="Only rescore these attempt ids")
+        parser.add_argument("--since", help="Only attempts started on or after this date (YYYY-MM-DD)")
+        parser.add_argument("--until", help="Only attempts started on or before this date (YYYY-MM-DD)")
+        parser.add_argument("--algorithm-version", action="append", help="Only attempts scored with this algorithm version")
+        parser.add_argument("--batch-size", type=int, default=500, help="Attempts scored per batch")
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Event rows fetched per round trip")
+        parser.add_argument("--workers", type=int, default=1, help="Processes scoring batches in parallel")
+        parser.add_argument("--no-cache", action="store_true", help="Rescore attempts whose cached score is still valid")
+        parser.add_argument("--dry-run", action="store_true", help="Print the score changes without saving them")
+
+    def handle(self, *args, **options):
+        attempts = Attempt.objects.filter(status=Attempt.Status.COMPLETED)
+        if options["procedure"]:
+            attempts = attempts.filter(procedure_id__in=options["procedure"])
+        if options["attempt"]:
+            attempts = attempts.filter(id__in=options["attempt"])
+        if options["since"]:
+            attempts = attempts.filter(started_at__date__gte=_date_option(options, "since"))
+        if options["until"]:
+            attempts = attempts.filter(started_at__date__lte=_date_option(options, "until"))
+        if options["algorithm_version"]:
+            attempts = attempts.filter(algorithm_version__in=options["algorithm_version"])
+        attempt_ids = list(attempts.order_by("id").values_list("id", flat=True))
+        use_cache = not options["no_cache"]
+        # A dry run still reads valid cached scores but leaves the cache untouched.
+        update_cache = not options["dry_run"]
+        tasks = [
+            (batch, options["chunk_size"], use_cache, update_cache)
+            for batch in batched(attempt_ids, options["batch_size"])
+        ]
+
+        started = time.perf_counter()
+        scored = changed = events = 0
+        users, procedures, days = set(), set(), set()
+        for results, rows in self._run(tasks, options["workers"]):
+            events += rows
+            scored += len(results)
+            updates = self._changes(results, options["dry_run"])
+            changed += len(updates)
+            if updates and not options["dry_run"]:
+                Attempt.objects.bulk_update(updates, SCORE_FIELDS)
+                users.update(attempt.user_id for attempt in updates)
+                procedures.update(attempt.procedure_id for attempt in updates)
+                days.update(timezone.localdate(attempt.ended_at) for attempt in updates if attempt.ended_at)
+        if users:
+            # Learning curves and daily rollups are running statistics of the old scores.
+            rebuild_learning_curves(users, procedures)
+        if days:
+            rebuild_rollups(min(days), max(days))
+        elapsed = max(time.perf_counter() - started, 1e-9)
+
+        verb = "would change" if options["dry_run"] else "changed"
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{scored} attempts, {verb} {changed}, {events} events in {elapsed:.2f}s "
+                f"({scored / elapsed:,.0f} attempts/s, {events / elapsed:,.0f} events/s)"
+            )
+        )
+
+    @staticmethod
+    def _run(tasks, workers):
+        if workers <= 1 or len(tasks) <= 1:
+            return map(_rescore_in_process, tasks)
+        # Forked workers must not share the parent's database connections.
+        connections.close_all()
+        pool = multiprocessing.get_context("fork").Pool(min(workers, len(tasks)))
+
+        def results():
+            with pool:
+                yield from pool.imap_unordered(_rescore_in_process, tasks)
+
+        return results()
+
+    def _changes(self, results, dry_run):
+        current = Attempt.objects.only("id", "user_id", "procedure_id", "ended_at", "ai_used", *SCORE_FIELDS).in_bulk(
+            [attempt_id for attempt_id, _ in results]
+        )
+        updates = []
+        for attempt_id, result in results:
+            attempt = current.get(attempt_id)
+            if attempt is None:
+                continue
+            scored = asdict(result)
+            values = {
+                "score_total": scored["total"],
+                "subscores": scored["subscores"],
+                "score_breakdown": scored["breakdown"],
+                "feedback": scored["feedback"],
+                "algorithm_version": scored["algorithm_version"],
+            }
+            if attempt.ai_used:
+                # The stored feedback is the AI text written at completion, not the rule-based one.
+                del values["feedback"]
+            if all(getattr(attempt, field) == value for field, value in values.items()):
+                continue
+            if dry_run:
+                previous = attempt.score_breakdown or {}
+                counters = ", ".join(
+                    f"{name} {previous.get(name)} -> {value}"
+                    for name, value in values["score_breakdown"].items()
+                    if previous.get(name) != value
+                )
+                self.stdout.write(
+                    f"Attempt {attempt_id}: {attempt.score_total} -> {values['score_total']} "
+                    f"({attempt.algorithm_version} -> {values['algorithm_version']})"
+                    + (f"; {counters}" if counters else "")
+                )
+            for field, value in values.items():
+                setattr(attempt, field, value)
+            updates.append(attempt)
+        return updates
@@ -0,0 +1,262 @@
+import json
+import math
+import platform
+import tempfile
+import time
+import uuid
+
+import django
+import numpy as np
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
+from channels.routing import URLRouter
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from simulator import protocol
+from simulator.ingest import persist_events
+from simulator.kinematics import attempt_kinematics
+from simulator.models import Attempt, Procedure
+from simulator.reports import render_report_pdf, report_snapshot
+from simulator.routing import websocket_urlpatterns
+from simulator.scoring import evaluate_attempt, score_attempt
+from simulator.synthetic import AttemptProfile, generate_events, synthetic_procedure
+
+SUITES = ("ingest", "scoring", "reports")
+REST_BATCH_EVENTS = 5000
+FRAME_SAMPLES = 64
+# The ingest policy would throttle a benchmark client long before it measures anything.
+UNLIMITED_INGEST = {
+    "EVENT_RATE_PER_ATTEMPT": 1e12,
+    "EVENT_BURST_PER_ATTEMPT": 10**12,
+    "EVENT_RATE_PER_USER": 1e12,
+    "EVENT_BURST_PER_USER": 10**12,
+    "EVENT_RATE_CLOSE_AFTER": 10**12,
+    "EVENT_DISCRETE_RATE_PER_ATTEMPT": 1e12,
+    "EVENT_DISCRETE_BURST_PER_ATTEMPT": 10**12,
+    "EVENT_DISCRETE_RATE_PER_USER": 1e12,
+    "EVENT_DISCRETE_BURST_PER_USER": 10**12,
+    "EVENT_DISCRETE_CLOSE_AFTER": 10**12,
+}
+
+
+class Command(BaseCommand):
+    help = "Benchmark ingestion, scoring and reports on synthetic attempts"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated events per attempt")
+        parser.add_argument("--suites", default=",".join(SUITES), help=f"Comma-separated subset of {', '.join(SUITES)}")
+        parser.add_argument("--steps", type=int, default=5)
+        parser.add_argument("--events-per-second", type=float, default=60)
+        parser.add_argument("--hit-ratio", type=float, default=0.02)
+        parser.add_argument("--error-ratio", type=float, default=0.005)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--repeat", type=int, default=1, help="Runs per read-only case; the fastest is kept")
+        parser.add_argument("--output", help="Write the results to this JSON file")
+        parser.add_argument("--compare", help="Fail when a case is slower than in this earlier results file")
+        parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown with --compare")
+        parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+        parser.add_argument(
+            "--allow-live-db",
+            action="store_true",
+            help="Run with DEBUG off; the benchmark writes users, procedures and events to the configured database",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options["allow_live_db"]:
+            raise CommandError(
+                "DEBUG is off, so this may be a live database: the benchmark writes synthetic users, procedures "
+                "and up to millions of events to it. Pass --allow-live-db to run it anyway."
+            )
+        suites = [suite.strip() for suite in options["suites"].split(",") if suite.strip()]
+        unknown = set(suites) - set(SUITES)
+        if unknown:
+            raise CommandError(f"Unknown suites: {', '.join(sorted(unknown))}")
+        sizes = [int(size) for size in options["sizes"].split(",")]
+        self.repeat = max(options["repeat"], 1)
+        self.results = []
+
+        self.user = User.objects.create_user(username=f"bench-{uuid.uuid4().hex[:12]}", role=User.Roles.STUDENT)
+        self.procedure = Procedure.objects.create(**synthetic_procedure(options["steps"]))
+        try:
+            # Stored reports go to a scratch directory, removed with the rest of the benchmark data.
+            with tempfile.TemporaryDirectory() as reports, override_settings(
+                REPORT_ARTIFACT_DIR=reports, **UNLIMITED_INGEST
+            ):
+                for size in sizes:
+                    profile = AttemptProfile(
+                        events=size,
+                        steps=options["steps"],
+                        events_per_second=options["events_per_second"],
+                        hit_ratio=options["hit_ratio"],
+                        error_ratio=options["error_ratio"],
+                        seed=options["seed"],
+                    )
+                    self._run_size(profile, suites)
+        finally:
+            self.user.delete()
+            self.procedure.delete()
+
+        report = {
+            "meta": {
+                "created_at": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "numpy": np.__version__,
+                "database": connection.vendor,
+                "zone_engine": settings.ZONE_ENGINE_ENABLED,
+                "event_spool": settings.EVENT_SPOOL_ENABLED,
+                "options": {name: options[name] for name in ("steps", "events_per_second", "hit_ratio", "error_ratio", "seed")},
+            },
+            "results": self.results,
+        }
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as handle:
+                json.dump(report, handle, indent=2)
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+        else:
+            for row in self.results:
+                self.stdout.write(
+                    f"{row['suite']:<8} {row['case']:<20} {row['events']:>9} events "
+                    f"{row['seconds']:>10.4f}s {row['events_per_s']:>14,.0f} events/s"
+                )
+        if options["compare"]:
+            self._compare(options["compare"], options["tolerance"])
+
+    def _run_size(self, profile, suites):
+        events = generate_events(profile)
+        attempt = self._attempt(profile)
+        if "ingest" in suites:
+            self._measure("ingest", "persist_events", len(events), lambda: self._persist(attempt.id, events), repeat=1)
+            rest_attempt = self._attempt(profile)
+            self._measure("ingest", "rest_bulk", len(events), lambda: self._post(rest_attempt.id, events), repeat=1)
+            socket_attempt = self._attempt(profile)
+            self._measure("ingest", "consumer", len(events), lambda: self._stream(socket_attempt.id, events), repeat=1)
+        else:
+            self._persist(attempt.id, events)
+
+        if "scoring" in suites:
+            self._measure("scoring", "evaluate_stream", len(events), lambda: evaluate_attempt(attempt, mode="stream"))
+            self._measure("scoring", "evaluate_aggregate", len(events), lambda: evaluate_attempt(attempt, mode="aggregate"))
+            self._measure("scoring", "score_attempt", len(events), lambda: score_attempt(attempt))
+            self._measure("scoring", "kinematics", len(events), lambda: attempt_kinematics(attempt.id))
+
+        if "reports" in suites:
+            Attempt.objects.filter(id=attempt.id).update(status=Attempt.Status.COMPLETED, ended_at=timezone.now())
+            attempt = Attempt.objects.select_related("user", "procedure").get(id=attempt.id)
+            self._measure("reports", "report_render", len(events), lambda: render_report_pdf(report_snapshot(attempt)))
+            client = APIClient()
+            client.force_authenticate(self.user)
+            self._measure("reports", "report_json", len(events), lambda: self._get(client, f"/api/reports/{attempt.id}/"))
+            self._measure("reports", "report_pdf", len(events), lambda: self._get(client, f"/api/reports/{attempt.id}/pdf/"))
+
+    def _attempt(self, profile):
+        return Attempt.objects.create(
+            user=self.user, procedure=self.procedure, duration_seconds=profile.duration_seconds
+        )
+
+    def _measure(self, suite, case, events, function, repeat=None):
+        timings = []
+        for _ in range(repeat or self.repeat):
+            started = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - started)
+        seconds = min(timings)
+        self.results.append(
+            {
+                "suite": suite,
+                "case": case,
+                "events": events,
+                "seconds": round(seconds, 6),
+                "events_per_s": round(events / seconds, 1) if seconds else None,
+            }
+        )
+
+    @staticmethod
+    def _persist(attempt_id, events):
+        chunk_size = settings.EVENT_INGEST_CHUNK_SIZE
+        for start in range(0, len(events), chunk_size):
+            persist_events(attempt_id, events[start : start + chunk_size])
+
+    def _post(self, attempt_id, events):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for start in range(0, len(events), REST_BATCH_EVENTS):
+            body = "\n".join(
+                json.dumps({"event_type": event_type, "payload": payload, "timestamp_ms": timestamp_ms})
+                for event_type, payload, timestamp_ms in events[start : start + REST_BATCH_EVENTS]
+            )
+            response = client.post(
+                f"/api/attempts/{attempt_id}/events/bulk/", body, content_type="application/x-ndjson"
+            )
+            if response.status_code != 201:
+                raise CommandError(f"Bulk ingest failed with {response.status_code}: {response.content[:200]!r}")
+
+    def _stream(self, attempt_id, events):
+        """Moves as binary frames and everything else as JSON text, like the browser client."""
+        scope = {
+            "type": "websocket",
+            "path": f"/ws/attempts/{attempt_id}/",
+            "query_string": b"",
+            "headers": [],
+            "subprotocols": [protocol.SUBPROTOCOL],
+            "user": self.user,
+        }
+
+        async def scenario():
+            communicator = ApplicationCommunicator(URLRouter(websocket_urlpatterns), scope)
+            await communicator.send_input({"type": "websocket.connect"})
+            accepted = await communicator.receive_output()
+            if accepted["type"] != "websocket.accept":
+                raise CommandError(f"Socket rejected: {accepted}")
+            moves = []
+            for event_type, payload, timestamp_ms in events:
+                if event_type == "move":
+                    tool = protocol.TOOL_CODES.get(payload.get("tool") or "", 0)
+                    moves.append((timestamp_ms, payload["x"], payload["y"], payload["z"], tool, math.nan, math.nan))
+                    if len(moves) == FRAME_SAMPLES:
+                        await communicator.send_input(
+                            {"type": "websocket.receive", "bytes": protocol.encode_frame("move", moves)}
+                        )
+                        moves = []
+                    continue
+                frame = {"event_type": event_type, "payload": payload, "timestamp_ms": timestamp_ms}
+                await communicator.send_input({"type": "websocket.receive", "text": json.dumps(frame)})
+            if moves:
+                await communicator.send_input({"type": "websocket.receive", "bytes": protocol.encode_frame("move", moves)})
+            # Replies are not awaited (binary clients only get warnings); the
+            # consumer finishes once it has read every frame and flushed on disconnect.
+            await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+            await communicator.wait(timeout=None)
+
+        async_to_sync(scenario)()
+
+    @staticmethod
+    def _get(client, path):
+        response = client.get(path)
+        if response.status_code != 200:
+            raise CommandError(f"GET {path} failed with {response.status_code}")
+        # Streaming responses are only produced when consumed.
+        return b"".join(response.streaming_content) if response.streaming else response.content
+
+    def _compare(self, path, tolerance):
+        with open(path, encoding="utf-8") as handle:
+            baseline = {
+                (row["suite"], row["case"], row["events"]): row["seconds"] for row in json.load(handle)["results"]
+            }
+        regressions = []
+        for row in self.results:
+            previous = baseline.get((row["suite"], row["case"], row["events"]))
+            if previous and row["seconds"] > previous * (1 + tolerance):
+                regressions.append(
+                    f"{row['suite']}/{row['case']}@{row['events']}: {previous:.4f}s -> {row['seconds']:.4f}s"
+                )
+        if regressions:
+            raise CommandError("Slower than the baseline:\n" + "\n".join(regressions))
+        self.stdout.write(self.style.SUCCESS(f"No case more than {tolerance:.0%} slower than {path}"))
@@ -0,0 +1,71 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from simulator.models import Attempt
+from simulator.shadow import compare_shadow_scores, get_scorer, run_shadow_scorers
+
+
+class Command(BaseCommand):
+    help = "Score completed attempts with candidate scorers and compare them with the stored scores"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scorer", action="append", help="Candidate scorer name or dotted path (defaults to SHADOW_SCORERS)")
+        parser.add_argument("--procedure", type=int, action="append", help="Only attempts of these procedure ids")
+        parser.add_argument("--attempt", type=int, action="append", help="Only these attempt ids")
+        parser.add_argument("--since", help="Only attempts started on or after this date (YYYY-MM-DD)")
+        parser.add_argument("--until", help="Only attempts started on or before this date (YYYY-MM-DD)")
+        parser.add_argument("--report-only", action="store_true", help="Compare the stored shadow scores without scoring")
+        parser.add_argument("--json", action="store_true", help="Print the comparison as JSON")
+
+    def handle(self, *args, **options):
+        scorers = options["scorer"] or settings.SHADOW_SCORERS
+        if not scorers:
+            raise CommandError("No candidate scorers: pass --scorer or set SHADOW_SCORERS")
+        for name in scorers:
+            try:
+                get_scorer(name)
+            except ValueError as exc:
+                raise CommandError(str(exc)) from exc
+
+        if not options["report_only"]:
+            attempts = Attempt.objects.filter(status=Attempt.Status.COMPLETED).select_related("procedure")
+            if options["procedure"]:
+                attempts = attempts.filter(procedure_id__in=options["procedure"])
+            if options["attempt"]:
+                attempts = attempts.filter(id__in=options["attempt"])
+            if options["since"]:
+                attempts = attempts.filter(started_at__date__gte=parse_date(options["since"]))
+            if options["until"]:
+                attempts = attempts.filter(started_at__date__lte=parse_date(options["until"]))
+            started = time.perf_counter()
+            scored = errors = 0
+            for attempt in attempts.order_by("id").iterator(chunk_size=500):
+                errors += sum(1 for row in run_shadow_scorers(attempt, scorers) if row.error)
+                scored += 1
+            self.stdout.write(
+                f"{scored} attempts scored by {', '.join(scorers)} in {time.perf_counter() - started:.2f}s"
+                + (f", {errors} errors" if errors else "")
+            )
+
+        procedure_id = options["procedure"][0] if options["procedure"] and len(options["procedure"]) == 1 else None
+        report = [row for row in compare_shadow_scores(procedure_id=procedure_id) if row["scorer"] in scorers]
+        if options["json"]:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for row in report:
+            self.stdout.write(
+                f"{row['scorer']}: {row['attempts']} attempts, {row['changed']} changed, "
+                f"mean delta {row['mean_delta']}, mean |delta| {row['mean_abs_delta']}, "
+                f"max |delta| {row['max_abs_delta']}, {row['errors']} errors, {row['mean_elapsed_ms']} ms/attempt"
+            )
+            for subscore, values in row["subscores"].items():
+                self.stdout.write(f"  {subscore}: mean delta {values['mean_delta']}, correlation {values['correlation']}")
+            for drift in row["procedures"][:10]:
+                self.stdout.write(
+                    f"  procedure {drift['procedure_id']} ({drift['procedure']}): "
+                    f"{drift['attempts']} attempts, mean delta {drift['mean_delta']}"
+                )
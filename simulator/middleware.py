@@ -2,7 +2,6 @@ from urllib.parse import parse_qs
 
 from asgiref.sync import sync_to_async
 from django.contrib.auth.models import AnonymousUser
-from rest_framework_simplejwt.authentication import JWTAuthentication
 
 
 class JwtAuthMiddleware:
@@ -23,10 +22,16 @@ class JwtAuthMiddleware:
 
     @staticmethod
     async def _authenticate_token(token):
-        authenticator = JWTAuthentication()
+        from accounts.authentication import CachedJWTAuthentication
+
+        authenticator = CachedJWTAuthentication()
         try:
-            validated = await sync_to_async(authenticator.get_validated_token)(token)
-            return await sync_to_async(authenticator.get_user)(validated)
+            # Token verification is CPU-only; only a cache miss needs the database thread.
+            validated = authenticator.get_validated_token(token)
+            user = authenticator.get_cached_user(validated)
+            if user is None:
+                user = await sync_to_async(authenticator.get_user)(validated)
+            return user
         except Exception:
             return AnonymousUser()
 
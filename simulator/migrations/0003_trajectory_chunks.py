@@ -0,0 +1,38 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("simulator", "0002_procedure_attempt_updates"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TrajectoryChunk",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("sequence", models.IntegerField()),
+                ("start_ms", models.IntegerField()),
+                ("end_ms", models.IntegerField()),
+                ("sample_count", models.IntegerField(default=0)),
+                ("tools", models.JSONField(default=list)),
+                ("samples", models.BinaryField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "attempt",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="trajectory_chunks",
+                        to="simulator.attempt",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["attempt", "sequence"],
+                "constraints": [
+                    models.UniqueConstraint(fields=("attempt", "sequence"), name="unique_trajectory_chunk_sequence")
+                ],
+            },
+        ),
+    ]
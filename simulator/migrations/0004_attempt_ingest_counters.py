@@ -0,0 +1,20 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("simulator", "0003_trajectory_chunks"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="attempt",
+            name="events_dropped",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="attempt",
+            name="moves_coalesced",
+            field=models.IntegerField(default=0),
+        ),
+    ]
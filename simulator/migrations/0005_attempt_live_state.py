@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("simulator", "0004_attempt_ingest_counters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="attempt",
+            name="live_state",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("simulator", "0005_attempt_live_state"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="attempt",
+            name="zone_state",
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
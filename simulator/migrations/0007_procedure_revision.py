@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("simulator", "0006_attempt_zone_state"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="procedure",
+            name="revision",
+            field=models.PositiveIntegerField(default=1, editable=False),
+        ),
+    ]
@@ -0,0 +1,29 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("simulator", "0007_procedure_revision"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScoreCacheEntry",
+            fields=[
+                (
+                    "attempt",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="score_cache",
+                        serialize=False,
+                        to="simulator.attempt",
+                    ),
+                ),
+                ("fingerprint", models.CharField(max_length=64)),
+                ("result", models.JSONField(default=dict)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
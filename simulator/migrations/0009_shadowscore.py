@@ -0,0 +1,39 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("simulator", "0008_scorecacheentry"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ShadowScore",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("scorer", models.CharField(max_length=100)),
+                ("algorithm_version", models.CharField(blank=True, max_length=20)),
+                ("score_total", models.FloatField(blank=True, null=True)),
+                ("subscores", models.JSONField(blank=True, default=dict)),
+                ("score_breakdown", models.JSONField(blank=True, default=dict)),
+                ("elapsed_ms", models.FloatField(default=0)),
+                ("error", models.TextField(blank=True)),
+                ("scored_at", models.DateTimeField(auto_now=True)),
+                (
+                    "attempt",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shadow_scores",
+                        to="simulator.attempt",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["attempt", "scorer"],
+                "constraints": [
+                    models.UniqueConstraint(fields=("attempt", "scorer"), name="unique_shadow_score_scorer")
+                ],
+            },
+        ),
+    ]
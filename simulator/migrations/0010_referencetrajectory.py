@@ -0,0 +1,43 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("simulator", "0009_shadowscore"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReferenceTrajectory",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("name", models.CharField(max_length=120)),
+                ("sample_count", models.IntegerField(default=0)),
+                ("duration_ms", models.IntegerField(default=0)),
+                ("samples", models.BinaryField()),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "procedure",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="reference_trajectories",
+                        to="simulator.procedure",
+                    ),
+                ),
+                (
+                    "source_attempt",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="simulator.attempt",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["procedure", "id"],
+            },
+        ),
+    ]
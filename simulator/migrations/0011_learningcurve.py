@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# The moving-average window when this migration was written; later changes to
+# LEARNING_CURVE_WINDOW apply to new completions and rebuild_learning_curves.
+RECENT_SCORES_WINDOW = 5
+
+
+def add_score(curve, score, completed_at):
+    """Frozen copy of ``simulator.progress.add_score``."""
+    curve.attempts += 1
+    count = curve.attempts
+    previous_index_mean = count / 2  # mean of 1..count-1
+    delta = score - curve.mean_score
+    curve.mean_score += delta / count
+    curve.score_m2 += delta * (score - curve.mean_score)
+    curve.score_comoment += (count - previous_index_mean) * (score - curve.mean_score)
+    curve.best_score = score if curve.best_score is None else max(curve.best_score, score)
+    curve.last_score = score
+    curve.recent_scores = [*curve.recent_scores, score][-RECENT_SCORES_WINDOW:]
+    curve.first_completed_at = curve.first_completed_at or completed_at
+    curve.last_completed_at = completed_at
+
+
+def backfill_learning_curves(apps, schema_editor):
+    """Replay the attempts completed before curves were kept, like ``rebuild_learning_curves``."""
+    Attempt = apps.get_model("simulator", "Attempt")
+    LearningCurve = apps.get_model("simulator", "LearningCurve")
+    curves = {}
+    rows = (
+        Attempt.objects.filter(status="COMPLETED", score_total__isnull=False)
+        .order_by("ended_at", "id")
+        .values_list("user_id", "procedure_id", "score_total", "ended_at")
+    )
+    for user_id, procedure_id, score, ended_at in rows.iterator(chunk_size=2000):
+        curve = curves.get((user_id, procedure_id))
+        if curve is None:
+            curve = curves[(user_id, procedure_id)] = LearningCurve(user_id=user_id, procedure_id=procedure_id)
+        add_score(curve, score, ended_at)
+    LearningCurve.objects.bulk_create(curves.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("simulator", "0010_referencetrajectory"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="LearningCurve",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("attempts", models.IntegerField(default=0)),
+                ("mean_score", models.FloatField(default=0)),
+                ("score_m2", models.FloatField(default=0)),
+                ("score_comoment", models.FloatField(default=0)),
+                ("best_score", models.FloatField(blank=True, null=True)),
+                ("last_score", models.FloatField(blank=True, null=True)),
+                ("recent_scores", models.JSONField(blank=True, default=list)),
+                ("first_completed_at", models.DateTimeField(blank=True, null=True)),
+                ("last_completed_at", models.DateTimeField(blank=True, null=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "procedure",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="learning_curves",
+                        to="simulator.procedure",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="learning_curves",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["user", "procedure"],
+                "constraints": [
+                    models.UniqueConstraint(fields=("user", "procedure"), name="unique_learning_curve_user_procedure")
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_learning_curves, migrations.RunPython.noop),
+    ]
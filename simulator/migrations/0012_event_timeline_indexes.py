@@ -0,0 +1,18 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("simulator", "0011_learningcurve"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(fields=["attempt", "timestamp_ms", "id"], name="event_attempt_time_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="event",
+            index=models.Index(fields=["attempt", "event_type", "timestamp_ms", "id"], name="event_attempt_type_time_idx"),
+        ),
+    ]
@@ -0,0 +1,102 @@
+from django.db import migrations, models
+import django.db.models.deletion
+from django.utils import timezone
+
+
+def add_score(row, score, subscores):
+    """Frozen copy of ``simulator.rollups.add_score``."""
+    row.attempts += 1
+    row.score_sum += score
+    row.score_sq_sum += score * score
+    row.score_min = score if row.score_min is None else min(row.score_min, score)
+    row.score_max = score if row.score_max is None else max(row.score_max, score)
+    sums, counts = dict(row.subscore_sums), dict(row.subscore_counts)
+    for name, value in (subscores or {}).items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            sums[name] = sums.get(name, 0) + value
+            counts[name] = counts.get(name, 0) + 1
+    row.subscore_sums, row.subscore_counts = sums, counts
+
+
+def backfill_daily_stats(apps, schema_editor):
+    """Build the rollups of the attempts completed before they were kept, like ``rebuild_rollups``."""
+    Attempt = apps.get_model("simulator", "Attempt")
+    ProcedureDailyStats = apps.get_model("simulator", "ProcedureDailyStats")
+    SpecialtyDailyStats = apps.get_model("simulator", "SpecialtyDailyStats")
+    by_procedure, by_specialty = {}, {}
+    rows = Attempt.objects.filter(
+        status="COMPLETED", score_total__isnull=False, ended_at__isnull=False
+    ).values_list("procedure_id", "procedure__specialty", "ended_at", "score_total", "subscores")
+    for procedure_id, specialty, ended_at, score, subscores in rows.iterator(chunk_size=2000):
+        day = timezone.localdate(ended_at)
+        procedure_row = by_procedure.get((procedure_id, day))
+        if procedure_row is None:
+            procedure_row = by_procedure[(procedure_id, day)] = ProcedureDailyStats(procedure_id=procedure_id, day=day)
+        specialty_row = by_specialty.get((specialty, day))
+        if specialty_row is None:
+            specialty_row = by_specialty[(specialty, day)] = SpecialtyDailyStats(specialty=specialty, day=day)
+        add_score(procedure_row, score, subscores)
+        add_score(specialty_row, score, subscores)
+    ProcedureDailyStats.objects.bulk_create(by_procedure.values(), batch_size=500)
+    SpecialtyDailyStats.objects.bulk_create(by_specialty.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("simulator", "0012_event_timeline_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProcedureDailyStats",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("day", models.DateField()),
+                ("attempts", models.IntegerField(default=0)),
+                ("score_sum", models.FloatField(default=0)),
+                ("score_sq_sum", models.FloatField(default=0)),
+                ("score_min", models.FloatField(blank=True, null=True)),
+                ("score_max", models.FloatField(blank=True, null=True)),
+                ("subscore_sums", models.JSONField(blank=True, default=dict)),
+                ("subscore_counts", models.JSONField(blank=True, default=dict)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "procedure",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_stats",
+                        to="simulator.procedure",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["procedure", "day"],
+                "constraints": [
+                    models.UniqueConstraint(fields=("procedure", "day"), name="unique_procedure_daily_stats")
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="SpecialtyDailyStats",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("day", models.DateField()),
+                ("attempts", models.IntegerField(default=0)),
+                ("score_sum", models.FloatField(default=0)),
+                ("score_sq_sum", models.FloatField(default=0)),
+                ("score_min", models.FloatField(blank=True, null=True)),
+                ("score_max", models.FloatField(blank=True, null=True)),
+                ("subscore_sums", models.JSONField(blank=True, default=dict)),
+                ("subscore_counts", models.JSONField(blank=True, default=dict)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("specialty", models.CharField(max_length=120)),
+            ],
+            options={
+                "ordering": ["specialty", "day"],
+                "constraints": [
+                    models.UniqueConstraint(fields=("specialty", "day"), name="unique_specialty_daily_stats")
+                ],
+            },
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
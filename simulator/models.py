@@ -16,10 +16,19 @@ class Procedure(models.Model):
     rubric = models.JSONField(default=dict)
     prompt_base = models.TextField(blank=True)
     is_playable = models.BooleanField(default=True)
+    revision = models.PositiveIntegerField(default=1, editable=False)
 
     def __str__(self) -> str:
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Compiled plans cached by other processes are keyed on the revision.
+        if self.pk is not None and not self._state.adding:
+            self.revision += 1
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "revision"}
+        super().save(*args, **kwargs)
+
 
 class Attempt(models.Model):
     class Status(models.TextChoices):
@@ -41,6 +50,10 @@ class Attempt(models.Model):
     ai_provider = models.CharField(max_length=50, blank=True)
     ai_model = models.CharField(max_length=120, blank=True)
     ai_feedback = models.JSONField(default=list, blank=True)
+    events_dropped = models.IntegerField(default=0)
+    moves_coalesced = models.IntegerField(default=0)
+    live_state = models.JSONField(default=dict, blank=True)
+    zone_state = models.JSONField(default=dict, blank=True)
 
     def __str__(self) -> str:
         return f"Attempt {self.id} - {self.user}"
@@ -53,5 +66,161 @@ class Event(models.Model):
     timestamp_ms = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pages of the report timeline, with and without a type filter.
+            models.Index(fields=["attempt", "timestamp_ms", "id"], name="event_attempt_time_idx"),
+            models.Index(fields=["attempt", "event_type", "timestamp_ms", "id"], name="event_attempt_type_time_idx"),
+        ]
+
     def __str__(self) -> str:
         return f"{self.event_type} @ {self.timestamp_ms}"
+
+
+class TrajectoryChunk(models.Model):
+    """Packed ``move`` samples of an attempt (see ``simulator.trajectory``)."""
+
+    attempt = models.ForeignKey(Attempt, on_delete=models.CASCADE, related_name="trajectory_chunks")
+    sequence = models.IntegerField()
+    start_ms = models.IntegerField()
+    end_ms = models.IntegerField()
+    sample_count = models.IntegerField(default=0)
+    tools = models.JSONField(default=list)
+    samples = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["attempt", "sequence"]
+        constraints = [
+            models.UniqueConstraint(fields=["attempt", "sequence"], name="unique_trajectory_chunk_sequence"),
+        ]
+
+    def __str__(self) -> str:
+        return f"Trajectory {self.attempt_id}#{self.sequence} ({self.sample_count} samples)"
+
+
+class ScoreCacheEntry(models.Model):
+    """Last computed score of an attempt and the fingerprint of the inputs it was computed from."""
+
+    attempt = models.OneToOneField(Attempt, on_delete=models.CASCADE, primary_key=True, related_name="score_cache")
+    fingerprint = models.CharField(max_length=64)
+    result = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"Score cache {self.attempt_id}"
+
+
+class ShadowScore(models.Model):
+    """Result of a candidate scorer for a completed attempt (see ``simulator.shadow``).
+
+    Kept apart from the attempt's own score, which students and reports see.
+    """
+
+    attempt = models.ForeignKey(Attempt, on_delete=models.CASCADE, related_name="shadow_scores")
+    scorer = models.CharField(max_length=100)
+    algorithm_version = models.CharField(max_length=20, blank=True)
+    score_total = models.FloatField(null=True, blank=True)
+    subscores = models.JSONField(default=dict, blank=True)
+    score_breakdown = models.JSONField(default=dict, blank=True)
+    elapsed_ms = models.FloatField(default=0)
+    error = models.TextField(blank=True)
+    scored_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["attempt", "scorer"]
+        constraints = [
+            models.UniqueConstraint(fields=["attempt", "scorer"], name="unique_shadow_score_scorer"),
+        ]
+
+    def __str__(self) -> str:
+        return f"Shadow score {self.attempt_id} ({self.scorer})"
+
+
+class ReferenceTrajectory(models.Model):
+    """Instrument path of an expert attempt that student attempts are compared with (see ``simulator.references``)."""
+
+    procedure = models.ForeignKey(Procedure, on_delete=models.CASCADE, related_name="reference_trajectories")
+    source_attempt = models.ForeignKey(Attempt, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    name = models.CharField(max_length=120)
+    sample_count = models.IntegerField(default=0)
+    duration_ms = models.IntegerField(default=0)
+    samples = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["procedure", "id"]
+
+    def __str__(self) -> str:
+        return f"Reference {self.name} ({self.procedure_id})"
+
+
+class LearningCurve(models.Model):
+    """Running statistics of a student's completed attempts of one procedure (see ``simulator.progress``)."""
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="learning_curves")
+    procedure = models.ForeignKey(Procedure, on_delete=models.CASCADE, related_name="learning_curves")
+    attempts = models.IntegerField(default=0)
+    mean_score = models.FloatField(default=0)
+    # Sum of squared deviations from the mean (Welford) and co-moment of score and attempt number.
+    score_m2 = models.FloatField(default=0)
+    score_comoment = models.FloatField(default=0)
+    best_score = models.FloatField(null=True, blank=True)
+    last_score = models.FloatField(null=True, blank=True)
+    recent_scores = models.JSONField(default=list, blank=True)
+    first_completed_at = models.DateTimeField(null=True, blank=True)
+    last_completed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["user", "procedure"]
+        constraints = [
+            models.UniqueConstraint(fields=["user", "procedure"], name="unique_learning_curve_user_procedure"),
+        ]
+
+    def __str__(self) -> str:
+        return f"Learning curve {self.user_id}/{self.procedure_id} ({self.attempts} attempts)"
+
+
+class DailyScoreStats(models.Model):
+    """Score totals of the attempts completed on one day (see ``simulator.rollups``)."""
+
+    day = models.DateField()
+    attempts = models.IntegerField(default=0)
+    score_sum = models.FloatField(default=0)
+    score_sq_sum = models.FloatField(default=0)
+    score_min = models.FloatField(null=True, blank=True)
+    score_max = models.FloatField(null=True, blank=True)
+    # Per subscore: sum and number of attempts reporting it (optional subscores are not always present).
+    subscore_sums = models.JSONField(default=dict, blank=True)
+    subscore_counts = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        abstract = True
+
+
+class ProcedureDailyStats(DailyScoreStats):
+    procedure = models.ForeignKey(Procedure, on_delete=models.CASCADE, related_name="daily_stats")
+
+    class Meta:
+        ordering = ["procedure", "day"]
+        constraints = [
+            models.UniqueConstraint(fields=["procedure", "day"], name="unique_procedure_daily_stats"),
+        ]
+
+    def __str__(self) -> str:
+        return f"Procedure {self.procedure_id} on {self.day} ({self.attempts} attempts)"
+
+
+class SpecialtyDailyStats(DailyScoreStats):
+    specialty = models.CharField(max_length=120)
+
+    class Meta:
+        ordering = ["specialty", "day"]
+        constraints = [
+            models.UniqueConstraint(fields=["specialty", "day"], name="unique_specialty_daily_stats"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.specialty} on {self.day} ({self.attempts} attempts)"
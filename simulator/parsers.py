@@ -0,0 +1,36 @@
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """Parses newline-delimited JSON lazily, one event per line.
+
+    Returns a generator so the body is consumed from the request stream while
+    it is being ingested instead of being loaded in memory at once. Lines that
+    are not valid JSON are yielded as raw strings and rejected by validation;
+    a line that cannot be decoded stops the stream with a ``ParseError``.
+    """
+
+    media_type = "application/x-ndjson"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", "utf-8")
+        return self._iter_lines(stream, encoding)
+
+    @staticmethod
+    def _iter_lines(stream, encoding):
+        if stream is None:
+            return
+        for number, raw_line in enumerate(stream, start=1):
+            try:
+                line = raw_line.decode(encoding).strip()
+            except UnicodeDecodeError as exc:
+                raise ParseError(f"NDJSON line {number} is not valid {encoding}: {exc.reason}.") from exc
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield line
@@ -0,0 +1,192 @@
+"""Compiled procedure plans.
+
+``CompiledProcedure`` resolves a procedure's ``steps``, ``rubric`` and
+``zones`` JSON once: step id lookups, per-step instrument and action sets,
+penalties with their defaults and the zone index. Plans are cached per
+process in an LRU keyed by procedure id and checked against
+``Procedure.revision``, which every save bumps, so workers that did not see
+the save still rebuild stale plans. Saves and deletes in this process drop
+the entry immediately.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict, namedtuple
+from typing import Any
+
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Procedure
+from .kinematics import DEFAULT_SETTINGS as DEFAULT_KINEMATICS
+from .references import DEFAULT_SETTINGS as DEFAULT_REFERENCE
+from .zones import ZoneConfigError, ZoneIndex
+
+Penalties = namedtuple(
+    "Penalties",
+    [
+        "forbidden_hit",
+        "wrong_action",
+        "step_omitted",
+        "time_over",
+        "wrong_instrument",
+        "erratic_move",
+        "forbidden_contact",
+        "forceful_action",
+        "poor_motion",
+        "reference_deviation",
+    ],
+)
+DEFAULT_PENALTIES = Penalties(6, 4, 5, 1, 4, 1, 2, 2, 0, 0)
+
+
+def _member_set(values: Any) -> Any:
+    """A frozenset of a list for fast membership; anything else is kept as is."""
+    if not isinstance(values, (list, tuple)):
+        return values
+    try:
+        return frozenset(values)
+    except TypeError:
+        return tuple(values)
+
+
+def contains(members: Any, value: Any) -> bool:
+    try:
+        return value in members
+    except TypeError:
+        # An unhashable value is never equal to a frozenset member.
+        return False
+
+
+class CompiledProcedure:
+    def __init__(self, procedure: Procedure) -> None:
+        self.procedure_id = procedure.pk
+        self.revision = procedure.revision
+        self.name = procedure.name
+        self.steps = list(procedure.steps or [])
+        self.step_ids = [step.get("id") for step in self.steps]
+        self.step_index = {}
+        for position, step_id in enumerate(self.step_ids):
+            try:
+                self.step_index.setdefault(step_id, position)
+            except TypeError:
+                pass
+        self.step_instruments = [_member_set(step.get("instruments", [])) for step in self.steps]
+        self.step_actions = [_member_set(step.get("actions", [])) for step in self.steps]
+        self.total_steps = max(len(self.steps), 1)
+
+        rubric: dict[str, Any] = procedure.rubric or {}
+        penalties = rubric.get("penalties", {})
+        self.penalties = Penalties(
+            *(penalties.get(name, default) for name, default in zip(Penalties._fields, DEFAULT_PENALTIES))
+        )
+        self.expected_time = rubric.get("expected_time_seconds", 180)
+        self.algorithm_version = rubric.get("version", "rules_v2")
+        kinematics = rubric.get("kinematics")
+        # Opt-in: trajectory metrics need every move sample, which the live state does not keep.
+        self.kinematics = {**DEFAULT_KINEMATICS, **kinematics} if isinstance(kinematics, dict) else None
+        reference = rubric.get("reference")
+        self.reference = {**DEFAULT_REFERENCE, **reference} if isinstance(reference, dict) else None
+        # Everything a score depends on besides the attempt itself.
+        self.scoring_hash = hashlib.sha256(
+            json.dumps([procedure.steps, procedure.rubric], sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()
+
+        try:
+            zone_index = ZoneIndex(procedure.zones)
+        except ZoneConfigError:
+            zone_index = None
+        self.zone_index = zone_index if zone_index is not None and len(zone_index) else None
+
+    def step(self, step_id: Any) -> dict[str, Any] | None:
+        try:
+            position = self.step_index.get(step_id)
+        except TypeError:
+            return None
+        return None if position is None else self.steps[position]
+
+    def first_pending_step(self, completed_steps: set) -> int | None:
+        for position, step_id in enumerate(self.step_ids):
+            if step_id not in completed_steps:
+                return position
+        return None
+
+    def expected_tools(self, completed_steps: set) -> Any:
+        """Instruments of the first pending step; empty when every step is completed."""
+        position = self.first_pending_step(completed_steps)
+        return () if position is None else self.step_instruments[position]
+
+    def completed_count(self, completed_steps: set) -> int:
+        return sum(1 for step_id in self.step_ids if step_id in completed_steps)
+
+
+class ProcedureCache:
+    """Bounded LRU of compiled procedures keyed by procedure id."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[int, CompiledProcedure] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, procedure_id: int, revision: int | None = None) -> CompiledProcedure | None:
+        with self._lock:
+            compiled = self._entries.get(procedure_id)
+            if compiled is None or (revision is not None and compiled.revision != revision):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(procedure_id)
+            self.hits += 1
+            return compiled
+
+    def set(self, compiled: CompiledProcedure) -> None:
+        with self._lock:
+            self._entries[compiled.procedure_id] = compiled
+            self._entries.move_to_end(compiled.procedure_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, procedure_id: int) -> None:
+        with self._lock:
+            self._entries.pop(procedure_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+procedure_cache = ProcedureCache(settings.PROCEDURE_CACHE_SIZE)
+
+
+def get_compiled_procedure(procedure: Procedure | int, revision: int | None = None) -> CompiledProcedure:
+    """The compiled plan of a procedure instance, or of a procedure id at ``revision``.
+
+    With only an id and no revision the cached plan is trusted as is.
+    """
+    if isinstance(procedure, Procedure):
+        procedure_id, revision = procedure.pk, procedure.revision
+    else:
+        procedure_id = procedure
+    compiled = procedure_cache.get(procedure_id, revision)
+    if compiled is None:
+        if not isinstance(procedure, Procedure):
+            procedure = Procedure.objects.get(pk=procedure_id)
+        compiled = CompiledProcedure(procedure)
+        procedure_cache.set(compiled)
+    return compiled
+
+
+@receiver(post_save, sender=Procedure)
+@receiver(post_delete, sender=Procedure)
+def _invalidate_procedure(sender, instance, **kwargs):
+    procedure_cache.invalidate(instance.pk)
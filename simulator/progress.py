@@ -0,0 +1,91 @@
+"""Per-student learning curves, updated in O(1) per completed attempt.
+
+``LearningCurve`` keeps running moments of the scores of a user's completed
+attempts of a procedure, in completion order:
+
+- ``mean_score`` and ``score_m2`` (sum of squared deviations) with
+  Welford's update, which stays exact where ``sum(x**2) - n * mean**2``
+  loses precision;
+- ``score_comoment``, the co-moment of score and attempt number ``1..n``.
+  Attempt numbers have a closed-form mean ``(n + 1) / 2`` and sum of squared
+  deviations ``n * (n**2 - 1) / 12``, so the least-squares slope (points
+  gained per attempt) needs no other state;
+- the best and last scores and the last ``LEARNING_CURVE_WINDOW`` scores for
+  the moving average.
+
+``record_completion`` folds one attempt in; ``rebuild_learning_curves``
+replays the history (``rebuild_learning_curves`` command).
+"""
+from __future__ import annotations
+
+from typing import Any, Iterable
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Attempt, LearningCurve
+
+
+def add_score(curve: LearningCurve, score: float, completed_at: Any) -> None:
+    curve.attempts += 1
+    count = curve.attempts
+    previous_index_mean = count / 2  # mean of 1..count-1
+    delta = score - curve.mean_score
+    curve.mean_score += delta / count
+    curve.score_m2 += delta * (score - curve.mean_score)
+    curve.score_comoment += (count - previous_index_mean) * (score - curve.mean_score)
+    curve.best_score = score if curve.best_score is None else max(curve.best_score, score)
+    curve.last_score = score
+    curve.recent_scores = [*curve.recent_scores, score][-settings.LEARNING_CURVE_WINDOW :]
+    curve.first_completed_at = curve.first_completed_at or completed_at
+    curve.last_completed_at = completed_at
+
+
+def curve_statistics(curve: LearningCurve) -> dict[str, Any]:
+    count = curve.attempts
+    variance = curve.score_m2 / (count - 1) if count > 1 else 0.0
+    index_m2 = count * (count**2 - 1) / 12
+    return {
+        "variance": round(variance, 4),
+        "std": round(variance**0.5, 4),
+        "moving_average": round(sum(curve.recent_scores) / len(curve.recent_scores), 4) if curve.recent_scores else None,
+        "slope": round(curve.score_comoment / index_m2, 4) if index_m2 else 0.0,
+    }
+
+
+def record_completion(attempt: Attempt) -> None:
+    """Add a just-completed attempt to its user's curve for the procedure."""
+    if attempt.score_total is None:
+        return
+    with transaction.atomic():
+        curve, _ = LearningCurve.objects.select_for_update().get_or_create(
+            user_id=attempt.user_id, procedure_id=attempt.procedure_id
+        )
+        add_score(curve, attempt.score_total, attempt.ended_at)
+        curve.save()
+
+
+def rebuild_learning_curves(
+    user_ids: Iterable[int] | None = None, procedure_ids: Iterable[int] | None = None
+) -> int:
+    """Recompute the curves from the completed attempts; returns the number of curves written."""
+    attempts = Attempt.objects.filter(status=Attempt.Status.COMPLETED, score_total__isnull=False)
+    curves = LearningCurve.objects.all()
+    if user_ids is not None:
+        attempts = attempts.filter(user_id__in=list(user_ids))
+        curves = curves.filter(user_id__in=list(user_ids))
+    if procedure_ids is not None:
+        attempts = attempts.filter(procedure_id__in=list(procedure_ids))
+        curves = curves.filter(procedure_id__in=list(procedure_ids))
+
+    rebuilt: dict[tuple[int, int], LearningCurve] = {}
+    rows = attempts.order_by("ended_at", "id").values_list("user_id", "procedure_id", "score_total", "ended_at")
+    for user_id, procedure_id, score, ended_at in rows.iterator(chunk_size=2000):
+        curve = rebuilt.get((user_id, procedure_id))
+        if curve is None:
+            curve = rebuilt[(user_id, procedure_id)] = LearningCurve(user_id=user_id, procedure_id=procedure_id)
+        add_score(curve, score, ended_at)
+    with transaction.atomic():
+        curves.delete()
+        LearningCurve.objects.bulk_create(rebuilt.values(), batch_size=500)
+    return len(rebuilt)
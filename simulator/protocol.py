@@ -0,0 +1,150 @@
+"""Binary telemetry subprotocol for ``/ws/attempts/<id>/``.
+
+A binary frame is a ``<BBH`` header (protocol version, record kind, record
+count) followed by ``count`` fixed-width little-endian records of that kind.
+Clients that do not negotiate ``SUBPROTOCOL`` keep using JSON text frames.
+"""
+from __future__ import annotations
+
+import json
+import math
+import struct
+from typing import Any, Iterator
+
+SUBPROTOCOL = "smartsurgsim.telemetry.v1"
+VERSION = 1
+
+HEADER = struct.Struct("<BBH")
+
+KIND_MOVE = 1
+KIND_HIT = 2
+KIND_CONTACT = 3
+
+# t_ms, x, y, z, tool, screen_x, screen_y
+MOVE_RECORD = struct.Struct("<IfffBff")
+# t_ms, zone, x, y, z, severity, screen_x, screen_y
+HIT_RECORD = struct.Struct("<IBfffBff")
+# t_ms, zone, duration_ms
+CONTACT_RECORD = struct.Struct("<IBI")
+
+RECORDS = {
+    KIND_MOVE: ("move", MOVE_RECORD),
+    KIND_HIT: ("hit", HIT_RECORD),
+    KIND_CONTACT: ("contact_duration", CONTACT_RECORD),
+}
+
+# Code tables shared with static/js/app.js. Append only: codes are stored.
+TOOLS = ("", "SCALPEL", "FORCEPS", "NEEDLE_DRIVER", "CAUTERY")
+ZONES = ("", "target", "forbidden")
+SEVERITIES = ("", "low", "high")
+
+TOOL_CODES = {name: code for code, name in enumerate(TOOLS)}
+ZONE_CODES = {name: code for code, name in enumerate(ZONES)}
+SEVERITY_CODES = {name: code for code, name in enumerate(SEVERITIES)}
+
+
+class ProtocolError(ValueError):
+    pass
+
+
+def decode_frame(data: bytes) -> tuple[str, Iterator[tuple]]:
+    """Return the event type of a frame and an iterator over its raw record tuples."""
+    if len(data) < HEADER.size:
+        raise ProtocolError("Frame too short.")
+    version, kind, count = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ProtocolError(f"Unsupported protocol version {version}.")
+    if kind not in RECORDS:
+        raise ProtocolError(f"Unknown record kind {kind}.")
+    event_type, record = RECORDS[kind]
+    body = memoryview(data)[HEADER.size:]
+    if len(body) != count * record.size:
+        raise ProtocolError("Frame length does not match record count.")
+    return event_type, record.iter_unpack(body)
+
+
+def _non_finite_constant(name: str) -> float:
+    raise ProtocolError(f"Non-finite number {name} is not allowed.")
+
+
+def _finite_float(text: str) -> float:
+    value = float(text)
+    if not math.isfinite(value):
+        raise ProtocolError(f"Number {text} is out of range.")
+    return value
+
+
+def decode_text_frame(text: str) -> tuple[str, dict[str, Any], int]:
+    """Return ``(event_type, payload, timestamp_ms)`` of a JSON text frame.
+
+    ``NaN``, ``Infinity`` and numbers that overflow a float are rejected: the
+    payload could never be stored as JSON.
+    """
+    try:
+        message = json.loads(text, parse_constant=_non_finite_constant, parse_float=_finite_float)
+    except ProtocolError:
+        raise
+    except ValueError as exc:
+        raise ProtocolError("Frame is not valid JSON.") from exc
+    if not isinstance(message, dict):
+        raise ProtocolError("Frame must be a JSON object.")
+    event_type = message.get("event_type")
+    if not isinstance(event_type, str) or not 0 < len(event_type) <= 50:
+        raise ProtocolError("event_type must be a non-empty string of at most 50 characters.")
+    payload = message.get("payload", {})
+    if not isinstance(payload, dict):
+        raise ProtocolError("payload must be a JSON object.")
+    timestamp_ms = message.get("timestamp_ms", 0)
+    if not isinstance(timestamp_ms, int) or isinstance(timestamp_ms, bool):
+        raise ProtocolError("timestamp_ms must be an integer.")
+    return event_type, payload, timestamp_ms
+
+
+def encode_frame(event_type: str, records: list[tuple]) -> bytes:
+    kind = next(kind for kind, (name, _) in RECORDS.items() if name == event_type)
+    record = RECORDS[kind][1]
+    return HEADER.pack(VERSION, kind, len(records)) + b"".join(record.pack(*values) for values in records)
+
+
+def _screen(screen_x: float, screen_y: float) -> dict[str, float] | None:
+    """Both coordinates NaN means no screen position; otherwise both must be finite."""
+    if math.isnan(screen_x) and math.isnan(screen_y):
+        return None
+    if not (math.isfinite(screen_x) and math.isfinite(screen_y)):
+        raise ProtocolError("Screen position must be two finite numbers or two NaN.")
+    return {"x": screen_x, "y": screen_y}
+
+
+def _check_position(x: float, y: float, z: float) -> None:
+    if not (math.isfinite(x) and math.isfinite(y) and math.isfinite(z)):
+        raise ProtocolError("Positions must be finite numbers.")
+
+
+def record_payload(event_type: str, values: tuple) -> tuple[dict[str, Any], int]:
+    """Expand a raw record into the JSON payload stored on ``Event`` plus its timestamp.
+
+    Raises ``ProtocolError`` for NaN or infinite coordinates, which JSON cannot store.
+    """
+    if event_type == "move":
+        t_ms, x, y, z, tool, screen_x, screen_y = values
+        _check_position(x, y, z)
+        payload = {"x": x, "y": y, "z": z, "tool": _lookup(TOOLS, tool), "screen": _screen(screen_x, screen_y)}
+    elif event_type == "hit":
+        t_ms, zone, x, y, z, severity, screen_x, screen_y = values
+        _check_position(x, y, z)
+        payload = {
+            "zone": _lookup(ZONES, zone),
+            "x": x,
+            "y": y,
+            "z": z,
+            "severity": _lookup(SEVERITIES, severity),
+            "screen": _screen(screen_x, screen_y),
+        }
+    else:
+        t_ms, zone, duration_ms = values
+        payload = {"zone": _lookup(ZONES, zone), "duration_ms": duration_ms}
+    return payload, t_ms
+
+
+def _lookup(table: tuple[str, ...], code: int) -> str | None:
+    return (table[code] or None) if code < len(table) else None
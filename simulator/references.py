@@ -0,0 +1,212 @@
+"""Comparison of an attempt's instrument path with expert reference trajectories.
+
+A ``ReferenceTrajectory`` stores the positions of an expert attempt as
+``(t, x, y, z)`` float32 rows. Both paths are resampled on a uniform grid of
+``rate_hz`` (at most ``max_samples`` points) and aligned with dynamic time
+warping restricted to a Sakoe-Chiba band of ``band`` times the reference
+length around the diagonal.
+
+Each row of the band is solved with whole-array operations: with
+``A[j] = min(D[i-1, j-1], D[i-1, j])`` and ``S`` the running sum of the
+row's costs, ``D[i, j] = min(A[j], D[i, j-1]) + c[j]`` unrolls to
+``S[j] + min(A[k] - S[k-1] for k <= j)``, a cumulative minimum. Memory is
+a block of rows of costs plus two bytes per band cell for backtracking.
+"""
+from __future__ import annotations
+
+import math
+from typing import Any
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .kinematics import load_trajectory
+from .models import Attempt, Event, ReferenceTrajectory
+
+DEFAULT_SETTINGS = {"rate_hz": 5, "band": 0.1, "max_samples": 4000, "scale": 0.05}
+SAMPLE_DTYPE = np.dtype("<f4")
+
+# Rows whose costs are computed together; bounds the temporary (rows, band) arrays.
+DTW_BLOCK_ROWS = 256
+
+
+def pack_samples(t: np.ndarray, xyz: np.ndarray) -> bytes:
+    return np.column_stack([t, xyz]).astype(SAMPLE_DTYPE).tobytes()
+
+
+def unpack_samples(samples: bytes) -> tuple[np.ndarray, np.ndarray]:
+    rows = np.frombuffer(samples, dtype=SAMPLE_DTYPE).reshape(-1, 4).astype(np.float64)
+    return rows[:, 0], rows[:, 1:]
+
+
+def create_reference(attempt: Attempt, name: str = "") -> ReferenceTrajectory:
+    """Store the trajectory of an (expert) attempt as a reference of its procedure."""
+    t, xyz = load_trajectory(attempt.id)
+    if len(t) < 2:
+        raise ValueError("The attempt has no recorded trajectory")
+    return ReferenceTrajectory.objects.create(
+        procedure_id=attempt.procedure_id,
+        source_attempt=attempt,
+        name=name or f"Attempt {attempt.id}",
+        sample_count=len(t),
+        duration_ms=int(round((t[-1] - t[0]) * 1000)),
+        samples=pack_samples(t, xyz),
+    )
+
+
+def resample(t: np.ndarray, xyz: np.ndarray, rate_hz: float, max_samples: int) -> tuple[np.ndarray, np.ndarray]:
+    """Positions on a uniform time grid; the rate drops when the path would exceed ``max_samples``."""
+    if len(t) < 2 or t[-1] <= t[0]:
+        return t.copy(), xyz.copy()
+    count = min(int((t[-1] - t[0]) * rate_hz) + 1, max_samples)
+    grid = np.linspace(t[0], t[-1], max(count, 2))
+    return grid, np.column_stack([np.interp(grid, t, xyz[:, axis]) for axis in range(3)])
+
+
+def banded_dtw(path: np.ndarray, reference: np.ndarray, band: float) -> tuple[float, np.ndarray, np.ndarray]:
+    """Total cost and warping path (indices into both inputs) of two ``(n, 3)`` paths.
+
+    ``band`` is the half-width of the window as a share of the reference
+    length; it is widened when needed so every row can reach the next one.
+    Every row holds the same number of cells, so the previous row is read
+    through slices instead of index arrays.
+    """
+    n, m = len(path), len(reference)
+    if not n or not m:
+        raise ValueError("Both trajectories need at least one sample")
+    half_width = max(int(math.ceil(band * m)), int(math.ceil(m / n)) + 1)
+    width = min(2 * half_width + 1, m)
+    centres = np.rint(np.arange(n) * ((m - 1) / max(n - 1, 1))).astype(np.int64)
+    starts = np.clip(centres - half_width, 0, m - width)
+    shifts = np.diff(starts, prepend=0)
+    # Band rows of the reference are overlapping windows of each coordinate; float32
+    # halves the memory traffic of the cost blocks, the running sums stay float64.
+    windows = [
+        sliding_window_view(np.ascontiguousarray(reference[:, axis], dtype=np.float32), width) for axis in range(3)
+    ]
+    coordinates = np.ascontiguousarray(path.T, dtype=np.float32)
+    # Backtracking flags: the cell was reached from the left, or from above rather than diagonally.
+    from_left = np.zeros((n, width), dtype=bool)
+    from_up = np.zeros((n, width), dtype=bool)
+    from_left[0, 1:] = True
+    # Previous row behind one inf cell (diagonal of the first column) and followed by
+    # enough inf cells for the largest shift between rows.
+    previous = np.full(width + 1 + int(shifts.max()), np.inf)
+    row = np.empty(width)
+
+    for block_start in range(0, n, DTW_BLOCK_ROWS):
+        block_end = min(block_start + DTW_BLOCK_ROWS, n)
+        block_starts = starts[block_start:block_end]
+        costs = np.zeros((block_end - block_start, width), dtype=np.float32)
+        for axis in range(3):
+            offsets = windows[axis][block_starts]
+            offsets -= coordinates[axis, block_start:block_end, None]
+            offsets *= offsets
+            costs += offsets
+        np.sqrt(costs, out=costs)
+        totals = np.cumsum(costs, axis=1, dtype=np.float64)
+        preceding = totals - costs
+        for i in range(block_start, block_end):
+            if i == 0:
+                row = totals[0]
+            else:
+                shift = shifts[i]
+                up = previous[1 + shift : 1 + shift + width]
+                diagonal = previous[shift : shift + width]
+                best = np.minimum(up, diagonal)
+                row = np.minimum.accumulate(best - preceding[i - block_start]) + totals[i - block_start]
+                np.greater(diagonal, up, out=from_up[i])
+                np.less(row[:-1], best[1:], out=from_left[i, 1:])
+            previous[1 : 1 + width] = row
+
+    total = float(row[-1])
+    if not math.isfinite(total):
+        raise ValueError("The band does not connect both ends of the trajectories")
+    starts = starts.tolist()
+    path_i, path_j = [], []
+    i, j = n - 1, m - 1
+    while True:
+        path_i.append(i)
+        path_j.append(j)
+        if i == 0 and j == 0:
+            break
+        column = j - starts[i]
+        if from_left[i, column]:
+            j -= 1
+        elif from_up[i, column]:
+            i -= 1
+        else:
+            i -= 1
+            j -= 1
+    return total, np.array(path_i[::-1]), np.array(path_j[::-1])
+
+
+def _step_intervals(attempt_id: int) -> list[tuple[Any, float]]:
+    """``(step_id, end time in seconds)`` of each completed step, in completion order."""
+    return [
+        (payload.get("step_id"), timestamp_ms / 1000)
+        for timestamp_ms, payload in Event.objects.filter(attempt_id=attempt_id, event_type="step_completed")
+        .order_by("timestamp_ms", "id")
+        .values_list("timestamp_ms", "payload")
+        if isinstance(payload, dict) and isinstance(timestamp_ms, (int, float))
+    ]
+
+
+def compare_trajectory(
+    t: np.ndarray,
+    xyz: np.ndarray,
+    references: list[tuple[int, bytes]],
+    options: dict[str, Any] | None = None,
+    step_intervals: list[tuple[Any, float]] | None = None,
+) -> dict[str, Any] | None:
+    """Similarity to the closest reference, or None when there is nothing to compare.
+
+    ``distance`` is the mean distance between aligned samples; the
+    similarity subscore is ``100 * exp(-distance / scale)``. ``step_deviation``
+    is that mean per completed step, over the samples up to its completion.
+    """
+    options = {**DEFAULT_SETTINGS, **(options or {})}
+    if len(t) < 2:
+        return None
+    grid, path = resample(t, xyz, options["rate_hz"], options["max_samples"])
+    best = None
+    for reference_id, samples in references:
+        reference_t, reference_xyz = unpack_samples(samples)
+        if len(reference_t) < 2:
+            continue
+        _, reference_path = resample(reference_t, reference_xyz, options["rate_hz"], options["max_samples"])
+        _, path_i, path_j = banded_dtw(path, reference_path, options["band"])
+        distances = np.linalg.norm(path[path_i] - reference_path[path_j], axis=1)
+        distance = float(distances.mean())
+        if best is None or distance < best[1]:
+            best = (reference_id, distance, path_i, distances)
+    if best is None:
+        return None
+
+    reference_id, distance, path_i, distances = best
+    step_deviation = {}
+    started = -math.inf
+    times = grid[path_i]
+    for step_id, ended in step_intervals or []:
+        in_step = (times > started) & (times <= ended)
+        if in_step.any():
+            step_deviation[str(step_id)] = round(float(distances[in_step].mean()), 6)
+        started = ended
+    return {
+        "reference_id": reference_id,
+        "distance": round(distance, 6),
+        "similarity": round(100 * math.exp(-distance / options["scale"]), 2),
+        "step_deviation": step_deviation,
+    }
+
+
+def attempt_reference(
+    attempt_id: int, procedure_id: int, options: dict[str, Any], trajectory: tuple[np.ndarray, np.ndarray] | None = None
+) -> dict[str, Any] | None:
+    references = list(
+        ReferenceTrajectory.objects.filter(procedure_id=procedure_id).order_by("id").values_list("id", "samples")
+    )
+    if not references:
+        return None
+    t, xyz = trajectory if trajectory is not None else load_trajectory(attempt_id)
+    return compare_trajectory(t, xyz, references, options, _step_intervals(attempt_id))
@@ -0,0 +1,284 @@
+"""PDF reports of attempts, rendered once and kept on disk.
+
+The report only shows a few fields: the student, the procedure, the date,
+the score with its subscores and key metrics, and the feedback.
+``report_snapshot`` collects them from the attempt's stored fields, the
+same ones every other view shows (``rescore_attempts`` updates them after a
+rubric change), and ``report_hash`` hashes them together with
+``REPORT_TEMPLATE_VERSION``. The PDF of a completed attempt is stored as
+``<REPORT_ARTIFACT_DIR>/<attempt id>-<hash>.pdf``: the same content is never
+rendered twice, and a new hash replaces the older files of the attempt.
+Bump ``REPORT_TEMPLATE_VERSION`` whenever ``render_report_pdf`` changes.
+
+Completed attempts are rendered in the background when ``REPORT_PRERENDER``
+is on, or on the first download otherwise. Attempts still in progress are
+rendered in memory and never stored.
+
+``iter_report_archive`` streams a ZIP of many reports: entries are written
+as soon as their PDF is read from disk or rendered, missing PDFs are
+rendered in a process pool of ``REPORT_EXPORT_WORKERS`` (ReportLab holds the
+GIL), and at most a few PDFs per worker are held in memory at a time.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+import django
+from django.conf import settings
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from .background import run_after_commit
+from .models import Attempt
+
+REPORT_TEMPLATE_VERSION = "1"
+
+STYLES = {
+    "title": ParagraphStyle(name="title", fontSize=18, leading=22, textColor=colors.HexColor("#0F172A")),
+    "h2": ParagraphStyle(name="h2", fontSize=12, leading=14, textColor=colors.HexColor("#1E293B")),
+    "body": ParagraphStyle(name="body", fontSize=10, leading=12),
+}
+SCORE_TABLE_STYLE = TableStyle(
+    [
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#E2E8F0")),
+        ("TEXTCOLOR", (0, 0), (-1, 0), colors.HexColor("#0F172A")),
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.HexColor("#CBD5F5")),
+        ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
+    ]
+)
+METRICS_TABLE_STYLE = TableStyle(
+    [
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.HexColor("#CBD5F5")),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#E2E8F0")),
+    ]
+)
+SUBSCORES = ("precision", "efficiency", "safety", "protocol_adherence", "instrument_handling")
+METRICS = ("forbidden_contact_ms", "forceful_actions", "erratic_moves")
+
+
+def report_snapshot(attempt: Attempt) -> dict[str, Any]:
+    """Everything the report shows; ``attempt`` needs its user and procedure."""
+    subscores, breakdown = attempt.subscores or {}, attempt.score_breakdown or {}
+    return {
+        "username": attempt.user.username,
+        "procedure": attempt.procedure.name,
+        "date": str(attempt.ended_at or attempt.started_at),
+        "score_total": attempt.score_total or 0,
+        "subscores": {name: subscores.get(name, 0) for name in SUBSCORES},
+        "metrics": {name: breakdown.get(name, 0) for name in METRICS},
+        "feedback": list(attempt.feedback or []),
+    }
+
+
+def report_hash(snapshot: dict[str, Any]) -> str:
+    payload = json.dumps([REPORT_TEMPLATE_VERSION, snapshot], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def render_report_pdf(snapshot: dict[str, Any]) -> bytes:
+    subscores, metrics = snapshot["subscores"], snapshot["metrics"]
+    score_table = Table(
+        [
+            ["Score total", f"{snapshot['score_total']:.1f}"],
+            ["Precisión", subscores["precision"]],
+            ["Eficiencia", subscores["efficiency"]],
+            ["Seguridad", subscores["safety"]],
+            ["Adherencia", subscores["protocol_adherence"]],
+            ["Manejo instrumental", subscores["instrument_handling"]],
+        ],
+        hAlign="LEFT",
+        colWidths=[2.5 * inch, 1.5 * inch],
+    )
+    score_table.setStyle(SCORE_TABLE_STYLE)
+    metrics_table = Table(
+        [
+            ["Contacto zona prohibida (ms)", metrics["forbidden_contact_ms"]],
+            ["Acciones intensas", metrics["forceful_actions"]],
+            ["Movimientos erráticos", metrics["erratic_moves"]],
+        ],
+        hAlign="LEFT",
+        colWidths=[2.5 * inch, 1.5 * inch],
+    )
+    metrics_table.setStyle(METRICS_TABLE_STYLE)
+    feedback_text = "<br/>".join([f"• {item}" for item in snapshot["feedback"]]) or "Sin observaciones críticas."
+    elements = [
+        Paragraph("SmartSurgSim – Reporte Clínico Profesional", STYLES["title"]),
+        Spacer(1, 0.2 * inch),
+        Paragraph("Centro de Simulación Quirúrgica Inteligente", STYLES["body"]),
+        Spacer(1, 0.15 * inch),
+        Paragraph(f"Estudiante: {snapshot['username']}", STYLES["body"]),
+        Paragraph(f"Procedimiento: {snapshot['procedure']}", STYLES["body"]),
+        Paragraph(f"Fecha: {snapshot['date']}", STYLES["body"]),
+        Spacer(1, 0.2 * inch),
+        Paragraph("Resumen de desempeño", STYLES["h2"]),
+        score_table,
+        Spacer(1, 0.2 * inch),
+        Paragraph("Métricas clave", STYLES["h2"]),
+        metrics_table,
+        Spacer(1, 0.2 * inch),
+        Paragraph("Hallazgos principales", STYLES["h2"]),
+        Paragraph(feedback_text, STYLES["body"]),
+        Spacer(1, 0.25 * inch),
+        Paragraph("Recomendaciones", STYLES["h2"]),
+        Paragraph(
+            "Refuerza la técnica con práctica deliberada, priorizando seguridad y secuencia clínica.",
+            STYLES["body"],
+        ),
+        Spacer(1, 0.2 * inch),
+        Paragraph("Firma instructor: ____________________", STYLES["body"]),
+    ]
+    buffer = BytesIO()
+    SimpleDocTemplate(buffer, pagesize=letter, title="SmartSurgSim Report").build(elements)
+    return buffer.getvalue()
+
+
+def artifact_path(attempt_id: int, content_hash: str) -> Path:
+    return Path(settings.REPORT_ARTIFACT_DIR) / f"{attempt_id}-{content_hash}.pdf"
+
+
+def _write_artifact(path: Path, content: bytes) -> None:
+    """Write through a temporary file so readers never see a partial PDF."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=path.parent, prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "wb") as handle:
+            handle.write(content)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def _save_report(attempt_id: int, path: Path, content: bytes) -> None:
+    _write_artifact(path, content)
+    for stale in path.parent.glob(f"{attempt_id}-*.pdf"):
+        if stale != path:
+            stale.unlink(missing_ok=True)
+
+
+def store_report(attempt_id: int, snapshot: dict[str, Any], content_hash: str | None = None) -> Path:
+    """Path of the stored report for ``snapshot``, rendering it when no file matches its hash."""
+    path = artifact_path(attempt_id, content_hash or report_hash(snapshot))
+    if not path.exists():
+        _save_report(attempt_id, path, render_report_pdf(snapshot))
+    return path
+
+
+def _render_in_background(attempt_id: int) -> None:
+    attempt = Attempt.objects.select_related("procedure", "user").filter(id=attempt_id).first()
+    if attempt is not None and attempt.status == Attempt.Status.COMPLETED:
+        store_report(attempt.id, report_snapshot(attempt))
+
+
+def schedule_report_render(attempt_id: int) -> None:
+    """Store the report of a completed attempt once the current transaction commits."""
+    if settings.REPORT_PRERENDER:
+        run_after_commit("report-render", settings.REPORT_RENDER_WORKERS, _render_in_background, attempt_id)
+
+
+_render_pool: ProcessPoolExecutor | None = None
+_render_pool_lock = threading.Lock()
+
+
+def get_render_pool() -> ProcessPoolExecutor:
+    """Worker processes for export renders; spawned so they share no threads or connections with the server."""
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ProcessPoolExecutor(
+                max_workers=settings.REPORT_EXPORT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+        return _render_pool
+
+
+class _ArchiveBuffer:
+    """Write-only file for ``ZipFile``; without ``seek`` it writes entries sequentially."""
+
+    def __init__(self) -> None:
+        self._chunks: list[bytes] = []
+        self._offset = 0
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._offset
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _archive_name(attempt: Attempt) -> str:
+    return f"{get_valid_filename(attempt.user.username)}/report_attempt_{attempt.id}.pdf"
+
+
+def _report_contents(attempts: Iterable[Attempt]) -> Iterator[tuple[Attempt, bytes]]:
+    """``(attempt, pdf)`` in the order of ``attempts``, rendering missing reports in the pool."""
+    pool = get_render_pool() if settings.REPORT_EXPORT_WORKERS > 0 else None
+    window = 2 * max(settings.REPORT_EXPORT_WORKERS, 1)
+    pending: deque[tuple[Attempt, Path, Future | None]] = deque()
+
+    def finish(attempt: Attempt, path: Path, future: Future | None) -> tuple[Attempt, bytes]:
+        if future is None:
+            try:
+                return attempt, path.read_bytes()
+            except FileNotFoundError:
+                # Replaced by a newer render since it was looked up.
+                return attempt, store_report(attempt.id, report_snapshot(attempt)).read_bytes()
+        content = future.result()
+        _save_report(attempt.id, path, content)
+        return attempt, content
+
+    for attempt in attempts:
+        snapshot = report_snapshot(attempt)
+        path = artifact_path(attempt.id, report_hash(snapshot))
+        if path.exists():
+            future = None
+        elif pool is not None:
+            future = pool.submit(render_report_pdf, snapshot)
+        else:
+            future = Future()
+            future.set_result(render_report_pdf(snapshot))
+        pending.append((attempt, path, future))
+        while len(pending) >= window:
+            yield finish(*pending.popleft())
+    while pending:
+        yield finish(*pending.popleft())
+
+
+def iter_report_archive(attempts: Iterable[Attempt]) -> Iterator[bytes]:
+    """Chunks of a ZIP with the report of each completed attempt (with user and procedure loaded)."""
+    buffer = _ArchiveBuffer()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for attempt, content in _report_contents(attempts):
+            completed = timezone.localtime(attempt.ended_at or attempt.started_at)
+            entry = zipfile.ZipInfo(_archive_name(attempt), completed.timetuple()[:6])
+            entry.external_attr = 0o644 << 16
+            archive.writestr(entry, content, compress_type=zipfile.ZIP_DEFLATED, compresslevel=1)
+            yield buffer.drain()
+    yield buffer.drain()
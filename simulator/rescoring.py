@@ -0,0 +1,155 @@
+"""Batch rescoring of stored attempts.
+
+Events of a batch of attempts are streamed in one ordered query and turned
+into column arrays (attempt position, event kind, forbidden contact time,
+forceful flag); the plain counters of every attempt come out of one
+``np.bincount`` per column. Only step completions, tool selections and
+actions go through an ``IncrementalScorer``, since ``wrong_instrument``
+depends on their order. Rows the scorer ignores (non-object payloads,
+non-numeric intensities) are ignored here too; attempts with fractional
+contact times are rescored with ``evaluate_attempt`` instead, since float
+sums depend on the order they are added in. Results always match
+``evaluate_attempt``. Attempts whose score cache entry is still valid are
+not read at all.
+"""
+from __future__ import annotations
+
+from typing import Any, Iterable
+
+import numpy as np
+from django.db.models import Sum
+
+from .models import Attempt, Event, TrajectoryChunk
+from .plans import get_compiled_procedure
+from .score_cache import cached_results, fingerprints, store_results
+from .scoring import IncrementalScorer, ScoreResult, attempt_motion, evaluate_attempt
+from .zones import is_client_zone_event
+
+OTHER, MOVE, FORBIDDEN_HIT, TARGET_HIT, ERROR, FORBIDDEN_CONTACT, ACTION = range(7)
+ORDERED_EVENT_TYPES = {"step_completed", "tool_select", "action"}
+
+
+def _classify(event_type: str, payload: Any) -> tuple[int, int, bool] | None:
+    """``(kind, contact_ms, forceful)`` of a row, or None when it needs the exact scan."""
+    if event_type == "move":
+        return MOVE, 0, False
+    if not isinstance(payload, dict) or is_client_zone_event(event_type, payload):
+        return OTHER, 0, False
+    if event_type == "hit":
+        zone = payload.get("zone")
+        return (FORBIDDEN_HIT if zone == "forbidden" else TARGET_HIT if zone == "target" else OTHER), 0, False
+    if event_type == "error":
+        return ERROR, 0, False
+    if event_type == "contact_duration":
+        if payload.get("zone") != "forbidden":
+            return OTHER, 0, False
+        duration_ms = payload.get("duration_ms", 0)
+        if isinstance(duration_ms, float):
+            return None
+        return (FORBIDDEN_CONTACT, duration_ms, False) if isinstance(duration_ms, int) else (OTHER, 0, False)
+    if event_type == "action":
+        intensity = payload.get("intensity", 0)
+        if not isinstance(intensity, (int, float)):
+            return OTHER, 0, False
+        return ACTION, 0, intensity >= 8
+    return OTHER, 0, False
+
+
+def rescore_batch(
+    attempt_ids: list[int], chunk_size: int = 5000, use_cache: bool = True, update_cache: bool = True
+) -> tuple[list[tuple[int, ScoreResult]], int]:
+    """Score a batch of attempts; returns ``(attempt_id, result)`` pairs and the number of rows read.
+
+    New results are written to the score cache unless ``update_cache`` is false (dry runs).
+    """
+    attempts = {
+        attempt.id: attempt
+        for attempt in Attempt.objects.filter(id__in=attempt_ids).select_related("procedure").only(
+            "id", "duration_seconds", "procedure"
+        )
+    }
+    fingerprints_by_id = fingerprints(attempts.values()) if use_cache else {}
+    cached = cached_results(fingerprints_by_id) if use_cache else {}
+    ids = sorted(set(attempts) - set(cached))
+    position_of = {attempt_id: position for position, attempt_id in enumerate(ids)}
+    positions: list[int] = []
+    kinds: list[int] = []
+    contact_ms: list[int] = []
+    forceful: list[bool] = []
+    scorers = [IncrementalScorer() for _ in ids]
+    inexact: set[int] = set()
+    read = 0
+
+    rows = (
+        Event.objects.filter(attempt_id__in=ids)
+        .order_by("attempt_id", "timestamp_ms", "id")
+        .values_list("attempt_id", "event_type", "timestamp_ms", "payload")
+        .iterator(chunk_size=chunk_size)
+    )
+    for attempt_id, event_type, timestamp_ms, payload in rows:
+        read += 1
+        position = position_of[attempt_id]
+        if position in inexact:
+            continue
+        columns = _classify(event_type, payload)
+        if columns is None:
+            inexact.add(position)
+            continue
+        positions.append(position)
+        kinds.append(columns[0])
+        contact_ms.append(columns[1])
+        forceful.append(columns[2])
+        if event_type in ORDERED_EVENT_TYPES:
+            scorers[position].feed(event_type, payload, timestamp_ms)
+
+    position_array = np.array(positions, dtype=np.int64)
+    kind_array = np.array(kinds, dtype=np.int8)
+    size = len(ids)
+
+    def count(kind: int) -> np.ndarray:
+        return np.bincount(position_array[kind_array == kind], minlength=size)
+
+    forbidden_hits = count(FORBIDDEN_HIT)
+    target_hits = count(TARGET_HIT)
+    wrong_actions = count(ERROR)
+    move_counts = count(MOVE)
+    forceful_actions = np.bincount(position_array[np.array(forceful, dtype=bool)], minlength=size)
+    contact = np.bincount(position_array, weights=np.array(contact_ms, dtype=np.int64), minlength=size)
+    for attempt_id, samples in (
+        TrajectoryChunk.objects.filter(attempt_id__in=ids)
+        .values("attempt_id")
+        .annotate(samples=Sum("sample_count"))
+        .values_list("attempt_id", "samples")
+    ):
+        move_counts[position_of[attempt_id]] += samples
+
+    results = {}
+    for position, attempt_id in enumerate(ids):
+        attempt = attempts[attempt_id]
+        if position in inexact:
+            results[attempt_id] = evaluate_attempt(attempt, mode="stream")
+            continue
+        scorer = scorers[position]
+        scorer.forbidden_hits = int(forbidden_hits[position])
+        scorer.target_hits = int(target_hits[position])
+        scorer.wrong_actions = int(wrong_actions[position])
+        scorer.forbidden_contact_ms = int(contact[position])
+        scorer.forceful_actions = int(forceful_actions[position])
+        scorer.move_count = int(move_counts[position])
+        plan = get_compiled_procedure(attempt.procedure)
+        motion, reference = attempt_motion(attempt_id, plan)
+        results[attempt_id] = scorer.result(plan, attempt.duration_seconds or 0, motion=motion, reference=reference)
+    if use_cache and update_cache and results:
+        store_results(fingerprints_by_id, results)
+    return sorted({**cached, **results}.items()), read
+
+
+def batched(values: Iterable[int], size: int) -> Iterable[list[int]]:
+    batch: list[int] = []
+    for value in values:
+        batch.append(value)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -0,0 +1,186 @@
+"""Daily score rollups per procedure and per specialty.
+
+``ProcedureDailyStats`` and ``SpecialtyDailyStats`` hold, for the scored
+attempts completed on one day (in ``TIME_ZONE``), their number, the sum and
+sum of squares of their scores, the lowest and highest score and the sum of
+each subscore. These merge by addition, so a range of days grouped by day,
+week or month is read from the rows of that range alone, however many
+attempts they stand for: mean = sum / n, sample variance =
+(sum_sq - sum**2 / n) / (n - 1).
+
+``record_attempt`` adds an attempt as it completes; ``rebuild_rollups``
+recomputes a range of days from the attempts (``rebuild_rollups`` command,
+and ``rescore_attempts`` after scores change). Attempts count under the
+specialty their procedure had when they were added.
+"""
+from __future__ import annotations
+
+import datetime
+import math
+from typing import Any
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Attempt, DailyScoreStats, ProcedureDailyStats, SpecialtyDailyStats
+
+GRANULARITIES = ("day", "week", "month")
+GROUPS = {"procedure": ProcedureDailyStats, "specialty": SpecialtyDailyStats}
+
+
+def add_score(row: DailyScoreStats, score: float, subscores: dict[str, Any] | None) -> None:
+    row.attempts += 1
+    row.score_sum += score
+    row.score_sq_sum += score * score
+    row.score_min = score if row.score_min is None else min(row.score_min, score)
+    row.score_max = score if row.score_max is None else max(row.score_max, score)
+    sums, counts = dict(row.subscore_sums), dict(row.subscore_counts)
+    for name, value in (subscores or {}).items():
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            sums[name] = sums.get(name, 0) + value
+            counts[name] = counts.get(name, 0) + 1
+    row.subscore_sums, row.subscore_counts = sums, counts
+
+
+def _locked_row(model: type[DailyScoreStats], **key: Any) -> DailyScoreStats:
+    # Creating with ignore_conflicts first means concurrent completions of the same day never collide on insert.
+    model.objects.bulk_create([model(**key)], ignore_conflicts=True)
+    return model.objects.select_for_update().get(**key)
+
+
+def record_attempt(attempt: Attempt) -> None:
+    """Add a just-completed attempt (with its procedure loaded) to the rollups of its day."""
+    if attempt.score_total is None or attempt.ended_at is None:
+        return
+    day = timezone.localdate(attempt.ended_at)
+    with transaction.atomic():
+        # Always procedure before specialty, so concurrent completions lock in the same order.
+        for row in (
+            _locked_row(ProcedureDailyStats, procedure_id=attempt.procedure_id, day=day),
+            _locked_row(SpecialtyDailyStats, specialty=attempt.procedure.specialty, day=day),
+        ):
+            add_score(row, attempt.score_total, attempt.subscores)
+            row.save()
+
+
+def rebuild_rollups(since: datetime.date | None = None, until: datetime.date | None = None) -> int:
+    """Recompute the rollups of the days between ``since`` and ``until`` (inclusive); returns the rows written."""
+    attempts = Attempt.objects.filter(
+        status=Attempt.Status.COMPLETED, score_total__isnull=False, ended_at__isnull=False
+    )
+    procedure_rows, specialty_rows = ProcedureDailyStats.objects.all(), SpecialtyDailyStats.objects.all()
+    if since is not None:
+        attempts = attempts.filter(ended_at__date__gte=since)
+        procedure_rows, specialty_rows = procedure_rows.filter(day__gte=since), specialty_rows.filter(day__gte=since)
+    if until is not None:
+        attempts = attempts.filter(ended_at__date__lte=until)
+        procedure_rows, specialty_rows = procedure_rows.filter(day__lte=until), specialty_rows.filter(day__lte=until)
+
+    by_procedure: dict[tuple[int, datetime.date], ProcedureDailyStats] = {}
+    by_specialty: dict[tuple[str, datetime.date], SpecialtyDailyStats] = {}
+    rows = attempts.values_list("procedure_id", "procedure__specialty", "ended_at", "score_total", "subscores")
+    for procedure_id, specialty, ended_at, score, subscores in rows.iterator(chunk_size=2000):
+        day = timezone.localdate(ended_at)
+        procedure_row = by_procedure.get((procedure_id, day))
+        if procedure_row is None:
+            procedure_row = by_procedure[(procedure_id, day)] = ProcedureDailyStats(procedure_id=procedure_id, day=day)
+        specialty_row = by_specialty.get((specialty, day))
+        if specialty_row is None:
+            specialty_row = by_specialty[(specialty, day)] = SpecialtyDailyStats(specialty=specialty, day=day)
+        add_score(procedure_row, score, subscores)
+        add_score(specialty_row, score, subscores)
+    with transaction.atomic():
+        procedure_rows.delete()
+        specialty_rows.delete()
+        ProcedureDailyStats.objects.bulk_create(by_procedure.values(), batch_size=500)
+        SpecialtyDailyStats.objects.bulk_create(by_specialty.values(), batch_size=500)
+    return len(by_procedure) + len(by_specialty)
+
+
+def period_start(day: datetime.date, granularity: str) -> datetime.date:
+    if granularity == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+class _Totals:
+    """Sums of several rollup rows."""
+
+    def __init__(self) -> None:
+        self.attempts = 0
+        self.score_sum = self.score_sq_sum = 0.0
+        self.score_min = self.score_max = None
+        self.subscore_sums: dict[str, float] = {}
+        self.subscore_counts: dict[str, int] = {}
+
+    def add(self, attempts, score_sum, score_sq_sum, score_min, score_max, subscore_sums, subscore_counts) -> None:
+        self.attempts += attempts
+        self.score_sum += score_sum
+        self.score_sq_sum += score_sq_sum
+        if score_min is not None:
+            self.score_min = score_min if self.score_min is None else min(self.score_min, score_min)
+        if score_max is not None:
+            self.score_max = score_max if self.score_max is None else max(self.score_max, score_max)
+        for name, value in subscore_sums.items():
+            self.subscore_sums[name] = self.subscore_sums.get(name, 0) + value
+            self.subscore_counts[name] = self.subscore_counts.get(name, 0) + subscore_counts.get(name, 0)
+
+    def summary(self) -> dict[str, Any]:
+        count = self.attempts
+        mean = self.score_sum / count if count else None
+        variance = max(self.score_sq_sum - self.score_sum**2 / count, 0) / (count - 1) if count > 1 else 0.0
+        return {
+            "attempts": count,
+            "mean": round(mean, 4) if mean is not None else None,
+            "std": round(math.sqrt(variance), 4),
+            "min": self.score_min,
+            "max": self.score_max,
+            "subscores": {
+                name: round(self.subscore_sums[name] / self.subscore_counts[name], 4)
+                for name in sorted(self.subscore_sums)
+                if self.subscore_counts.get(name)
+            },
+        }
+
+
+STAT_FIELDS = ("attempts", "score_sum", "score_sq_sum", "score_min", "score_max", "subscore_sums", "subscore_counts")
+
+
+def score_rollups(
+    group: str = "procedure",
+    granularity: str | None = None,
+    since: datetime.date | None = None,
+    until: datetime.date | None = None,
+    keys: list[Any] | None = None,
+) -> list[dict[str, Any]]:
+    """Per procedure (``key`` id) or specialty: totals over the range and, with a ``granularity``, per period."""
+    rows = GROUPS[group].objects.all()
+    if since is not None:
+        rows = rows.filter(day__gte=since)
+    if until is not None:
+        rows = rows.filter(day__lte=until)
+    if keys:
+        rows = rows.filter(**{f"{group}__in": keys})
+    key_fields = ("procedure_id", "procedure__name") if group == "procedure" else ("specialty", "specialty")
+
+    series: dict[Any, dict[str, Any]] = {}
+    for key, label, day, *stats in rows.order_by(key_fields[0], "day").values_list(*key_fields, "day", *STAT_FIELDS):
+        entry = series.get(key)
+        if entry is None:
+            entry = series[key] = {"key": key, "label": label, "total": _Totals(), "periods": {}}
+        entry["total"].add(*stats)
+        if granularity is not None:
+            start = period_start(day, granularity)
+            entry["periods"].setdefault(start, _Totals()).add(*stats)
+
+    result = []
+    for entry in series.values():
+        item = {"key": entry["key"], "label": entry["label"], **entry["total"].summary()}
+        if granularity is not None:
+            item["periods"] = [
+                {"period": start.isoformat(), **totals.summary()} for start, totals in entry["periods"].items()
+            ]
+        result.append(item)
+    return result
@@ -0,0 +1,134 @@
+"""Stored scores keyed by a fingerprint of their inputs.
+
+A score only depends on the attempt's events and duration and on the
+procedure's steps and rubric. The fingerprint hashes the number and highest
+id of the attempt's ``Event`` rows and packed move samples, the duration,
+the compiled plan's ``scoring_hash`` and the algorithm version, plus the
+procedure's reference trajectories when the rubric compares against them.
+``rescore_attempts`` reuses the stored ``ScoreResult`` while the fingerprint
+matches and recomputes it otherwise; completing an attempt scores it from its
+live state and does not use the cache. Saving an existing event keeps the
+count and highest id, so it drops the entry instead; ``QuerySet.update()``
+on events does not.
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+from dataclasses import asdict
+from typing import Any, Iterable
+
+from django.db.models import Count, Max, Sum
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import Attempt, Event, ReferenceTrajectory, ScoreCacheEntry, TrajectoryChunk
+from .plans import get_compiled_procedure
+from .scoring import ScoreResult
+
+
+class ScoreCacheStats:
+    """Process-wide hit and miss counters, exposed through the metrics API."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    def record(self, hits: int = 0, misses: int = 0) -> None:
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0,
+            }
+
+
+score_cache_stats = ScoreCacheStats()
+
+
+def fingerprints(attempts: Iterable[Attempt]) -> dict[int, str]:
+    """Fingerprints of several attempts (with their procedure loaded) in two or three queries."""
+    attempts = list(attempts)
+    ids = [attempt.id for attempt in attempts]
+    events = {
+        row["attempt_id"]: (row["count"], row["last_id"])
+        for row in Event.objects.filter(attempt_id__in=ids)
+        .values("attempt_id")
+        .annotate(count=Count("id"), last_id=Max("id"))
+        .order_by()
+    }
+    samples = {
+        row["attempt_id"]: (row["samples"], row["last_id"])
+        for row in TrajectoryChunk.objects.filter(attempt_id__in=ids)
+        .values("attempt_id")
+        .annotate(samples=Sum("sample_count"), last_id=Max("id"))
+        .order_by()
+    }
+    plans = {attempt.id: get_compiled_procedure(attempt.procedure) for attempt in attempts}
+    compared = {plan.procedure_id for plan in plans.values() if plan.reference is not None}
+    references = {}
+    if compared:
+        references = {
+            row["procedure_id"]: (row["count"], row["last_id"])
+            for row in ReferenceTrajectory.objects.filter(procedure_id__in=compared)
+            .values("procedure_id")
+            .annotate(count=Count("id"), last_id=Max("id"))
+            .order_by()
+        }
+    result = {}
+    for attempt in attempts:
+        plan = plans[attempt.id]
+        key = (
+            *events.get(attempt.id, (0, None)),
+            *samples.get(attempt.id, (0, None)),
+            attempt.duration_seconds or 0,
+            plan.scoring_hash,
+            plan.algorithm_version,
+        )
+        if plan.reference is not None:
+            key += references.get(plan.procedure_id, (0, None))
+        result[attempt.id] = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+    return result
+
+
+def cached_results(fingerprints_by_id: dict[int, str]) -> dict[int, ScoreResult]:
+    """Stored results whose fingerprint still matches; updates the hit and miss counters."""
+    stored = ScoreCacheEntry.objects.filter(attempt_id__in=list(fingerprints_by_id)).values_list(
+        "attempt_id", "fingerprint", "result"
+    )
+    results = {
+        attempt_id: ScoreResult(**result)
+        for attempt_id, fingerprint, result in stored
+        if fingerprint == fingerprints_by_id[attempt_id]
+    }
+    score_cache_stats.record(hits=len(results), misses=len(fingerprints_by_id) - len(results))
+    return results
+
+
+def store_results(fingerprints_by_id: dict[int, str], results: dict[int, ScoreResult]) -> None:
+    ScoreCacheEntry.objects.bulk_create(
+        [
+            ScoreCacheEntry(attempt_id=attempt_id, fingerprint=fingerprints_by_id[attempt_id], result=asdict(result))
+            for attempt_id, result in results.items()
+        ],
+        update_conflicts=True,
+        unique_fields=["attempt"],
+        update_fields=["fingerprint", "result", "updated_at"],
+    )
+
+
+@receiver(post_save, sender=Event)
+def _invalidate_edited_event(sender, instance, created, **kwargs):
+    if not created:
+        ScoreCacheEntry.objects.filter(attempt_id=instance.attempt_id).delete()
@@ -1,9 +1,23 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
 from typing import Any
 
-from .models import Attempt
+from django.conf import settings
+from django.db.models import Count, FloatField, Q, Sum
+from django.db.models.fields.json import KeyTextTransform
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .kinematics import METRICS as KINEMATIC_METRICS
+from .kinematics import compute_kinematics, load_trajectory, motion_quality
+from .models import Attempt, Event, TrajectoryChunk
+from .plans import CompiledProcedure, contains, get_compiled_procedure
+from .references import attempt_reference
+from .zones import CLIENT_SOURCE, is_client_zone_event
+
+LIVE_STATE_VERSION = 1
+ORDERED_EVENT_TYPES = {"tool_select", "action"}
 
 
 @dataclass
@@ -19,70 +33,149 @@ def _clamp(value: float, minimum: float = 0, maximum: float = 100) -> float:
     return max(minimum, min(maximum, value))
 
 
-def evaluate_attempt(attempt: Attempt) -> ScoreResult:
-    procedure = attempt.procedure
-    rubric: dict[str, Any] = procedure.rubric or {}
-    penalties = rubric.get("penalties", {})
-    expected_time = rubric.get("expected_time_seconds", 180)
+def evaluate_attempt(
+    attempt: Attempt, mode: str | None = None, plan: CompiledProcedure | None = None
+) -> ScoreResult:
+    """Score an attempt from its stored events.
 
-    events = list(attempt.events.all().order_by("timestamp_ms"))
-    forbidden_hits = sum(
-        1
-        for event in events
-        if event.event_type == "hit" and event.payload.get("zone") == "forbidden"
-    )
-    target_hits = sum(
-        1
-        for event in events
-        if event.event_type == "hit" and event.payload.get("zone") == "target"
-    )
-    wrong_actions = sum(1 for event in events if event.event_type == "error")
-    forbidden_contact_ms = sum(
-        event.payload.get("duration_ms", 0)
-        for event in events
-        if event.event_type == "contact_duration" and event.payload.get("zone") == "forbidden"
-    )
-    forceful_actions = sum(
-        1
-        for event in events
-        if event.event_type == "action" and event.payload.get("intensity", 0) >= 8
+    ``mode`` (default ``SCORING_MODE``) is ``"stream"`` for one pass over
+    the events or ``"aggregate"`` for SQL conditional aggregation. Both give
+    the same result. ``plan`` replaces the procedure's cached plan, e.g. to
+    score with a candidate rubric.
+    """
+    mode = mode or settings.SCORING_MODE
+    plan = plan or get_compiled_procedure(attempt.procedure)
+    if mode == "aggregate":
+        return _evaluate_aggregate(attempt, plan)
+    if mode != "stream":
+        raise ValueError(f"Unknown scoring mode: {mode}")
+    return _evaluate_stream(attempt, plan)
+
+
+def _evaluate_stream(attempt: Attempt, plan: CompiledProcedure) -> ScoreResult:
+    """One pass over the stored events.
+
+    ``Event`` rows are streamed as ``(event_type, timestamp_ms, payload)``
+    tuples through an ``IncrementalScorer``; packed move samples only count
+    towards erratic moves, so their chunks are summed in SQL instead of
+    decoded. Memory use does not grow with the length of the attempt.
+    """
+    scorer = IncrementalScorer()
+    rows = (
+        Event.objects.filter(attempt_id=attempt.id)
+        .order_by("timestamp_ms", "id")
+        .values_list("event_type", "timestamp_ms", "payload")
+        .iterator(chunk_size=2000)
     )
+    for event_type, timestamp_ms, payload in rows:
+        scorer.feed(event_type, payload, timestamp_ms)
+    scorer.move_count += _packed_move_count(attempt.id)
+    motion, reference = attempt_motion(attempt.id, plan)
+    return scorer.result(plan, attempt.duration_seconds or 0, motion=motion, reference=reference)
+
+
+def _step_completed(step_id: Any) -> Q:
+    completed = Q(event_type="step_completed")
+    if step_id is None:
+        # payload.get("step_id") is None for a JSON null as well as a missing key.
+        return completed & (Q(payload__step_id=None) | ~Q(payload__has_key="step_id"))
+    return completed & Q(payload__step_id=step_id)
+
 
-    completed_steps = {
-        event.payload.get("step_id")
-        for event in events
-        if event.event_type == "step_completed"
+def _evaluate_aggregate(attempt: Attempt, plan: CompiledProcedure) -> ScoreResult:
+    """Counters from one conditional aggregate query; only actions and tool selections reach Python.
+
+    Step completion is counted per procedure step, so the set of completed
+    steps is known without fetching ``step_completed`` rows. Actions and tool
+    selections are fetched only when the first pending step expects specific
+    instruments, since ``wrong_instrument`` depends on their order.
+    """
+    events = Event.objects.filter(attempt_id=attempt.id)
+    # Client-reported zone events kept for audit; a missing key does not match a negated lookup.
+    scored = Q(payload__source__isnull=True) | ~Q(payload__source=CLIENT_SOURCE)
+    hit = Q(event_type="hit") & scored
+    aggregates = {
+        "forbidden_hits": Count("id", filter=hit & Q(payload__zone="forbidden")),
+        "target_hits": Count("id", filter=hit & Q(payload__zone="target")),
+        "wrong_actions": Count("id", filter=Q(event_type="error")),
+        "forbidden_contact_ms": Sum(
+            Cast(KeyTextTransform("duration_ms", "payload"), FloatField()),
+            filter=Q(event_type="contact_duration", payload__zone="forbidden") & scored,
+        ),
+        "forceful_actions": Count("id", filter=Q(event_type="action", payload__intensity__gte=8)),
+        "move_count": Count("id", filter=Q(event_type="move")),
     }
-    total_steps = max(len(procedure.steps), 1)
-    steps_completed_count = len([step for step in procedure.steps if step.get("id") in completed_steps])
-    steps_omitted = max(total_steps - steps_completed_count, 0)
+    for position, step_id in enumerate(plan.step_ids):
+        aggregates[f"step_{position}"] = Count("id", filter=_step_completed(step_id))
+    counts = events.aggregate(**aggregates)
 
-    duration_seconds = attempt.duration_seconds or 0
-    time_over = max(duration_seconds - expected_time, 0)
+    completed_steps = {step_id for position, step_id in enumerate(plan.step_ids) if counts.pop(f"step_{position}")}
+    contact_ms = counts["forbidden_contact_ms"] or 0
+    counts["forbidden_contact_ms"] = int(contact_ms) if float(contact_ms).is_integer() else contact_ms
+    counts["move_count"] += _packed_move_count(attempt.id)
+
+    scorer = IncrementalScorer()
+    scorer.completed_steps = completed_steps
+    if plan.expected_tools(completed_steps):
+        rows = (
+            events.filter(event_type__in=ORDERED_EVENT_TYPES)
+            .order_by("timestamp_ms", "id")
+            .values_list("event_type", "timestamp_ms", "payload")
+            .iterator(chunk_size=2000)
+        )
+        for event_type, timestamp_ms, payload in rows:
+            scorer.feed(event_type, payload, timestamp_ms)
+    motion, reference = attempt_motion(attempt.id, plan)
+    return _build_result(
+        plan,
+        attempt.duration_seconds or 0,
+        completed_steps=completed_steps,
+        wrong_instrument=scorer.wrong_instrument(plan),
+        motion=motion,
+        reference=reference,
+        **counts,
+    )
 
-    tool_selects = [event for event in events if event.event_type == "tool_select"]
-    actions = [event for event in events if event.event_type == "action"]
-    move_events = [event for event in events if event.event_type == "move"]
-    current_tool = tool_selects[-1].payload.get("tool") if tool_selects else None
-    wrong_instrument = 0
-    for event in actions:
-        expected_tools = _expected_tools_for_step(procedure.steps, completed_steps)
-        tool_used = event.payload.get("tool") or current_tool
-        if expected_tools and tool_used not in expected_tools:
-            wrong_instrument += 1
-        current_tool = tool_used or current_tool
 
-    erratic_moves = max(len(move_events) - (duration_seconds * 6), 0)
+def _build_result(
+    plan: CompiledProcedure,
+    duration_seconds: int,
+    *,
+    forbidden_hits: int,
+    target_hits: int,
+    wrong_actions: int,
+    forbidden_contact_ms: float,
+    forceful_actions: int,
+    completed_steps: set,
+    wrong_instrument: int,
+    move_count: int,
+    motion: dict[str, Any] | None = None,
+    reference: dict[str, Any] | None = None,
+) -> ScoreResult:
+    penalties = plan.penalties
+    expected_time = plan.expected_time
+
+    total_steps = plan.total_steps
+    steps_completed_count = plan.completed_count(completed_steps)
+    steps_omitted = max(total_steps - steps_completed_count, 0)
+
+    time_over = max(duration_seconds - expected_time, 0)
+    erratic_moves = max(move_count - (duration_seconds * 6), 0)
 
     total_penalty = 0
-    total_penalty += forbidden_hits * penalties.get("forbidden_hit", 6)
-    total_penalty += wrong_actions * penalties.get("wrong_action", 4)
-    total_penalty += steps_omitted * penalties.get("step_omitted", 5)
-    total_penalty += (time_over / 10) * penalties.get("time_over", 1)
-    total_penalty += wrong_instrument * penalties.get("wrong_instrument", 4)
-    total_penalty += (erratic_moves / 10) * penalties.get("erratic_move", 1)
-    total_penalty += (forbidden_contact_ms / 1000) * penalties.get("forbidden_contact", 2)
-    total_penalty += forceful_actions * penalties.get("forceful_action", 2)
+    total_penalty += forbidden_hits * penalties.forbidden_hit
+    total_penalty += wrong_actions * penalties.wrong_action
+    total_penalty += steps_omitted * penalties.step_omitted
+    total_penalty += (time_over / 10) * penalties.time_over
+    total_penalty += wrong_instrument * penalties.wrong_instrument
+    total_penalty += (erratic_moves / 10) * penalties.erratic_move
+    total_penalty += (forbidden_contact_ms / 1000) * penalties.forbidden_contact
+    total_penalty += forceful_actions * penalties.forceful_action
+    if motion is not None:
+        motion_score = motion_quality(motion, duration_seconds)
+        total_penalty += ((100 - motion_score) / 10) * penalties.poor_motion
+    if reference is not None:
+        total_penalty += ((100 - reference["similarity"]) / 10) * penalties.reference_deviation
 
     total_score = _clamp(100 - total_penalty)
 
@@ -111,36 +204,232 @@ def evaluate_attempt(attempt: Attempt) -> ScoreResult:
         feedback.append("Modera la intensidad de las acciones para evitar trauma tisular.")
     if erratic_moves:
         feedback.append("Reduce movimientos erráticos para mejorar la estabilidad manual.")
+    if motion is not None and motion["tremor_ratio"] > 0.25:
+        feedback.append("Estabiliza la mano: se detecta temblor en el instrumento.")
+    if reference is not None and reference["similarity"] < 50:
+        feedback.append("Acerca tu trayectoria a la del experto de referencia en los pasos con más desviación.")
     if not feedback:
         feedback.append("Excelente trabajo: desempeño consistente en precisión y seguridad.")
 
+    subscores = {
+        "precision": precision,
+        "efficiency": efficiency,
+        "safety": safety,
+        "protocol_adherence": protocol,
+        "instrument_handling": instrument_handling,
+    }
+    breakdown = {
+        "forbidden_hits": forbidden_hits,
+        "target_hits": target_hits,
+        "wrong_actions": wrong_actions,
+        "forbidden_contact_ms": forbidden_contact_ms,
+        "forceful_actions": forceful_actions,
+        "steps_omitted": steps_omitted,
+        "time_over_seconds": time_over,
+        "wrong_instrument": wrong_instrument,
+        "erratic_moves": erratic_moves,
+    }
+    if motion is not None:
+        subscores["motion_quality"] = motion_score
+        breakdown.update((name, motion[name]) for name in KINEMATIC_METRICS if name != "samples")
+    if reference is not None:
+        subscores["reference_similarity"] = reference["similarity"]
+        breakdown["reference_id"] = reference["reference_id"]
+        breakdown["reference_distance"] = reference["distance"]
+        breakdown["step_deviation"] = reference["step_deviation"]
+
     return ScoreResult(
         total=total_score,
-        subscores={
-            "precision": precision,
-            "efficiency": efficiency,
-            "safety": safety,
-            "protocol_adherence": protocol,
-            "instrument_handling": instrument_handling,
-        },
+        subscores=subscores,
         feedback=feedback[:8],
-        algorithm_version=rubric.get("version", "rules_v2"),
-        breakdown={
-            "forbidden_hits": forbidden_hits,
-            "target_hits": target_hits,
-            "wrong_actions": wrong_actions,
-            "forbidden_contact_ms": forbidden_contact_ms,
-            "forceful_actions": forceful_actions,
-            "steps_omitted": steps_omitted,
-            "time_over_seconds": time_over,
-            "wrong_instrument": wrong_instrument,
-            "erratic_moves": erratic_moves,
-        },
+        algorithm_version=plan.algorithm_version,
+        breakdown=breakdown,
     )
 
 
-def _expected_tools_for_step(steps: list[dict[str, Any]], completed_steps: set[int]) -> list[str]:
-    pending_steps = [step for step in steps if step.get("id") not in completed_steps]
-    if not pending_steps:
-        return []
-    return pending_steps[0].get("instruments", [])
+class IncrementalScorer:
+    """Scoring state machine: running counters folded in one event at a time.
+
+    The only order-dependent rule is ``wrong_instrument``: an action without a
+    tool uses the tool of the previous action, or the attempt's last
+    ``tool_select`` while no earlier action named one. Actions are grouped by
+    the tool they resolve to, and the leading tool-less ones are resolved when
+    the result is built. ``exact`` is cleared when an event cannot be folded
+    the way a timestamp-ordered scan would see it (tool selections or actions
+    arriving out of order, malformed payloads); callers then rescan.
+    """
+
+    def __init__(self, state: dict[str, Any] | None = None) -> None:
+        state = state or {}
+        if state and state.get("version") != LIVE_STATE_VERSION:
+            state = {"exact": False}
+        self.event_count = state.get("event_count", 0)
+        self.exact = state.get("exact", True)
+        self.forbidden_hits = state.get("forbidden_hits", 0)
+        self.target_hits = state.get("target_hits", 0)
+        self.wrong_actions = state.get("wrong_actions", 0)
+        self.forbidden_contact_ms = state.get("forbidden_contact_ms", 0)
+        self.forceful_actions = state.get("forceful_actions", 0)
+        self.move_count = state.get("move_count", 0)
+        self.completed_steps = set(state.get("completed_steps", []))
+        self.tool_actions = {tool: count for tool, count in state.get("tool_actions", [])}
+        self.leading_actions = state.get("leading_actions", 0)
+        self.action_tool = state.get("action_tool")
+        self.selected_tool = state.get("selected_tool")
+        self.last_ordered_ms = state.get("last_ordered_ms")
+
+    def to_state(self) -> dict[str, Any]:
+        return {
+            "version": LIVE_STATE_VERSION,
+            "event_count": self.event_count,
+            "exact": self.exact,
+            "forbidden_hits": self.forbidden_hits,
+            "target_hits": self.target_hits,
+            "wrong_actions": self.wrong_actions,
+            "forbidden_contact_ms": self.forbidden_contact_ms,
+            "forceful_actions": self.forceful_actions,
+            "move_count": self.move_count,
+            "completed_steps": list(self.completed_steps),
+            "tool_actions": [[tool, count] for tool, count in self.tool_actions.items()],
+            "leading_actions": self.leading_actions,
+            "action_tool": self.action_tool,
+            "selected_tool": self.selected_tool,
+            "last_ordered_ms": self.last_ordered_ms,
+        }
+
+    def feed(self, event_type: str, payload: Any, timestamp_ms: Any) -> None:
+        self.event_count += 1
+        if event_type == "move":
+            self.move_count += 1
+            return
+        if not isinstance(payload, dict):
+            self.exact = False
+            return
+        try:
+            self._fold(event_type, payload, timestamp_ms)
+        except TypeError:
+            # Unhashable step ids or tools, non-numeric intensities or durations.
+            self.exact = False
+
+    def _fold(self, event_type: str, payload: dict, timestamp_ms: Any) -> None:
+        if is_client_zone_event(event_type, payload):
+            return
+        if event_type in ORDERED_EVENT_TYPES:
+            if self.last_ordered_ms is not None and timestamp_ms < self.last_ordered_ms:
+                self.exact = False
+            self.last_ordered_ms = timestamp_ms
+        if event_type == "hit":
+            zone = payload.get("zone")
+            if zone == "forbidden":
+                self.forbidden_hits += 1
+            elif zone == "target":
+                self.target_hits += 1
+        elif event_type == "error":
+            self.wrong_actions += 1
+        elif event_type == "contact_duration":
+            if payload.get("zone") == "forbidden":
+                duration_ms = payload.get("duration_ms", 0)
+                if not isinstance(duration_ms, int):
+                    # Float sums depend on the order the batch scan adds them in.
+                    self.exact = False
+                self.forbidden_contact_ms += duration_ms
+        elif event_type == "step_completed":
+            self.completed_steps.add(payload.get("step_id"))
+        elif event_type == "tool_select":
+            self.selected_tool = payload.get("tool")
+        elif event_type == "action":
+            if payload.get("intensity", 0) >= 8:
+                self.forceful_actions += 1
+            tool = payload.get("tool") or self.action_tool
+            if tool:
+                self.tool_actions[tool] = self.tool_actions.get(tool, 0) + 1
+                self.action_tool = tool
+            else:
+                self.leading_actions += 1
+
+    def wrong_instrument(self, plan: CompiledProcedure) -> int:
+        expected_tools = plan.expected_tools(self.completed_steps)
+        if not expected_tools:
+            return 0
+        wrong = sum(count for tool, count in self.tool_actions.items() if not contains(expected_tools, tool))
+        if not contains(expected_tools, self.selected_tool):
+            wrong += self.leading_actions
+        return wrong
+
+    def result(
+        self,
+        plan: CompiledProcedure,
+        duration_seconds: int,
+        motion: dict[str, Any] | None = None,
+        reference: dict[str, Any] | None = None,
+    ) -> ScoreResult:
+        return _build_result(
+            plan,
+            duration_seconds,
+            forbidden_hits=self.forbidden_hits,
+            target_hits=self.target_hits,
+            wrong_actions=self.wrong_actions,
+            forbidden_contact_ms=self.forbidden_contact_ms,
+            forceful_actions=self.forceful_actions,
+            completed_steps=self.completed_steps,
+            wrong_instrument=self.wrong_instrument(plan),
+            move_count=self.move_count,
+            motion=motion,
+            reference=reference,
+        )
+
+
+def update_live_state(attempt_id: int, events: list[tuple[str, Any, Any]]) -> None:
+    """Fold newly stored events into the attempt's scorer state; call inside the storing transaction."""
+    state = Attempt.objects.select_for_update().filter(id=attempt_id).values_list("live_state", flat=True).first()
+    scorer = IncrementalScorer(state)
+    for event_type, payload, timestamp_ms in events:
+        scorer.feed(event_type, payload, timestamp_ms)
+    Attempt.objects.filter(id=attempt_id).update(live_state=scorer.to_state())
+
+
+def attempt_motion(
+    attempt_id: int, plan: CompiledProcedure
+) -> tuple[dict[str, Any] | None, dict[str, Any] | None]:
+    """Kinematic metrics and the comparison with reference trajectories, each when the rubric enables it."""
+    if plan.kinematics is None and plan.reference is None:
+        return None, None
+    trajectory = load_trajectory(attempt_id)
+    motion = compute_kinematics(*trajectory, plan.kinematics) if plan.kinematics is not None else None
+    reference = None
+    if plan.reference is not None:
+        reference = attempt_reference(attempt_id, plan.procedure_id, plan.reference, trajectory)
+    return motion, reference
+
+
+def _packed_move_count(attempt_id: int) -> int:
+    return TrajectoryChunk.objects.filter(attempt_id=attempt_id).aggregate(total=Sum("sample_count"))["total"] or 0
+
+
+def _stored_event_count(attempt_id: int) -> int:
+    return Event.objects.filter(attempt_id=attempt_id).count() + _packed_move_count(attempt_id)
+
+
+def score_attempt(attempt: Attempt) -> ScoreResult:
+    """Score from the accumulated live state, rescanning events only when it cannot be trusted."""
+    state = Attempt.objects.filter(id=attempt.id).values_list("live_state", flat=True).first()
+    scorer = IncrementalScorer(state)
+    if scorer.exact and scorer.event_count == _stored_event_count(attempt.id):
+        plan = get_compiled_procedure(attempt.procedure)
+        motion, reference = attempt_motion(attempt.id, plan)
+        return scorer.result(plan, attempt.duration_seconds or 0, motion=motion, reference=reference)
+    return evaluate_attempt(attempt)
+
+
+def live_score(attempt_id: int) -> dict[str, Any]:
+    """Snapshot of the running score of an attempt, using the elapsed time as duration.
+
+    Kinematic metrics are left out: they need the whole trajectory.
+    """
+    procedure_id, revision, live_state, duration_seconds, started_at = Attempt.objects.values_list(
+        "procedure_id", "procedure__revision", "live_state", "duration_seconds", "started_at"
+    ).get(id=attempt_id)
+    duration_seconds = duration_seconds or int((timezone.now() - started_at).total_seconds())
+    plan = get_compiled_procedure(procedure_id, revision)
+    result = IncrementalScorer(live_state).result(plan, duration_seconds)
+    return {"attempt_id": attempt_id, "duration_seconds": duration_seconds, **asdict(result)}
@@ -1,6 +1,27 @@
+import math
+
 from rest_framework import serializers
 
-from .models import Attempt, Event, Procedure
+from .models import Attempt, Event, LearningCurve, Procedure, ReferenceTrajectory
+from .progress import curve_statistics
+from .zones import ZoneConfigError, parse_zones
+
+
+def _is_finite(value):
+    if isinstance(value, float):
+        return math.isfinite(value)
+    if isinstance(value, dict):
+        return all(_is_finite(item) for item in value.values())
+    if isinstance(value, list):
+        return all(_is_finite(item) for item in value)
+    return True
+
+
+def _validate_finite_payload(value):
+    """Reject NaN and infinite numbers, which the JSON column cannot store."""
+    if not _is_finite(value):
+        raise serializers.ValidationError("Payload numbers must be finite.")
+    return value
 
 
 class ProcedureSerializer(serializers.ModelSerializer):
@@ -8,6 +29,13 @@ class ProcedureSerializer(serializers.ModelSerializer):
         model = Procedure
         fields = "__all__"
 
+    def validate_zones(self, value):
+        try:
+            parse_zones(value)
+        except ZoneConfigError as exc:
+            raise serializers.ValidationError(str(exc))
+        return value
+
 
 class AttemptSerializer(serializers.ModelSerializer):
     procedure_detail = ProcedureSerializer(source="procedure", read_only=True)
@@ -34,6 +62,8 @@ class AttemptSerializer(serializers.ModelSerializer):
             "ai_provider",
             "ai_model",
             "ai_feedback",
+            "events_dropped",
+            "moves_coalesced",
         ]
         read_only_fields = [
             "user",
@@ -50,6 +80,8 @@ class AttemptSerializer(serializers.ModelSerializer):
             "ai_provider",
             "ai_model",
             "ai_feedback",
+            "events_dropped",
+            "moves_coalesced",
         ]
 
 
@@ -97,9 +129,58 @@ class EventSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ["created_at", "attempt"]
 
+    def validate_payload(self, value):
+        return _validate_finite_payload(value)
+
     def validate(self, attrs):
         if "timestamp_ms" not in attrs:
             t_ms = attrs.pop("t_ms", None)
             if t_ms is not None:
                 attrs["timestamp_ms"] = t_ms
         return attrs
+
+
+class EventIngestSerializer(serializers.Serializer):
+    """Validates bulk-ingested events for an attempt that is already authorized."""
+
+    event_type = serializers.CharField(max_length=50)
+    payload = serializers.JSONField(required=False, default=dict)
+    timestamp_ms = serializers.IntegerField(required=False)
+    t_ms = serializers.IntegerField(required=False)
+
+    def validate_payload(self, value):
+        return _validate_finite_payload(value)
+
+    def validate(self, attrs):
+        t_ms = attrs.pop("t_ms", None)
+        if "timestamp_ms" not in attrs:
+            attrs["timestamp_ms"] = t_ms if t_ms is not None else 0
+        return attrs
+
+
+class ReferenceTrajectorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ReferenceTrajectory
+        fields = ["id", "procedure", "source_attempt", "name", "sample_count", "duration_ms", "created_at"]
+
+
+class LearningCurveSerializer(serializers.ModelSerializer):
+    procedure_name = serializers.CharField(source="procedure.name", read_only=True)
+
+    class Meta:
+        model = LearningCurve
+        fields = [
+            "user",
+            "procedure",
+            "procedure_name",
+            "attempts",
+            "mean_score",
+            "best_score",
+            "last_score",
+            "recent_scores",
+            "first_completed_at",
+            "last_completed_at",
+        ]
+
+    def to_representation(self, instance):
+        return {**super().to_representation(instance), **curve_statistics(instance)}
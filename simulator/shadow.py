@@ -0,0 +1,211 @@
+"""Shadow scoring: candidate scorers run next to the primary one.
+
+A candidate is a callable taking a completed ``Attempt`` and returning a
+``ScoreResult``, registered by name with ``register_scorer`` or given as a
+dotted import path. Candidates listed in ``SHADOW_SCORERS`` score every
+attempt once its completion is committed, in a small thread pool so the
+request does not wait for them; ``shadow_score`` runs them over past
+attempts. Results go to ``ShadowScore`` and never change the attempt.
+``compare_shadow_scores`` sets them against the attempts' stored scores.
+"""
+from __future__ import annotations
+
+import time
+from collections import defaultdict
+from typing import Any, Callable
+
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .background import run_after_commit
+from .models import Attempt, Procedure, ShadowScore
+from .plans import CompiledProcedure
+from .scoring import ScoreResult, evaluate_attempt
+
+Scorer = Callable[[Attempt], ScoreResult]
+
+_scorers: dict[str, Scorer] = {}
+
+
+def register_scorer(name: str) -> Callable[[Scorer], Scorer]:
+    def decorator(scorer: Scorer) -> Scorer:
+        _scorers[name] = scorer
+        return scorer
+
+    return decorator
+
+
+def get_scorer(name: str) -> Scorer:
+    if name in _scorers:
+        return _scorers[name]
+    try:
+        return import_string(name)
+    except ImportError as exc:
+        raise ValueError(f"Unknown shadow scorer: {name}") from exc
+
+
+def rubric_candidate(overrides: dict[str, Any], mode: str | None = None) -> Scorer:
+    """A scorer using the procedure's rubric with ``overrides`` merged over its top-level keys."""
+    plans: dict[tuple[int, int], CompiledProcedure] = {}
+
+    def scorer(attempt: Attempt) -> ScoreResult:
+        procedure = attempt.procedure
+        key = (procedure.pk, procedure.revision)
+        if key not in plans:
+            candidate = Procedure(
+                pk=procedure.pk,
+                revision=procedure.revision,
+                name=procedure.name,
+                steps=procedure.steps,
+                zones=procedure.zones,
+                rubric={**(procedure.rubric or {}), **overrides},
+            )
+            plans[key] = CompiledProcedure(candidate)
+        return evaluate_attempt(attempt, mode=mode, plan=plans[key])
+
+    return scorer
+
+
+# The aggregate query must agree with the stream scorer; a shadow run checks it on real traffic.
+register_scorer("aggregate")(lambda attempt: evaluate_attempt(attempt, mode="aggregate"))
+# Kinematic metrics with their default settings, for procedures whose rubric does not enable them yet.
+register_scorer("motion")(rubric_candidate({"kinematics": {}}))
+
+
+def run_shadow_scorers(attempt: Attempt, scorers: list[str] | None = None) -> list[ShadowScore]:
+    """Score ``attempt`` with every candidate and store the results; a failing candidate stores its error."""
+    rows = []
+    for name in settings.SHADOW_SCORERS if scorers is None else scorers:
+        row = ShadowScore(attempt_id=attempt.id, scorer=name)
+        started = time.perf_counter()
+        try:
+            result = get_scorer(name)(attempt)
+        except Exception as exc:
+            row.error = f"{type(exc).__name__}: {exc}"
+        else:
+            row.algorithm_version = result.algorithm_version
+            row.score_total = result.total
+            row.subscores = result.subscores
+            row.score_breakdown = result.breakdown
+        row.elapsed_ms = round((time.perf_counter() - started) * 1000, 3)
+        rows.append(row)
+    if rows:
+        ShadowScore.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["attempt", "scorer"],
+            update_fields=[
+                "algorithm_version",
+                "score_total",
+                "subscores",
+                "score_breakdown",
+                "elapsed_ms",
+                "error",
+                "scored_at",
+            ],
+        )
+    return rows
+
+
+def _score_in_background(attempt_id: int, scorers: list[str]) -> None:
+    attempt = Attempt.objects.select_related("procedure").filter(id=attempt_id).first()
+    if attempt is not None:
+        run_shadow_scorers(attempt, scorers)
+
+
+def schedule_shadow_scoring(attempt_id: int) -> None:
+    """Run the configured candidates on a completed attempt once the current transaction commits."""
+    scorers = list(settings.SHADOW_SCORERS)
+    if scorers:
+        run_after_commit(
+            "shadow-scoring", settings.SHADOW_SCORING_WORKERS, _score_in_background, attempt_id, scorers
+        )
+
+
+def _mean(values: np.ndarray) -> float | None:
+    return round(float(values.mean()), 3) if len(values) else None
+
+
+def _correlation(primary: list[float], shadow: list[float]) -> float | None:
+    """Pearson correlation, or None when either side is constant or too short."""
+    if len(primary) < 2:
+        return None
+    primary_values, shadow_values = np.asarray(primary, dtype=float), np.asarray(shadow, dtype=float)
+    if primary_values.std() == 0 or shadow_values.std() == 0:
+        return None
+    return round(float(np.corrcoef(primary_values, shadow_values)[0, 1]), 4)
+
+
+def compare_shadow_scores(scorer: str | None = None, procedure_id: int | None = None) -> list[dict[str, Any]]:
+    """Per candidate: score deltas against the primary score, subscore correlation and drift per procedure.
+
+    Deltas are ``shadow - primary`` over attempts with both scores.
+    """
+    rows = ShadowScore.objects.filter(attempt__status=Attempt.Status.COMPLETED)
+    if scorer:
+        rows = rows.filter(scorer=scorer)
+    if procedure_id:
+        rows = rows.filter(attempt__procedure_id=procedure_id)
+    grouped = defaultdict(list)
+    for row in rows.values_list(
+        "scorer",
+        "score_total",
+        "subscores",
+        "elapsed_ms",
+        "error",
+        "attempt__score_total",
+        "attempt__subscores",
+        "attempt__procedure_id",
+        "attempt__procedure__name",
+    ).order_by("scorer", "attempt_id"):
+        grouped[row[0]].append(row[1:])
+
+    report = []
+    for name, entries in grouped.items():
+        scored = [entry for entry in entries if not entry[3] and entry[0] is not None and entry[4] is not None]
+        deltas = np.array([entry[0] - entry[4] for entry in scored], dtype=float)
+        subscores = defaultdict(lambda: ([], []))
+        procedures = defaultdict(list)
+        for (_, shadow_subscores, _, _, _, primary_subscores, procedure, procedure_name), delta in zip(scored, deltas):
+            procedures[(procedure, procedure_name)].append(delta)
+            primary_subscores = primary_subscores or {}
+            for subscore, value in (shadow_subscores or {}).items():
+                primary = primary_subscores.get(subscore)
+                if isinstance(value, (int, float)) and isinstance(primary, (int, float)):
+                    subscores[subscore][0].append(primary)
+                    subscores[subscore][1].append(value)
+        report.append(
+            {
+                "scorer": name,
+                "attempts": len(scored),
+                "errors": sum(1 for entry in entries if entry[3]),
+                "mean_elapsed_ms": _mean(np.array([entry[2] for entry in entries], dtype=float)),
+                "mean_delta": _mean(deltas),
+                "mean_abs_delta": _mean(np.abs(deltas)),
+                "max_abs_delta": round(float(np.abs(deltas).max()), 3) if len(deltas) else None,
+                "changed": int(np.count_nonzero(np.abs(deltas) > 1e-9)),
+                "subscores": {
+                    subscore: {
+                        "mean_delta": _mean(np.asarray(shadow, dtype=float) - np.asarray(primary, dtype=float)),
+                        "correlation": _correlation(primary, shadow),
+                    }
+                    for subscore, (primary, shadow) in sorted(subscores.items())
+                },
+                # Procedures whose scores move the most come first.
+                "procedures": sorted(
+                    (
+                        {
+                            "procedure_id": procedure,
+                            "procedure": procedure_name,
+                            "attempts": len(values),
+                            "mean_delta": _mean(np.array(values)),
+                            "mean_abs_delta": _mean(np.abs(np.array(values))),
+                        }
+                        for (procedure, procedure_name), values in procedures.items()
+                    ),
+                    key=lambda drift: -drift["mean_abs_delta"],
+                ),
+            }
+        )
+    return report
@@ -0,0 +1,337 @@
+"""Crash-safe write-ahead spool for incoming events.
+
+When ``EVENT_SPOOL_ENABLED`` is set, ingested events are appended to a
+per-process segment file in ``EVENT_SPOOL_DIR`` instead of going straight to
+the database. Each record is ``<length:uint32><crc32:uint32>`` followed by a
+JSON array ``[attempt_id, event_type, payload, timestamp_ms]``. Records reach
+the OS on every append and are fsynced every ``EVENT_SPOOL_FSYNC_EVERY``
+records or ``EVENT_SPOOL_FSYNC_INTERVAL_MS``, whichever comes first.
+
+The segment being written is named ``*.open``; it is sealed (renamed to
+``*.seg``) when it grows past ``EVENT_SPOOL_SEGMENT_BYTES`` or when the
+flusher runs. A background thread drains sealed segments into ``Event`` rows
+and deletes them; completing an attempt drains only that attempt's records
+and rewrites the segments holding them without them. Each attempt is stored
+in its own transaction; records that cannot be stored for any reason other
+than the database being unavailable are moved to the segment's ``*.bad`` file
+and logged, so they neither block the rest of the segment nor fail every
+completion. A segment that cannot be drained at all is renamed to ``*.bad``. Segments left behind by a dead process are replayed
+with ``manage.py replay_event_spool``. Delivery is at-least-once: a crash
+between the database commit and the segment deletion replays that segment
+again.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Iterable, Iterator
+
+from django.conf import settings
+from django.db import OperationalError, close_old_connections, transaction
+
+from .models import Attempt
+
+logger = logging.getLogger(__name__)
+
+RECORD_HEADER = struct.Struct("<II")
+OPEN_SUFFIX = ".open"
+SEALED_SUFFIX = ".seg"
+QUARANTINE_SUFFIX = ".bad"
+
+
+def encode_records(records: Iterable[tuple[int, str, Any, int]]) -> bytes:
+    return b"".join(
+        RECORD_HEADER.pack(len(data), zlib.crc32(data)) + data
+        for data in (json.dumps([int(attempt_id), *rest]).encode("utf-8") for attempt_id, *rest in records)
+    )
+
+
+def read_segment(path: Path) -> Iterator[tuple[int, str, Any, int]]:
+    """Yield the records of a segment, stopping at a torn or corrupt tail."""
+    with open(path, "rb") as handle:
+        while True:
+            header = handle.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return
+            length, checksum = RECORD_HEADER.unpack(header)
+            data = handle.read(length)
+            if len(data) < length or zlib.crc32(data) != checksum:
+                return
+            attempt_id, event_type, payload, timestamp_ms = json.loads(data)
+            yield attempt_id, event_type, payload, timestamp_ms
+
+
+def segment_pid(path: Path) -> int | None:
+    try:
+        return int(path.name.split("-")[1])
+    except (IndexError, ValueError):
+        return None
+
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def orphaned_segments(directory: Path | str, force: bool = False) -> list[Path]:
+    """Segments whose writer process is gone, oldest first; every segment with ``force``."""
+    segments = []
+    for path in sorted(Path(directory).glob("spool-*")):
+        if path.suffix not in (OPEN_SUFFIX, SEALED_SUFFIX):
+            continue
+        pid = segment_pid(path)
+        if force or pid is None or pid == os.getpid() or not process_alive(pid):
+            segments.append(path)
+    return segments
+
+
+def _rewrite(path: Path, records: list[tuple[int, str, Any, int]]) -> None:
+    temporary = path.with_name(path.name + ".tmp")
+    with open(temporary, "wb") as handle:
+        handle.write(encode_records(records))
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temporary, path)
+
+
+def drain_segment(path: Path, attempt_id: int | None = None) -> tuple[int, int]:
+    """Store the records of a segment and delete it; with ``attempt_id``, only that attempt's records.
+
+    Each attempt is stored in its own transaction. Records that cannot be
+    stored are moved to the segment's quarantine file and the rest are kept.
+    If the database becomes unavailable, the segment is rewritten without the
+    attempts already stored and the error is raised. Returns the number of
+    stored and quarantined records.
+    """
+    from .ingest import persist_events_isolating
+
+    by_attempt: dict[int, list[tuple[str, Any, int]]] = defaultdict(list)
+    rest = []
+    for record in read_segment(path):
+        if attempt_id is None or record[0] == attempt_id:
+            by_attempt[record[0]].append(record[1:])
+        else:
+            rest.append(record)
+    # Events of attempts deleted since they were spooled are dropped.
+    existing = sorted(Attempt.objects.filter(id__in=list(by_attempt)).values_list("id", flat=True))
+    stored = 0
+    rejected = []
+    try:
+        for stored_attempt_id in existing:
+            count, failed = persist_events_isolating(stored_attempt_id, by_attempt[stored_attempt_id])
+            del by_attempt[stored_attempt_id]
+            stored += count
+            rejected.extend((stored_attempt_id, *event) for event in failed)
+    finally:
+        if rejected:
+            quarantine_records(path, rejected)
+        pending = rest + [
+            (pending_attempt_id, *event)
+            for pending_attempt_id in existing
+            if pending_attempt_id in by_attempt
+            for event in by_attempt[pending_attempt_id]
+        ]
+        if pending:
+            _rewrite(path, pending)
+        else:
+            path.unlink()
+    return stored, len(rejected)
+
+
+def quarantine_records(path: Path, records: list[tuple[int, str, Any, int]]) -> Path:
+    """Append records that failed to store to the quarantine file of their segment."""
+    target = path.with_name(path.name + QUARANTINE_SUFFIX)
+    with open(target, "ab") as handle:
+        handle.write(encode_records(records))
+        handle.flush()
+        os.fsync(handle.fileno())
+    return target
+
+
+def quarantine_segment(path: Path) -> Path:
+    """Set a segment that failed to drain aside, where neither the flusher nor replays pick it up."""
+    target = path.with_name(path.name + QUARANTINE_SUFFIX)
+    if target.exists():
+        quarantine_records(path, list(read_segment(path)))
+        path.unlink()
+    else:
+        path.rename(target)
+    return target
+
+
+class EventSpool:
+    def __init__(
+        self,
+        directory: Path | str,
+        fsync_every: int | None = None,
+        fsync_interval_ms: int | None = None,
+        segment_max_bytes: int | None = None,
+    ) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.fsync_every = fsync_every or settings.EVENT_SPOOL_FSYNC_EVERY
+        self.fsync_interval_ms = fsync_interval_ms or settings.EVENT_SPOOL_FSYNC_INTERVAL_MS
+        self.segment_max_bytes = segment_max_bytes or settings.EVENT_SPOOL_SEGMENT_BYTES
+        self.pid = os.getpid()
+        self._prefix = f"spool-{self.pid}-{time.time_ns()}"
+        self._sequence = 0
+        self._handle = None
+        self._path: Path | None = None
+        self._size = 0
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._lock = threading.Lock()
+        self._drain_lock = threading.Lock()
+        # Attempts with records in each segment of this process, by segment name without suffix.
+        self._segment_attempts: dict[str, set[int]] = {}
+        self.appended = 0
+        self.fsyncs = 0
+        self.drained = 0
+        self.quarantined = 0
+        self.flusher: SpoolFlusher | None = None
+
+    def append(self, attempt_id: int, events: list[tuple[str, Any, int]]) -> int:
+        if not events:
+            return 0
+        data = encode_records((attempt_id, *event) for event in events)
+        with self._lock:
+            if self._handle is None:
+                self._open_segment()
+            self._segment_attempts.setdefault(self._path.stem, set()).add(int(attempt_id))
+            self._handle.write(data)
+            self._handle.flush()
+            self._size += len(data)
+            self._unsynced += len(events)
+            self.appended += len(events)
+            elapsed_ms = (time.monotonic() - self._last_sync) * 1000
+            if self._unsynced >= self.fsync_every or elapsed_ms >= self.fsync_interval_ms:
+                self._sync()
+            if self._size >= self.segment_max_bytes:
+                self._seal()
+        return len(events)
+
+    def seal(self) -> None:
+        with self._lock:
+            self._seal()
+
+    def drain(self, attempt_id: int | None = None) -> int:
+        """Seal the current segment and store the sealed segments of this process.
+
+        With ``attempt_id`` only that attempt's records are stored, from the
+        segments that hold any.
+        """
+        self.seal()
+        with self._drain_lock:
+            drained = 0
+            for path in sorted(self.directory.glob(f"{self._prefix}-*{SEALED_SUFFIX}")):
+                attempts = self._segment_attempts.get(path.stem)
+                if attempt_id is not None and attempts is not None and attempt_id not in attempts:
+                    continue
+                try:
+                    stored, quarantined = drain_segment(path, attempt_id)
+                except OperationalError:
+                    # The database is unavailable; every segment is retried later.
+                    raise
+                except Exception:
+                    logger.exception("Could not drain spool segment %s; moved aside as %s", path.name, QUARANTINE_SUFFIX)
+                    quarantine_segment(path)
+                    self._segment_attempts.pop(path.stem, None)
+                    self.quarantined += 1
+                    continue
+                drained += stored
+                if quarantined:
+                    logger.error(
+                        "%s records of spool segment %s could not be stored; moved to %s%s",
+                        quarantined,
+                        path.name,
+                        path.name,
+                        QUARANTINE_SUFFIX,
+                    )
+                    self.quarantined += quarantined
+                if attempts is not None:
+                    if attempt_id is None or not path.exists():
+                        del self._segment_attempts[path.stem]
+                    else:
+                        attempts.discard(attempt_id)
+            self.drained += drained
+            return drained
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "directory": str(self.directory),
+            "appended": self.appended,
+            "fsyncs": self.fsyncs,
+            "drained": self.drained,
+            "quarantined": self.quarantined,
+            "pending_segments": sum(
+                1 for path in self.directory.glob(f"{self._prefix}-*") if path.suffix in (OPEN_SUFFIX, SEALED_SUFFIX)
+            ),
+        }
+
+    def _open_segment(self) -> None:
+        self._path = self.directory / f"{self._prefix}-{self._sequence:06d}{OPEN_SUFFIX}"
+        self._sequence += 1
+        self._handle = open(self._path, "ab")
+        self._size = 0
+
+    def _sync(self) -> None:
+        os.fsync(self._handle.fileno())
+        self.fsyncs += 1
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _seal(self) -> None:
+        if self._handle is None:
+            return
+        self._sync()
+        self._handle.close()
+        self._path.rename(self._path.with_suffix(SEALED_SUFFIX))
+        self._handle = None
+        self._path = None
+
+
+class SpoolFlusher(threading.Thread):
+    def __init__(self, spool: EventSpool, interval_ms: int) -> None:
+        super().__init__(name="event-spool-flusher", daemon=True)
+        self.spool = spool
+        self.interval = interval_ms / 1000
+        self.stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            try:
+                self.spool.drain()
+            except Exception:
+                # Segments stay on disk and are retried on the next pass.
+                logger.exception("Event spool drain failed")
+            finally:
+                close_old_connections()
+
+
+_spool: EventSpool | None = None
+_spool_lock = threading.Lock()
+
+
+def get_spool() -> EventSpool | None:
+    """The spool of this process, or None when spooling is disabled."""
+    global _spool
+    if not settings.EVENT_SPOOL_ENABLED:
+        return None
+    with _spool_lock:
+        if _spool is None or _spool.pid != os.getpid():
+            _spool = EventSpool(settings.EVENT_SPOOL_DIR)
+            _spool.flusher = SpoolFlusher(_spool, settings.EVENT_SPOOL_FLUSH_INTERVAL_MS)
+            _spool.flusher.start()
+        return _spool
@@ -0,0 +1,100 @@
+"""Deterministic synthetic attempts for benchmarks and load tests.
+
+``generate_events`` turns an ``AttemptProfile`` into the
+``(event_type, payload, timestamp_ms)`` tuples a client would send: a smooth
+random walk of ``move`` samples at ``events_per_second``, with hits, errors,
+actions and forbidden contacts mixed in at the configured ratios and the
+procedure steps completed at even intervals. The same profile and seed
+always give the same events.
+"""
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from typing import Any
+
+TOOLS = ("SCALPEL", "FORCEPS", "NEEDLE_DRIVER", "CAUTERY")
+
+
+@dataclass
+class AttemptProfile:
+    events: int = 10_000
+    steps: int = 5
+    events_per_second: float = 60
+    hit_ratio: float = 0.02
+    forbidden_ratio: float = 0.3
+    error_ratio: float = 0.005
+    action_ratio: float = 0.01
+    seed: int = 0
+
+    @property
+    def duration_seconds(self) -> int:
+        return max(int(self.events / self.events_per_second), 1)
+
+
+def synthetic_procedure(steps: int) -> dict[str, Any]:
+    """``Procedure`` field values matching the events of a profile with ``steps`` steps."""
+    return {
+        "name": f"Synthetic ({steps} steps)",
+        "description": "Synthetic procedure",
+        "steps": [
+            {
+                "id": index + 1,
+                "title": f"Step {index + 1}",
+                "instruments": [TOOLS[index % len(TOOLS)]],
+                "actions": ["CUT"],
+            }
+            for index in range(steps)
+        ],
+        "zones": {
+            "target": {"x": 0.3, "y": 1.2, "z": 0.3, "radius": 0.3},
+            "forbidden": {"x": -0.3, "y": 1.1, "z": 0.2, "radius": 0.3},
+        },
+        "rubric": {"version": "rules_v2", "expected_time_seconds": 180},
+    }
+
+
+def generate_events(profile: AttemptProfile) -> list[tuple[str, dict[str, Any], int]]:
+    generator = random.Random(profile.seed)
+    interval_ms = 1000 / profile.events_per_second
+    step_every = max(profile.events // (profile.steps + 1), 1)
+    x, y, z = 0.0, 1.2, 0.3
+    tool = TOOLS[0]
+    contact = False
+    events = []
+    for index in range(profile.events):
+        timestamp_ms = int(index * interval_ms)
+        step = index // step_every
+        if index and index % step_every == 0 and step <= profile.steps:
+            events.append(("step_completed", {"step_id": step}, timestamp_ms))
+            tool = TOOLS[step % len(TOOLS)]
+            continue
+        if index % step_every == 1:
+            events.append(("tool_select", {"tool": tool}, timestamp_ms))
+            continue
+        if contact:
+            # Every forbidden hit is followed by its contact time.
+            duration_ms = generator.randint(50, 800)
+            events.append(("contact_duration", {"zone": "forbidden", "duration_ms": duration_ms}, timestamp_ms))
+            contact = False
+            continue
+        roll = generator.random()
+        if roll < profile.hit_ratio:
+            zone = "forbidden" if generator.random() < profile.forbidden_ratio else "target"
+            events.append(("hit", {"zone": zone, "x": x, "y": y, "z": z}, timestamp_ms))
+            contact = zone == "forbidden"
+            continue
+        roll -= profile.hit_ratio
+        if roll < profile.error_ratio:
+            events.append(("error", {"code": "WRONG_ACTION"}, timestamp_ms))
+            continue
+        roll -= profile.error_ratio
+        if roll < profile.action_ratio:
+            intensity = generator.randint(1, 10)
+            events.append(("action", {"type": "CUT", "tool": tool, "intensity": intensity}, timestamp_ms))
+            continue
+        x = min(max(x + generator.gauss(0, 0.005), -1.0), 1.0)
+        y = min(max(y + generator.gauss(0, 0.005), 0.5), 2.0)
+        z = min(max(z + generator.gauss(0, 0.005), -1.0), 1.0)
+        events.append(("move", {"x": x, "y": y, "z": z, "tool": tool}, timestamp_ms))
+    return events
@@ -1,10 +1,69 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import zipfile
+from dataclasses import asdict
+from io import BytesIO, StringIO
+from unittest import mock
+
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from channels.exceptions import ChannelFull
+from channels.routing import URLRouter
+from django.core.management import CommandError, call_command
+from django.db import OperationalError
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework.test import APIClient
 
 from accounts.models import User
-from simulator.models import Attempt, Event, Procedure
-from simulator.scoring import evaluate_attempt
+from simulator import protocol, spool
+from simulator.channel_layers import SQLiteChannelLayer
+from simulator.ingest import (
+    EventBuffer,
+    IngestPolicy,
+    flush_attempt_buffers,
+    ingest_stats,
+    persist_events,
+    record_attempt_counters,
+    register_buffer,
+    unregister_buffer,
+)
+from simulator.kinematics import compute_kinematics, load_trajectory
+from simulator.management.commands.bench_zones import random_regions
+from simulator.models import (
+    Attempt,
+    Event,
+    LearningCurve,
+    Procedure,
+    ProcedureDailyStats,
+    ScoreCacheEntry,
+    ShadowScore,
+    SpecialtyDailyStats,
+    TrajectoryChunk,
+)
+from simulator.plans import get_compiled_procedure, procedure_cache
+from simulator.progress import add_score, curve_statistics, record_completion
+from simulator.references import banded_dtw, compare_trajectory, create_reference, pack_samples
+from simulator.reports import report_snapshot, store_report
+from simulator.rescoring import rescore_batch
+from simulator.rollups import record_attempt
+from simulator.routing import websocket_urlpatterns
+from simulator.score_cache import score_cache_stats
+from simulator.scoring import evaluate_attempt, live_score, score_attempt
+from simulator.serializers import ProcedureSerializer
+from simulator.shadow import compare_shadow_scores, run_shadow_scorers
+from simulator.synthetic import AttemptProfile, generate_events
+from simulator.timeline import event_counts, histogram_cache, lttb
+from simulator.trajectory import iter_attempt_events
+from simulator.zones import ZoneIndex, ZoneTracker
 
 
 class ScoringTests(TestCase):
@@ -65,6 +124,634 @@ class ScoringTests(TestCase):
         result = evaluate_attempt(self.attempt)
         self.assertLess(result.subscores["protocol_adherence"], 100)
 
+    def random_events(self, generator, count):
+        tools = [None, "", "SCALPEL", "FORCEPS", "CAUTERY"]
+        events = []
+        for index in range(count):
+            kind = generator.choice(["move", "move", "hit", "error", "contact_duration", "step_completed", "tool_select", "action", "action"])
+            if kind == "move":
+                payload = {"x": generator.random(), "y": 1.0, "z": 0.5, "tool": generator.choice(tools[2:])}
+            elif kind == "hit":
+                payload = {"zone": generator.choice(["target", "forbidden"])}
+            elif kind == "contact_duration":
+                payload = {"zone": generator.choice(["target", "forbidden"]), "duration_ms": generator.randint(0, 900)}
+            elif kind == "step_completed":
+                payload = {"step_id": generator.choice([1, 2])}
+            elif kind == "tool_select":
+                payload = {"tool": generator.choice(tools)}
+            elif kind == "action":
+                payload = {"type": "CUT", "intensity": generator.randint(0, 10)}
+                tool = generator.choice(tools)
+                if tool is not None:
+                    payload["tool"] = tool
+            else:
+                payload = {"code": "WRONG_ACTION"}
+            events.append((kind, payload, index * 10))
+        return events
+
+    def test_incremental_state_matches_batch_evaluation(self):
+        generator = random.Random(7)
+        for _ in range(40):
+            attempt = Attempt.objects.create(
+                user=self.user, procedure=self.procedure, duration_seconds=generator.randint(0, 200)
+            )
+            events = self.random_events(generator, generator.randint(0, 60))
+            position = 0
+            while position < len(events):
+                size = generator.randint(1, 12)
+                persist_events(attempt.id, events[position : position + size])
+                position += size
+            with mock.patch("simulator.scoring.evaluate_attempt", side_effect=AssertionError("rescanned")):
+                incremental = score_attempt(attempt)
+            self.assertEqual(asdict(incremental), asdict(evaluate_attempt(attempt)))
+            self.assertEqual(asdict(incremental), asdict(evaluate_attempt(attempt, mode="aggregate")))
+
+    def test_aggregate_mode_only_transfers_ordered_events_when_needed(self):
+        for step_id in (1, 2):
+            Event.objects.create(attempt=self.attempt, event_type="step_completed", payload={"step_id": step_id}, timestamp_ms=step_id)
+        Event.objects.create(attempt=self.attempt, event_type="step_completed", payload={}, timestamp_ms=3)
+        Event.objects.create(attempt=self.attempt, event_type="action", payload={"tool": "CAUTERY", "intensity": 9}, timestamp_ms=4)
+        self.attempt.procedure.steps.append({"id": None, "instruments": ["CAUTERY"]})
+        with self.assertNumQueries(2):
+            result = evaluate_attempt(self.attempt, mode="aggregate")
+        self.assertEqual(asdict(result), asdict(evaluate_attempt(self.attempt)))
+        self.assertEqual(result.breakdown["forceful_actions"], 1)
+        self.assertEqual(result.breakdown["steps_omitted"], 0)
+
+    def test_rescoring_matches_evaluation_including_fractional_contacts(self):
+        generator = random.Random(11)
+        attempts = []
+        for index in range(12):
+            attempt = Attempt.objects.create(user=self.user, procedure=self.procedure, duration_seconds=generator.randint(0, 200))
+            events = self.random_events(generator, generator.randint(0, 40))
+            if index % 3 == 0:
+                events.append(("contact_duration", {"zone": "forbidden", "duration_ms": 0.1}, 1))
+                events.append(("contact_duration", {"zone": "forbidden", "duration_ms": 0.2}, 2))
+            events.append(("action", {"tool": "SCALPEL", "intensity": "high"}, 3))
+            Event.objects.bulk_create(
+                Event(attempt=attempt, event_type=event_type, payload=payload, timestamp_ms=timestamp_ms)
+                for event_type, payload, timestamp_ms in events
+            )
+            attempts.append(attempt)
+        results, rows = rescore_batch([attempt.id for attempt in attempts], chunk_size=7)
+        self.assertEqual(rows, Event.objects.filter(attempt__in=attempts).count())
+        for (attempt_id, result), attempt in zip(results, attempts):
+            self.assertEqual(attempt_id, attempt.id)
+            self.assertEqual(asdict(result), asdict(evaluate_attempt(attempt)))
+
+    def test_incremental_state_falls_back_when_it_cannot_be_trusted(self):
+        persist_events(self.attempt.id, [("action", {"type": "CUT", "tool": "FORCEPS"}, 500)])
+        persist_events(self.attempt.id, [("tool_select", {"tool": "SCALPEL"}, 100), ("action", {"type": "CUT"}, 200)])
+        self.attempt.refresh_from_db()
+        self.assertFalse(self.attempt.live_state["exact"])
+        self.assertEqual(asdict(score_attempt(self.attempt)), asdict(evaluate_attempt(self.attempt)))
+
+        other = Attempt.objects.create(user=self.user, procedure=self.procedure, duration_seconds=30)
+        persist_events(other.id, [("step_completed", {"step_id": 1}, 100)])
+        Event.objects.create(attempt=other, event_type="step_completed", payload={"step_id": 2}, timestamp_ms=200)
+        self.assertEqual(score_attempt(other).subscores["protocol_adherence"], 100)
+
+
+class ScoringGoldenTests(TestCase):
+    """Results recorded from the original multi-scan ``evaluate_attempt``."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username="student", password="Pass123!", role="STUDENT")
+        with open(os.path.join(os.path.dirname(__file__), "testdata", "scoring_golden.json"), encoding="utf-8") as handle:
+            self.cases = json.load(handle)
+
+    def create_attempt(self, case):
+        procedure = Procedure.objects.create(
+            name=case["name"], description="Golden", steps=case["steps"], rubric=case["rubric"]
+        )
+        return Attempt.objects.create(user=self.user, procedure=procedure, duration_seconds=case["duration_seconds"])
+
+    def test_event_rows_match_golden_results(self):
+        for case in self.cases:
+            with self.subTest(case["name"]):
+                attempt = self.create_attempt(case)
+                Event.objects.bulk_create(
+                    Event(attempt=attempt, event_type=event_type, payload=payload, timestamp_ms=timestamp_ms)
+                    for event_type, payload, timestamp_ms in case["events"]
+                )
+                self.assertEqual(asdict(evaluate_attempt(attempt)), case["expected"])
+                self.assertEqual(asdict(evaluate_attempt(attempt, mode="aggregate")), case["expected"])
+
+    def test_ingested_events_match_golden_results(self):
+        for case in self.cases:
+            with self.subTest(case["name"]):
+                attempt = self.create_attempt(case)
+                persist_events(attempt.id, [tuple(event) for event in case["events"]])
+                self.assertEqual(asdict(evaluate_attempt(attempt)), case["expected"])
+                self.assertEqual(asdict(evaluate_attempt(attempt, mode="aggregate")), case["expected"])
+                self.assertEqual(asdict(score_attempt(attempt)), case["expected"])
+
+
+    def test_rescore_command_matches_golden_results(self):
+        attempts = []
+        for case in self.cases:
+            attempt = self.create_attempt(case)
+            Event.objects.bulk_create(
+                Event(attempt=attempt, event_type=event_type, payload=payload, timestamp_ms=timestamp_ms)
+                for event_type, payload, timestamp_ms in case["events"]
+            )
+            attempts.append(attempt)
+        Attempt.objects.update(status=Attempt.Status.COMPLETED, score_total=-1, algorithm_version="v1")
+        ai_attempt = Attempt.objects.create(
+            user=attempts[0].user,
+            procedure=attempts[0].procedure,
+            status=Attempt.Status.COMPLETED,
+            score_total=-1,
+            feedback=["Retroalimentación de la IA"],
+            ai_used=True,
+        )
+
+        output = StringIO()
+        call_command("rescore_attempts", "--dry-run", "--batch-size", "5", stdout=output)
+        self.assertIn(f"would change {len(self.cases) + 1}", output.getvalue())
+        self.assertFalse(Attempt.objects.exclude(score_total=-1).exists())
+        self.assertFalse(ScoreCacheEntry.objects.exists())
+        for option in ("--since", "--until"):
+            with self.assertRaisesMessage(CommandError, option):
+                call_command("rescore_attempts", option, "2024-13-40", stdout=StringIO())
+
+        call_command("rescore_attempts", "--batch-size", "5", "--chunk-size", "50", stdout=StringIO())
+        for case, attempt in zip(self.cases, attempts):
+            with self.subTest(case["name"]):
+                attempt.refresh_from_db()
+                expected = case["expected"]
+                self.assertEqual(attempt.score_total, expected["total"])
+                self.assertEqual(attempt.subscores, expected["subscores"])
+                self.assertEqual(attempt.score_breakdown, expected["breakdown"])
+                self.assertEqual(attempt.feedback, expected["feedback"])
+        ai_attempt.refresh_from_db()
+        self.assertEqual(ai_attempt.feedback, ["Retroalimentación de la IA"])
+        self.assertNotEqual(ai_attempt.score_total, -1)
+
+        output = StringIO()
+        call_command("rescore_attempts", "--algorithm-version", "rules_v2", stdout=output)
+        self.assertIn("changed 0", output.getvalue())
+
+
+class KinematicsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="student", password="Pass123!", role="STUDENT")
+        self.procedure = Procedure.objects.create(
+            name="Kinematics",
+            description="Test",
+            steps=[{"id": 1}],
+            rubric={"kinematics": {"idle_gap_ms": 400}, "penalties": {"poor_motion": 2}},
+        )
+
+    def test_metrics_of_synthetic_trajectories(self):
+        t = np.arange(0, 10, 0.01)
+        line = np.column_stack([t * 0.1, np.zeros_like(t), np.zeros_like(t)])
+        metrics = compute_kinematics(t, line)
+        self.assertAlmostEqual(metrics["path_length"], 0.999, places=6)
+        self.assertAlmostEqual(metrics["economy_of_motion"], 1)
+        self.assertAlmostEqual(metrics["mean_speed"], 0.1)
+        self.assertAlmostEqual(metrics["rms_jerk"], 0, places=3)
+        self.assertEqual((metrics["tremor_ratio"], metrics["idle_seconds"]), (0, 0))
+
+        shaky = line + 0.001 * np.sin(2 * np.pi * 8 * t)[:, None]
+        self.assertGreater(compute_kinematics(t, shaky)["tremor_ratio"], 0.1)
+
+        paused = np.concatenate([t, t[-1] + 2 + t])
+        still = np.concatenate([line, np.repeat(line[-1:], len(t), axis=0)])
+        metrics = compute_kinematics(paused, still)
+        self.assertAlmostEqual(metrics["idle_seconds"], 2 + 9.99)
+
+    def test_large_trajectory_is_fast(self):
+        t = np.arange(100_000) * 0.016
+        xyz = np.column_stack([np.sin(t * 0.5), np.cos(t * 0.3), t * 0.01])
+        timings = []
+        for _ in range(3):
+            started = time.perf_counter()
+            compute_kinematics(t, xyz)
+            timings.append(time.perf_counter() - started)
+        self.assertLess(min(timings), 0.1)
+
+    def test_enabled_rubric_adds_motion_subscore_and_fields(self):
+        attempt = Attempt.objects.create(user=self.user, procedure=self.procedure, duration_seconds=2)
+        moves = [("move", {"x": index * 0.01, "y": 0.0, "z": 0.0}, index * 10) for index in range(100)]
+        moves.append(("move", {"x": 1.0, "y": 0.0, "z": 0.0}, 2000))
+        persist_events(attempt.id, moves[:50])
+        Event.objects.bulk_create(
+            Event(attempt=attempt, event_type=event_type, payload=payload, timestamp_ms=timestamp_ms)
+            for event_type, payload, timestamp_ms in moves[50:]
+        )
+        t, xyz = load_trajectory(attempt.id)
+        self.assertEqual(len(t), 101)
+        self.assertTrue(np.all(np.diff(t) >= 0))
+
+        result = evaluate_attempt(attempt)
+        self.assertAlmostEqual(result.breakdown["path_length"], 1.0, places=5)
+        self.assertAlmostEqual(result.breakdown["idle_seconds"], 1.01)
+        quality = 100 - result.breakdown["tremor_ratio"] * 100 - 1.01 / 2 * 50
+        self.assertAlmostEqual(result.subscores["motion_quality"], quality)
+        self.assertAlmostEqual(result.total, 100 - 5 - 8.9 - (100 - quality) / 10 * 2)
+        self.assertEqual(asdict(result), asdict(evaluate_attempt(attempt, mode="aggregate")))
+        self.assertEqual(asdict(result), asdict(score_attempt(attempt)))
+
+
+def full_dtw(path, reference):
+    costs = np.linalg.norm(path[:, None, :] - reference[None, :, :], axis=2)
+    totals = np.full((len(path) + 1, len(reference) + 1), np.inf)
+    totals[0, 0] = 0
+    for i in range(1, len(path) + 1):
+        for j in range(1, len(reference) + 1):
+            totals[i, j] = costs[i - 1, j - 1] + min(totals[i - 1, j - 1], totals[i - 1, j], totals[i, j - 1])
+    return totals[-1, -1]
+
+
+class ReferenceTrajectoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="student", password="Pass123!", role="STUDENT")
+        self.procedure = Procedure.objects.create(
+            name="Reference",
+            description="Test",
+            steps=[{"id": 1}, {"id": 2}],
+            rubric={"reference": {"rate_hz": 20}, "penalties": {"reference_deviation": 1}},
+        )
+
+    def recorded_attempt(self, offset=0.0):
+        attempt = Attempt.objects.create(user=self.user, procedure=self.procedure, duration_seconds=40)
+        moves = [
+            ("move", {"x": np.sin(index / 20) + offset, "y": index / 200, "z": 0.0}, index * 20) for index in range(200)
+        ]
+        persist_events(attempt.id, [*moves[:100], ("step_completed", {"step_id": 1}, 1990), *moves[100:]])
+        persist_events(attempt.id, [("step_completed", {"step_id": 2}, 3990)])
+        return attempt
+
+    def test_banded_dtw_matches_full_dtw(self):
+        generator = np.random.default_rng(3)
+        for n, m in [(30, 30), (40, 25), (12, 50), (1, 6), (6, 1)]:
+            with self.subTest(n=n, m=m):
+                path = np.cumsum(generator.normal(0, 0.1, (n, 3)), axis=0)
+                reference = np.cumsum(generator.normal(0, 0.1, (m, 3)), axis=0)
+                total, path_i, path_j = banded_dtw(path, reference, band=1.0)
+                self.assertAlmostEqual(total, full_dtw(path, reference), places=4)
+                self.assertEqual((path_i[0], path_j[0], path_i[-1], path_j[-1]), (0, 0, n - 1, m - 1))
+                self.assertTrue(np.all(np.diff(path_i) >= 0) and np.all(np.diff(path_j) >= 0))
+                self.assertGreaterEqual(banded_dtw(path, reference, band=0.1)[0], total - 1e-4)
+
+    def test_attempt_is_compared_with_the_closest_reference(self):
+        expert = self.recorded_attempt()
+        far = self.recorded_attempt(offset=0.5)
+        create_reference(far, name="Far")
+        close = create_reference(expert, name="Expert")
+        with self.assertRaisesMessage(ValueError, "no recorded trajectory"):
+            create_reference(Attempt.objects.create(user=self.user, procedure=self.procedure))
+
+        student = self.recorded_attempt(offset=0.01)
+        result = evaluate_attempt(student)
+        self.assertEqual(result.breakdown["reference_id"], close.id)
+        self.assertAlmostEqual(result.breakdown["reference_distance"], 0.01, places=4)
+        self.assertAlmostEqual(result.subscores["reference_similarity"], 100 * np.exp(-0.01 / 0.05), places=1)
+        self.assertEqual(set(result.breakdown["step_deviation"]), {"1", "2"})
+        self.assertAlmostEqual(result.total, 100 - (100 - result.subscores["reference_similarity"]) / 10, places=2)
+        self.assertEqual(asdict(result), asdict(evaluate_attempt(student, mode="aggregate")))
+        self.assertEqual(asdict(result), asdict(score_attempt(student)))
+
+        self.procedure.rubric = {}
+        self.procedure.save()
+        self.assertNotIn("reference_similarity", evaluate_attempt(student).subscores)
+
+    def test_ten_minute_attempt_against_several_references_is_fast(self):
+        t = np.arange(36_000) / 60
+        xyz = np.column_stack([np.sin(t * 0.5), np.cos(t * 0.3), t * 0.01])
+        lengths = [30_000, 32_000, 36_000]
+        references = [(index, pack_samples(t[:length], xyz[:length] + 0.01)) for index, length in enumerate(lengths)]
+        timings = []
+        for _ in range(2):
+            started = time.perf_counter()
+            compared = compare_trajectory(t, xyz, references, step_intervals=[(1, 300.0), (2, 600.0)])
+            timings.append(time.perf_counter() - started)
+        self.assertEqual(compared["reference_id"], 2)
+        self.assertLess(min(timings), 0.5)
+
+    def test_instructors_record_references_from_attempts(self):
+        attempt = self.recorded_attempt()
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username="teacher", password="Pass123!", role="INSTRUCTOR"))
+        url = f"/api/procedures/{self.procedure.id}/references/"
+        response = client.post(url, {"attempt_id": attempt.id, "name": "Experto"}, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["sample_count"], 200)
+        self.assertEqual([row["name"] for row in client.get(url).json()], ["Experto"])
+        self.assertEqual(client.post(url, {"attempt_id": "x"}, format="json").status_code, 400)
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get(url).status_code, 403)
+
+
+class ScoreCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="student", password="Pass123!", role="STUDENT")
+        self.procedure = Procedure.objects.create(
+            name="Cache", description="Test", steps=[{"id": 1, "instruments": ["SCALPEL"]}], rubric={"expected_time_seconds": 60}
+        )
+        self.attempt = Attempt.objects.create(user=self.user, procedure=self.procedure, duration_seconds=90)
+        persist_events(self.attempt.id, [("hit", {"zone": "forbidden"}, 10), ("move", {"x": 0, "y": 0, "z": 0}, 20)])
+        score_cache_stats.reset()
+
+    def assert_cached(self, hit):
+        [(_, result)], rows = rescore_batch([self.attempt.id])
+        self.assertEqual(rows == 0, hit)
+        self.assertEqual(asdict(result), asdict(evaluate_attempt(self.attempt)))
+
+    def test_result_is_reused_until_an_input_changes(self):
+        self.assert_cached(hit=False)
+        self.assert_cached(hit=True)
+        persist_events(self.attempt.id, [("move", {"x": 1, "y": 0, "z": 0}, 30)])
+        self.assert_cached(hit=False)
+        Event.objects.create(attempt=self.attempt, event_type="error", payload={}, timestamp_ms=40)
+        self.assert_cached(hit=False)
+        self.attempt.duration_seconds = 120
+        self.attempt.save(update_fields=["duration_seconds"])
+        self.assert_cached(hit=False)
+        self.procedure.rubric = {"expected_time_seconds": 60, "penalties": {"forbidden_hit": 1}}
+        self.procedure.save()
+        self.assert_cached(hit=False)
+        self.assert_cached(hit=True)
+        event = self.attempt.events.get(event_type="hit")
+        event.payload = {"zone": "target"}
+        event.save()
+        self.assert_cached(hit=False)
+        self.assertEqual(score_cache_stats.snapshot(), {"hits": 2, "misses": 6, "hit_ratio": 0.25})
+
+    def test_rescoring_skips_attempts_with_valid_entries(self):
+        rescore_batch([self.attempt.id])
+        with mock.patch("simulator.rescoring.evaluate_attempt", side_effect=AssertionError("rescored")):
+            results, rows = rescore_batch([self.attempt.id])
+        self.assertEqual(rows, 0)
+        self.assertEqual(asdict(results[0][1]), asdict(evaluate_attempt(self.attempt)))
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username="admin", password="Pass123!", role="ADMIN"))
+        response = client.get("/api/admin/metrics/")
+        self.assertEqual(response.json()["score_cache"]["hits"], 1)
+
+
+class ShadowScoringTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="student", password="Pass123!", role="STUDENT")
+        self.procedure = Procedure.objects.create(
+            name="Shadow",
+            description="Shadow",
+            steps=[{"id": 1, "title": "Step 1", "instruments": ["SCALPEL"], "actions": ["CUT"]}],
+            rubric={"version": "rules_v2", "expected_time_seconds": 60},
+        )
+
+    def completed_attempt(self, events, duration_seconds=30):
+        attempt = Attempt.objects.create(user=self.user, procedure=self.procedure, duration_seconds=duration_seconds)
+        persist_events(attempt.id, events)
+        result = score_attempt(attempt)
+        Attempt.objects.filter(id=attempt.id).update(
+            status=Attempt.Status.COMPLETED, score_total=result.total, subscores=result.subscores
+        )
+        attempt.refresh_from_db()
+        return attempt
+
+    def test_candidates_store_results_without_touching_the_attempt(self):
+        moves = [("move", {"x": 0.01 * index, "y": 1.2, "z": 0.3}, index * 20) for index in range(50)]
+        attempt = self.completed_attempt([("step_completed", {"step_id": 1}, 1000), *moves])
+        rows = run_shadow_scorers(attempt, ["aggregate", "motion", "simulator.missing.scorer"])
+        self.assertEqual([row.scorer for row in rows], ["aggregate", "motion", "simulator.missing.scorer"])
+        stored = {row.scorer: row for row in ShadowScore.objects.filter(attempt=attempt)}
+        self.assertEqual(stored["aggregate"].score_total, attempt.score_total)
+        self.assertIn("motion_quality", stored["motion"].subscores)
+        self.assertNotIn("motion_quality", attempt.subscores)
+        self.assertIn("Unknown shadow scorer", stored["simulator.missing.scorer"].error)
+        self.assertIsNone(stored["simulator.missing.scorer"].score_total)
+
+        run_shadow_scorers(attempt, ["aggregate"])
+        self.assertEqual(ShadowScore.objects.filter(attempt=attempt, scorer="aggregate").count(), 1)
+        self.assertEqual(Attempt.objects.get(id=attempt.id).subscores, attempt.subscores)
+
+    @override_settings(SHADOW_SCORERS=["aggregate"], REPORT_PRERENDER=False)
+    def test_completion_schedules_candidates_after_commit(self):
+        attempt = Attempt.objects.create(user=self.user, procedure=self.procedure)
+        persist_events(attempt.id, [("hit", {"zone": "forbidden"}, 100)])
+        pool = mock.Mock()
+        pool.submit.side_effect = lambda function, *args: function(*args)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch("simulator.background.get_pool", return_value=pool):
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                response = client.post(f"/api/attempts/{attempt.id}/complete/", {"duration_seconds": 30}, format="json")
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(ShadowScore.objects.exists())
+            for callback in callbacks:
+                callback()
+        shadow = ShadowScore.objects.get(attempt=attempt)
+        self.assertEqual(shadow.scorer, "aggregate")
+        self.assertEqual(shadow.score_total, response.json()["score_total"])
+
+    def test_comparison_reports_deltas_correlation_and_drift(self):
+        attempts = [self.completed_attempt([("hit", {"zone": "forbidden"}, 100)] * hits) for hits in (0, 1, 2)]
+        for attempt, shift in zip(attempts, (0, 2, 4)):
+            ShadowScore.objects.create(
+                attempt=attempt,
+                scorer="candidate",
+                score_total=attempt.score_total + shift,
+                subscores={name: value - shift for name, value in attempt.subscores.items()},
+            )
+        ShadowScore.objects.create(attempt=attempts[0], scorer="broken", error="ValueError: boom")
+
+        report = {row["scorer"]: row for row in compare_shadow_scores()}
+        candidate = report["candidate"]
+        self.assertEqual(candidate["attempts"], 3)
+        self.assertEqual(candidate["changed"], 2)
+        self.assertEqual(candidate["mean_delta"], 2)
+        self.assertEqual(candidate["max_abs_delta"], 4)
+        self.assertEqual(candidate["subscores"]["safety"]["mean_delta"], -2)
+        self.assertEqual(candidate["subscores"]["safety"]["correlation"], 1.0)
+        self.assertIsNone(candidate["subscores"]["efficiency"]["correlation"])
+        self.assertEqual(candidate["procedures"][0]["procedure_id"], self.procedure.id)
+        self.assertEqual(report["broken"]["errors"], 1)
+        self.assertEqual(report["broken"]["attempts"], 0)
+
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username="admin", password="Pass123!", role="ADMIN"))
+        response = client.get("/api/admin/shadow-scores/", {"scorer": "candidate"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row["scorer"] for row in response.json()["scorers"]], ["candidate"])
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get("/api/admin/shadow-scores/").status_code, 403)
+
+    def test_shadow_score_command_scores_history(self):
+        attempt = self.completed_attempt([("error", {"code": "WRONG_ACTION"}, 100)])
+        output = StringIO()
+        call_command("shadow_score", "--scorer", "aggregate", stdout=output)
+        self.assertIn("1 attempts scored by aggregate", output.getvalue())
+        self.assertIn("aggregate: 1 attempts, 0 changed", output.getvalue())
+        self.assertTrue(ShadowScore.objects.filter(attempt=attempt, scorer="aggregate").exists())
+        with self.assertRaisesMessage(CommandError, "Unknown shadow scorer"):
+            call_command("shadow_score", "--scorer", "simulator.missing.scorer", stdout=StringIO())
+
+
+class AnalyticsRollupTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.instructor = User.objects.create_user(username="instructor", password="Pass123!", role="INSTRUCTOR")
+        self.student = User.objects.create_user(username="student", password="Pass123!", role="STUDENT")
+        self.client.force_authenticate(self.instructor)
+        self.suture = Procedure.objects.create(name="Sutura", specialty="General", description="Test", steps=[{"id": 1}])
+        self.knot = Procedure.objects.create(name="Nudo", specialty="General", description="Test", steps=[{"id": 1}])
+        self.scope = Procedure.objects.create(name="Artroscopia", specialty="Trauma", description="Test", steps=[{"id": 1}])
+
+    def completed(self, procedure, score, day, subscores=None):
+        attempt = Attempt.objects.create(
+            user=self.student,
+            procedure=procedure,
+            status=Attempt.Status.COMPLETED,
+            ended_at=datetime.datetime.combine(day, datetime.time(12), tzinfo=datetime.timezone.utc),
+            score_total=score,
+            subscores=subscores or {"safety": score},
+        )
+        record_attempt(attempt)
+        return attempt
+
+    def rows(self, model):
+        return [
+            (row.day, row.attempts, row.score_sum, row.score_sq_sum, row.score_min, row.score_max, row.subscore_sums)
+            for row in model.objects.order_by("day", "id")
+        ]
+
+    def test_rollups_match_attempts_and_rebuild(self):
+        monday = datetime.date(2026, 9, 28)
+        scores = [(self.suture, 60.0, 0), (self.suture, 80.0, 0), (self.suture, 70.0, 2), (self.knot, 90.0, 9), (self.scope, 50.0, 3)]
+        for procedure, score, offset in scores:
+            self.completed(procedure, score, monday + datetime.timedelta(days=offset))
+        day = ProcedureDailyStats.objects.get(procedure=self.suture, day=monday)
+        self.assertEqual((day.attempts, day.score_sum, day.score_sq_sum, day.score_min, day.score_max), (2, 140.0, 10000.0, 60.0, 80.0))
+        self.assertEqual((day.subscore_sums, day.subscore_counts), ({"safety": 140.0}, {"safety": 2}))
+        self.assertEqual(SpecialtyDailyStats.objects.get(specialty="General", day=monday).attempts, 2)
+
+        incremental = self.rows(ProcedureDailyStats), self.rows(SpecialtyDailyStats)
+        call_command("rebuild_rollups", stdout=StringIO())
+        self.assertEqual((self.rows(ProcedureDailyStats), self.rows(SpecialtyDailyStats)), incremental)
+
+        response = self.client.get("/api/admin/analytics/rollups/?granularity=week&group=specialty")
+        self.assertEqual(response.status_code, 200)
+        general = next(item for item in response.json()["series"] if item["key"] == "General")
+        self.assertEqual((general["attempts"], general["mean"], general["min"], general["max"]), (4, 75.0, 60.0, 90.0))
+        self.assertAlmostEqual(general["std"], float(np.std([60, 80, 70, 90], ddof=1)), places=4)
+        self.assertEqual(
+            [(period["period"], period["attempts"], period["mean"]) for period in general["periods"]],
+            [("2026-09-28", 3, 70.0), ("2026-10-05", 1, 90.0)],
+        )
+
+        response = self.client.get(f"/api/admin/analytics/rollups/?procedure={self.suture.id}&since=2026-09-29")
+        (suture,) = response.json()["series"]
+        self.assertEqual((suture["label"], suture["attempts"], suture["periods"][0]["period"]), ("Sutura", 1, "2026-09-30"))
+        self.assertEqual(self.client.get("/api/admin/analytics/rollups/?granularity=year").status_code, 400)
+        self.assertEqual(self.client.get("/api/admin/analytics/rollups/?since=soon").status_code, 400)
+
+    def test_overview_reads_rollups_and_completion_updates_them(self):
+        for index in range(6):
+            self.completed(self.suture, 50.0 + index, datetime.date(2026, 10, 1 + index))
+        self.completed(self.knot, 90.0, datetime.date(2026, 10, 2))
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/admin/analytics/")
+        self.assertEqual(
+            [(item["procedure__name"], item["avg_score"], item["attempts"]) for item in response.json()],
+            [("Nudo", 90.0, 1), ("Sutura", 52.5, 6)],
+        )
+
+        attempt = Attempt.objects.create(user=self.student, procedure=self.scope)
+        student = APIClient()
+        student.force_authenticate(self.student)
+        response = student.post(f"/api/attempts/{attempt.id}/complete/", {"duration_seconds": 30}, format="json")
+        self.assertEqual(response.status_code, 200)
+        row = SpecialtyDailyStats.objects.get(specialty="Trauma")
+        self.assertEqual((row.attempts, row.score_sum, row.day), (1, response.json()["score_total"], timezone.localdate()))
+
+
+class LearningCurveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="student", password="Pass123!", role="STUDENT")
+        self.procedure = Procedure.objects.create(name="Curve", description="Test", steps=[{"id": 1}])
+
+    def test_running_moments_match_batch_statistics(self):
+        scores = [52.5, 61.0, 58.25, 70.0, 74.5, 69.0, 81.75, 88.0]
+        curve = LearningCurve(user=self.user, procedure=self.procedure)
+        for score in scores:
+            add_score(curve, score, None)
+        statistics = curve_statistics(curve)
+        self.assertEqual(curve.attempts, 8)
+        self.assertAlmostEqual(curve.mean_score, np.mean(scores))
+        self.assertAlmostEqual(statistics["variance"], np.var(scores, ddof=1), places=4)
+        self.assertAlmostEqual(statistics["slope"], np.polyfit(np.arange(1, 9), scores, 1)[0], places=4)
+        self.assertAlmostEqual(statistics["moving_average"], np.mean(scores[-5:]))
+        self.assertEqual((curve.best_score, curve.last_score, curve.recent_scores), (88.0, 88.0, scores[-5:]))
+
+        single = LearningCurve(user=self.user, procedure=self.procedure)
+        add_score(single, 40.0, None)
+        self.assertEqual(curve_statistics(single), {"variance": 0.0, "std": 0.0, "moving_average": 40.0, "slope": 0.0})
+
+    def test_completion_updates_the_curve_and_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for hits in (2, 1, 0):
+            attempt = Attempt.objects.create(user=self.user, procedure=self.procedure)
+            persist_events(attempt.id, [("hit", {"zone": "forbidden"}, 100 + index) for index in range(hits)])
+            response = client.post(f"/api/attempts/{attempt.id}/complete/", {"duration_seconds": 30}, format="json")
+            self.assertEqual(response.status_code, 200)
+        scores = list(Attempt.objects.order_by("id").values_list("score_total", flat=True))
+
+        curves = client.get("/api/progress/").json()
+        self.assertEqual(len(curves), 1)
+        self.assertEqual(curves[0]["attempts"], 3)
+        self.assertEqual(curves[0]["best_score"], max(scores))
+        self.assertAlmostEqual(curves[0]["slope"], np.polyfit([1, 2, 3], scores, 1)[0], places=4)
+        self.assertGreater(curves[0]["slope"], 0)
+        other = User.objects.create_user(username="other", password="Pass123!", role="STUDENT")
+        self.assertEqual(len(client.get("/api/progress/", {"user": other.id}).json()), 1)
+
+        client.force_authenticate(User.objects.create_user(username="teacher", password="Pass123!", role="INSTRUCTOR"))
+        self.assertEqual(client.get("/api/progress/", {"user": self.user.id}).json(), curves)
+        self.assertEqual(client.get("/api/progress/", {"user": other.id}).json(), [])
+        self.assertEqual(client.get("/api/progress/", {"procedure": "x"}).status_code, 400)
+
+    def test_overlapping_completions_are_counted_once(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        attempt = Attempt.objects.create(user=self.user, procedure=self.procedure)
+        url = f"/api/attempts/{attempt.id}/complete/"
+
+        def complete_concurrently(attempt_id):
+            # Another request completes the attempt after this one passed its status check.
+            with mock.patch("simulator.views.flush_pending_events"):
+                self.assertEqual(client.post(url, {"duration_seconds": 30}, format="json").status_code, 200)
+            return 0
+
+        with mock.patch("simulator.views.flush_pending_events", side_effect=complete_concurrently):
+            response = client.post(url, {"duration_seconds": 45}, format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(LearningCurve.objects.get(user=self.user).attempts, 1)
+        self.assertEqual(ProcedureDailyStats.objects.get(procedure=self.procedure).attempts, 1)
+        attempt.refresh_from_db()
+        self.assertEqual(attempt.duration_seconds, 30)
+
+    def test_rebuild_command_replays_history(self):
+        for score in (40.0, 55.0, 35.0, 70.0):
+            attempt = Attempt.objects.create(
+                user=self.user, procedure=self.procedure, status=Attempt.Status.COMPLETED, score_total=score
+            )
+            attempt.ended_at = attempt.started_at
+            attempt.save(update_fields=["ended_at"])
+            record_completion(attempt)
+        expected = LearningCurve.objects.get()
+        LearningCurve.objects.update(attempts=0, mean_score=0, recent_scores=[])
+
+        output = StringIO()
+        call_command("rebuild_learning_curves", stdout=output)
+        self.assertIn("1 learning curves rebuilt", output.getvalue())
+        rebuilt = LearningCurve.objects.get()
+        for field in ("attempts", "mean_score", "score_m2", "score_comoment", "best_score", "recent_scores"):
+            self.assertAlmostEqual(getattr(rebuilt, field), getattr(expected, field), msg=field)
+
 
 class ReportTests(TestCase):
     def setUp(self):
@@ -87,8 +774,1151 @@ class ReportTests(TestCase):
             is_playable=True,
         )
         self.attempt = Attempt.objects.create(user=self.user, procedure=self.procedure, duration_seconds=100)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.reports = directory.name
+        settings = override_settings(REPORT_ARTIFACT_DIR=self.reports)
+        settings.enable()
+        self.addCleanup(settings.disable)
 
     def test_pdf_report(self):
         response = self.client.get(f"/api/reports/{self.attempt.id}/pdf/")
         self.assertEqual(response.status_code, 200)
         self.assertTrue(response["Content-Type"].startswith("application/pdf"))
+        self.assertIn("ETag", response)
+        self.assertEqual(os.listdir(self.reports), [])
+
+    def complete(self):
+        Attempt.objects.filter(id=self.attempt.id).update(status=Attempt.Status.COMPLETED, ended_at=timezone.now())
+
+    def test_completed_report_is_stored_and_revalidated(self):
+        self.complete()
+        url = f"/api/reports/{self.attempt.id}/pdf/"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        body = b"".join(response.streaming_content)
+        self.assertTrue(body.startswith(b"%PDF"))
+        self.assertIn(f"report_attempt_{self.attempt.id}.pdf", response["Content-Disposition"])
+        self.assertEqual(os.listdir(self.reports), [f"{self.attempt.id}-{response['ETag'].strip(chr(34))}.pdf"])
+
+        with mock.patch("simulator.reports.render_report_pdf") as render:
+            again = self.client.get(url)
+            self.assertEqual(b"".join(again.streaming_content), body)
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(not_modified.status_code, 304)
+            since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"])
+            self.assertEqual(since.status_code, 304)
+        render.assert_not_called()
+        self.assertEqual(again["ETag"], response["ETag"])
+
+    def test_report_is_rendered_again_when_scored_data_or_template_changes(self):
+        self.complete()
+        url = f"/api/reports/{self.attempt.id}/pdf/"
+        first = self.client.get(url)["ETag"]
+        # The report shows the stored score, like every other view, and a download never scores.
+        self.assertFalse(ScoreCacheEntry.objects.exists())
+        Attempt.objects.filter(id=self.attempt.id).update(score_total=42.0, feedback=["Revisar hemostasia."])
+        response = self.client.get(url)
+        second = response["ETag"]
+        self.assertNotEqual(first, second)
+        self.assertEqual(report_snapshot(Attempt.objects.get(id=self.attempt.id))["score_total"], 42.0)
+        with mock.patch("simulator.reports.REPORT_TEMPLATE_VERSION", "test"):
+            third = self.client.get(url, HTTP_IF_NONE_MATCH=second)
+        self.assertEqual(third.status_code, 200)
+        self.assertNotIn(third["ETag"], (first, second))
+        self.assertEqual(len(os.listdir(self.reports)), 1)
+
+    def test_completion_prerenders_the_report_after_commit(self):
+        pool = mock.Mock()
+        pool.submit.side_effect = lambda function, *args: function(*args)
+        with mock.patch("simulator.background.get_pool", return_value=pool):
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(
+                    f"/api/attempts/{self.attempt.id}/complete/", {"duration_seconds": 30}, format="json"
+                )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(os.listdir(self.reports)), 1)
+        with mock.patch("simulator.reports.render_report_pdf") as render:
+            self.assertEqual(self.client.get(f"/api/reports/{self.attempt.id}/pdf/").status_code, 200)
+        render.assert_not_called()
+
+    def export(self, query=""):
+        client = APIClient()
+        client.force_authenticate(User.objects.get_or_create(username="instructor", role="INSTRUCTOR")[0])
+        return client.get(f"/api/admin/export/reports.zip{query}")
+
+    def test_export_streams_a_zip_of_the_matching_reports(self):
+        other = User.objects.create_user(username="other student", password="Pass123!", role="STUDENT")
+        attempts = [
+            Attempt.objects.create(user=user, procedure=self.procedure, duration_seconds=100) for user in (self.user, other)
+        ]
+        Attempt.objects.filter(id__in=[attempt.id for attempt in attempts]).update(
+            status=Attempt.Status.COMPLETED, ended_at=timezone.now()
+        )
+        self.assertEqual(self.client.get("/api/admin/export/reports.zip").status_code, 403)
+
+        response = self.export()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/zip")
+        with zipfile.ZipFile(BytesIO(b"".join(response.streaming_content))) as archive:
+            names = archive.namelist()
+            self.assertEqual(
+                names,
+                [f"student/report_attempt_{attempts[0].id}.pdf", f"other_student/report_attempt_{attempts[1].id}.pdf"],
+            )
+            self.assertTrue(all(archive.read(name).startswith(b"%PDF") for name in names))
+        self.assertEqual(len(os.listdir(self.reports)), 2)
+
+        response = self.export(f"?students={other.id}&since={timezone.localdate().isoformat()}")
+        with zipfile.ZipFile(BytesIO(b"".join(response.streaming_content))) as archive:
+            self.assertEqual(archive.namelist(), [f"other_student/report_attempt_{attempts[1].id}.pdf"])
+        self.assertEqual(self.export("?until=yesterday").status_code, 400)
+
+    @override_settings(REPORT_EXPORT_WORKERS=0)
+    def test_export_reuses_stored_reports(self):
+        self.complete()
+        path = store_report(self.attempt.id, report_snapshot(Attempt.objects.get(id=self.attempt.id)))
+        with mock.patch("simulator.reports.render_report_pdf") as render:
+            response = self.export(f"?procedure={self.procedure.id}")
+            with zipfile.ZipFile(BytesIO(b"".join(response.streaming_content))) as archive:
+                self.assertEqual(archive.read(f"student/report_attempt_{self.attempt.id}.pdf"), path.read_bytes())
+        render.assert_not_called()
+
+
+@override_settings(TRAJECTORY_CHUNK_SAMPLES=16)
+class ReportTimelineTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="student", password="Pass123!", role="STUDENT")
+        self.client.force_authenticate(self.user)
+        self.procedure = Procedure.objects.create(name="Timeline", description="Test", steps=[{"id": 1}, {"id": 2}])
+        self.attempt = Attempt.objects.create(user=self.user, procedure=self.procedure)
+        events = []
+        for index in range(120):
+            timestamp_ms = index * 10
+            events.append(("move", {"x": index / 100, "y": 1.0, "z": 0.0, "screen": {"x": 0.5, "y": 0.25}}, timestamp_ms))
+            if index % 7 == 0:
+                events.append(("hit", {"zone": "target"}, timestamp_ms))
+            if index % 11 == 0:
+                # Extra keys keep a move as an Event row, next to the packed samples of the same millisecond.
+                events.append(("move", {"x": 0.0, "y": 0.0, "z": 0.0, "pressure": 1}, timestamp_ms))
+        events += [("step_completed", {"step_id": 2}, 700), ("step_completed", {"step_id": 1}, 300)]
+        for start in range(0, len(events), 40):
+            persist_events(self.attempt.id, events[start : start + 40])
+
+    def read_pages(self, query):
+        events, after = [], ""
+        while True:
+            response = self.client.get(f"/api/reports/{self.attempt.id}/events/?{query}&after={after}")
+            self.assertEqual(response.status_code, 200)
+            events += response.json()["results"]
+            after = response.json()["next"]
+            if after is None:
+                return events
+
+    def test_pages_follow_the_merged_event_stream(self):
+        self.assertGreater(TrajectoryChunk.objects.filter(attempt=self.attempt).count(), 3)
+        stream = [
+            {"event_type": event.event_type, "payload": event.payload, "timestamp_ms": event.timestamp_ms}
+            for event in iter_attempt_events(self.attempt.id)
+        ]
+        self.assertEqual(self.read_pages("limit=7"), stream)
+        self.assertEqual(
+            self.read_pages("limit=5&type=hit,step_completed"),
+            [event for event in stream if event["event_type"] in {"hit", "step_completed"}],
+        )
+        self.assertEqual(self.read_pages("limit=1000"), stream)
+        bad = self.client.get(f"/api/reports/{self.attempt.id}/events/?after=not-a-cursor")
+        self.assertEqual(bad.status_code, 400)
+        self.assertEqual(self.client.get(f"/api/reports/{self.attempt.id}/events/?limit=0").status_code, 400)
+
+    def test_summary_counts_packed_moves(self):
+        response = self.client.get(f"/api/reports/{self.attempt.id}/summary/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["event_counts"], {"move": 131, "hit": 18, "step_completed": 2})
+        self.assertEqual(response.json()["completed_steps"], [1, 2])
+
+        other = User.objects.create_user(username="other", password="Pass123!", role="STUDENT")
+        self.client.force_authenticate(other)
+        for path in ("summary", "events", "trajectory"):
+            self.assertEqual(self.client.get(f"/api/reports/{self.attempt.id}/{path}/").status_code, 403)
+
+    def test_lttb_keeps_endpoints_and_spikes(self):
+        t = np.arange(1000, dtype=float)
+        values = np.zeros(1000)
+        values[437] = 5.0
+        kept = lttb(np.column_stack([t, values]), 50)
+        self.assertEqual(len(kept), 50)
+        self.assertEqual((kept[0], kept[-1]), (0, 999))
+        self.assertIn(437, kept)
+        self.assertTrue(np.all(np.diff(kept) > 0))
+        np.testing.assert_array_equal(lttb(np.zeros((10, 3)), 20), np.arange(10))
+
+        response = self.client.get(f"/api/reports/{self.attempt.id}/trajectory/?points=20")
+        data = response.json()
+        self.assertEqual((data["samples"], data["points"], len(data["x"])), (131, 20, 20))
+        self.assertEqual(data["t_ms"][0], 0)
+        self.assertIn(None, data["screen_x"])
+        self.assertIn(0.5, data["screen_x"])
+        self.assertEqual(self.client.get(f"/api/reports/{self.attempt.id}/trajectory/?points=2").status_code, 400)
+
+    def test_histograms_bin_screen_positions_and_time(self):
+        Event.objects.create(
+            attempt=self.attempt, event_type="error", payload={"screen": {"x": 0.99, "y": 0.01}}, timestamp_ms=1190
+        )
+        response = self.client.get(f"/api/reports/{self.attempt.id}/histograms/?width=4&height=2&buckets=12")
+        self.assertEqual(response.status_code, 200)
+        heatmap, timeline = response.json()["heatmap"], response.json()["timeline"]
+        self.assertEqual(heatmap["counts"]["move"], [[0, 0, 120, 0], [0, 0, 0, 0]])
+        self.assertEqual(heatmap["counts"]["error"], [[0, 0, 0, 1], [0, 0, 0, 0]])
+        self.assertNotIn("hit", heatmap["counts"])
+        self.assertEqual((timeline["start_ms"], timeline["bucket_ms"]), (0, 100))
+        self.assertEqual(timeline["counts"]["move"][:3], [11, 11, 11])
+        self.assertEqual(timeline["counts"]["error"], [0] * 11 + [1])
+        self.assertEqual({name: sum(counts) for name, counts in timeline["counts"].items()}, event_counts(self.attempt.id))
+        self.assertEqual(self.client.get(f"/api/reports/{self.attempt.id}/histograms/?width=0").status_code, 400)
+
+    def test_histograms_of_completed_attempts_are_cached(self):
+        histogram_cache.clear()
+        Attempt.objects.filter(id=self.attempt.id).update(status=Attempt.Status.COMPLETED)
+        url = f"/api/reports/{self.attempt.id}/histograms/"
+        first = self.client.get(url).json()
+        with mock.patch("simulator.timeline._compute_histograms") as compute:
+            self.assertEqual(self.client.get(url).json(), first)
+        compute.assert_not_called()
+        Event.objects.create(attempt=self.attempt, event_type="hit", payload={}, timestamp_ms=50)
+        self.assertEqual(sum(self.client.get(url).json()["timeline"]["counts"]["hit"]), 19)
+        self.assertEqual(histogram_cache.stats()["hits"], 1)
+
+
+class EventBufferTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="student", password="Pass123!", role="STUDENT")
+        self.procedure = Procedure.objects.create(name="Buffer", description="Test", steps=[{"id": 1}])
+        self.attempt = Attempt.objects.create(user=self.user, procedure=self.procedure)
+
+    def test_size_threshold_and_flush(self):
+        buffer = EventBuffer(self.attempt.id, max_events=3)
+        self.assertFalse(buffer.add("move", {"x": 1}, 10))
+        self.assertFalse(buffer.add("move", {"x": 2}, 20))
+        self.assertTrue(buffer.add("hit", {"zone": "target"}, 30))
+        self.assertEqual(Event.objects.count(), 0)
+        self.assertEqual(buffer.flush(), 3)
+        self.assertEqual(list(self.attempt.events.order_by("timestamp_ms").values_list("timestamp_ms", flat=True)), [10, 20, 30])
+        self.assertEqual(len(buffer), 0)
+
+    def test_failed_flush_keeps_the_batch(self):
+        buffer = EventBuffer(self.attempt.id)
+        buffer.add("step_completed", {"step_id": 1}, 100)
+        with mock.patch("simulator.ingest.persist_events", side_effect=OperationalError("database is locked")):
+            with self.assertRaises(OperationalError):
+                buffer.flush()
+        buffer.add("action", {"type": "CUT"}, 200)
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(list(self.attempt.events.order_by("timestamp_ms").values_list("timestamp_ms", flat=True)), [100, 200])
+
+    def test_events_that_cannot_be_stored_are_set_aside(self):
+        ingest_stats.reset()
+        buffer = EventBuffer(self.attempt.id)
+        register_buffer(buffer)
+        self.addCleanup(unregister_buffer, buffer)
+        buffer.add("step_completed", {"step_id": 1}, 100)
+        buffer.add("hit", {"zone": "target", "x": float("nan")}, 110)
+        buffer.add("action", {"type": "CUT"}, 120)
+        with self.assertLogs("simulator.ingest", "WARNING"):
+            self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(len(buffer), 0)
+        self.assertEqual(list(self.attempt.events.order_by("timestamp_ms").values_list("timestamp_ms", flat=True)), [100, 120])
+        self.assertEqual(ingest_stats.snapshot()["rejected_events"], 1)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(f"/api/attempts/{self.attempt.id}/complete/", {"duration_seconds": 30}, format="json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_complete_flushes_registered_buffers(self):
+        buffer = EventBuffer(self.attempt.id)
+        register_buffer(buffer)
+        self.addCleanup(unregister_buffer, buffer)
+        buffer.add("step_completed", {"step_id": 1}, 100)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(f"/api/attempts/{self.attempt.id}/complete/", {"duration_seconds": 30}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.attempt.events.count(), 1)
+        self.assertEqual(response.data["subscores"]["protocol_adherence"], 100)
+        self.assertEqual(flush_attempt_buffers(self.attempt.id), 0)
+
+
+class EventSpoolTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="student", password="Pass123!", role="STUDENT")
+        self.procedure = Procedure.objects.create(name="Spool", description="Test", steps=[{"id": 1}])
+        self.attempt = Attempt.objects.create(user=self.user, procedure=self.procedure)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def enable_spool(self):
+        overrides = override_settings(
+            EVENT_SPOOL_ENABLED=True, EVENT_SPOOL_DIR=self.directory, EVENT_SPOOL_FLUSH_INTERVAL_MS=3600000
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        spool._spool = None
+        self.addCleanup(setattr, spool, "_spool", None)
+        event_spool = spool.get_spool()
+        self.addCleanup(event_spool.flusher.stopped.set)
+        return event_spool
+
+    def test_segment_reader_stops_at_torn_tail(self):
+        event_spool = spool.EventSpool(self.directory, fsync_every=2, fsync_interval_ms=60000, segment_max_bytes=2**20)
+        event_spool.append(self.attempt.id, [("move", {"x": 1}, 10), ("hit", {"zone": "target"}, 20)])
+        self.assertEqual(event_spool.fsyncs, 1)
+        event_spool.seal()
+        (segment,) = os.listdir(self.directory)
+        path = os.path.join(self.directory, segment)
+        with open(path, "ab") as handle:
+            handle.write(spool.RECORD_HEADER.pack(100, 0) + b"[1,")
+        records = list(spool.read_segment(spool.Path(path)))
+        self.assertEqual(records, [(self.attempt.id, "move", {"x": 1}, 10), (self.attempt.id, "hit", {"zone": "target"}, 20)])
+
+    def test_rest_events_are_spooled_until_completion(self):
+        event_spool = self.enable_spool()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(
+            f"/api/attempts/{self.attempt.id}/event/",
+            {"event_type": "step_completed", "payload": {"step_id": 1}, "t_ms": 100},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.attempt.events.count(), 0)
+        self.assertEqual(event_spool.appended, 1)
+        response = client.post(f"/api/attempts/{self.attempt.id}/complete/", {"duration_seconds": 30}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.attempt.events.count(), 1)
+        self.assertEqual(response.data["subscores"]["protocol_adherence"], 100)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_completion_drains_only_its_attempt(self):
+        event_spool = self.enable_spool()
+        other = Attempt.objects.create(user=self.user, procedure=self.procedure)
+        event_spool.append(other.id, [("hit", {"zone": "target"}, 10)])
+        event_spool.append(self.attempt.id, [("step_completed", {"step_id": 1}, 100)])
+        event_spool.seal()
+        event_spool.append(other.id, [("hit", {"zone": "target"}, 20)])
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(f"/api/attempts/{self.attempt.id}/complete/", {"duration_seconds": 30}, format="json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.attempt.events.count(), 1)
+        self.assertEqual(other.events.count(), 0)
+        remaining = [record for path in sorted(spool.Path(self.directory).iterdir()) for record in spool.read_segment(path)]
+        self.assertEqual([record[3] for record in remaining], [10, 20])
+        self.assertEqual(event_spool.drain(), 2)
+        self.assertEqual(other.events.count(), 2)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_only_failing_records_are_quarantined(self):
+        event_spool = spool.EventSpool(self.directory)
+        other = Attempt.objects.create(user=self.user, procedure=self.procedure)
+        event_spool.append(self.attempt.id, [("hit", {"zone": "target"}, 5), (None, {}, 10)])
+        event_spool.append(other.id, [("error", {}, 15)])
+        event_spool.seal()
+        event_spool.append(self.attempt.id, [("hit", {"zone": "target"}, 20)])
+        with self.assertLogs("simulator.spool", "ERROR"), self.assertLogs("simulator.ingest", "WARNING"):
+            self.assertEqual(event_spool.drain(), 3)
+        self.assertEqual(sorted(self.attempt.events.values_list("timestamp_ms", flat=True)), [5, 20])
+        self.assertEqual(other.events.count(), 1)
+        (quarantined,) = os.listdir(self.directory)
+        self.assertTrue(quarantined.endswith(spool.SEALED_SUFFIX + spool.QUARANTINE_SUFFIX))
+        self.assertEqual(
+            list(spool.read_segment(spool.Path(self.directory, quarantined))), [(self.attempt.id, None, {}, 10)]
+        )
+        self.assertEqual(event_spool.stats()["quarantined"], 1)
+        self.assertEqual(event_spool.stats()["pending_segments"], 0)
+
+    def test_unavailable_database_keeps_the_attempts_not_yet_stored(self):
+        event_spool = spool.EventSpool(self.directory)
+        other = Attempt.objects.create(user=self.user, procedure=self.procedure)
+        event_spool.append(self.attempt.id, [("hit", {"zone": "target"}, 5)])
+        event_spool.append(other.id, [("error", {}, 15)])
+
+        def failing_for_other(attempt_id, events, close_zones=False):
+            if attempt_id == other.id:
+                raise OperationalError("database is locked")
+            return persist_events(attempt_id, events, close_zones)
+
+        with mock.patch("simulator.ingest.persist_events", side_effect=failing_for_other):
+            with self.assertRaises(OperationalError):
+                event_spool.drain()
+        self.assertEqual(self.attempt.events.count(), 1)
+        self.assertEqual(event_spool.drain(), 1)
+        self.assertEqual(self.attempt.events.count(), 1)
+        self.assertEqual(other.events.count(), 1)
+
+    def test_replay_command_stores_segments_of_stopped_processes(self):
+        event_spool = spool.EventSpool(self.directory)
+        event_spool.append(self.attempt.id, [("step_completed", {"step_id": 1}, 100), ("move", {"x": 1, "y": 2, "z": 3}, 50)])
+        event_spool.append(self.attempt.id + 1000, [("hit", {"zone": "target"}, 10)])
+        event_spool._handle.close()
+        stale = os.path.join(self.directory, "spool-999999999-1-000000.open")
+        os.rename(event_spool._path, stale)
+
+        output = StringIO()
+        call_command("replay_event_spool", "--dir", self.directory, "--dry-run", stdout=output)
+        self.assertIn("1 segments, would store 3 events", output.getvalue())
+        call_command("replay_event_spool", "--dir", self.directory, stdout=output)
+        self.assertIn("1 segments, stored 2 events", output.getvalue())
+        self.assertEqual([event.event_type for event in iter_attempt_events(self.attempt.id)], ["move", "step_completed"])
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+def websocket_communicator(path, user, subprotocols=None):
+    scope = {
+        "type": "websocket",
+        "path": path,
+        "query_string": b"",
+        "headers": [],
+        "subprotocols": subprotocols or [],
+        "user": user,
+    }
+    return ApplicationCommunicator(URLRouter(websocket_urlpatterns), scope)
+
+
+class ZoneEngineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="student", password="Pass123!", role="STUDENT")
+        self.procedure = Procedure.objects.create(
+            name="Zones",
+            description="Test",
+            steps=[{"id": 1}],
+            zones={
+                "target": {"x": 0.0, "y": 0.0, "z": 0.0, "radius": 0.2},
+                "regions": [
+                    {"id": "nerve", "kind": "forbidden", "shape": "capsule", "a": [1, 0, 0], "b": [1, 1, 0], "radius": 0.1},
+                    {"id": "field", "kind": "forbidden", "shape": "box", "min": [2, 0, 0], "max": [3, 1, 1]},
+                ],
+            },
+        )
+        self.attempt = Attempt.objects.create(user=self.user, procedure=self.procedure)
+
+    def test_index_matches_brute_force_for_many_zones(self):
+        generator = np.random.default_rng(3)
+        regions = random_regions(generator, 300)
+        regions.append({"id": "room", "kind": "target", "shape": "box", "min": [-5, -5, -5], "max": [5, 5, 5]})
+        index = ZoneIndex({"regions": regions})
+        self.assertEqual(list(index.global_zones), [300])
+        points = generator.uniform(-1.1, 1.1, (2000, 3))
+        samples, zones = index.query(points)
+        every_sample = np.repeat(np.arange(len(points)), len(index))
+        every_zone = np.tile(np.arange(len(index)), len(points))
+        inside = index._contains(points[every_sample], every_zone)
+        expected = zip(every_sample[inside].tolist(), every_zone[inside].tolist())
+        self.assertEqual(sorted(zip(samples.tolist(), zones.tolist())), sorted(expected))
+        self.assertGreater(len(samples), 2000)
+
+    def test_tracker_derives_entries_exits_and_contact_across_batches(self):
+        tracker = ZoneTracker(ZoneIndex(self.procedure.zones))
+        first = tracker.feed([(0, {"x": 0.5, "y": 0, "z": 0}), (10, {"x": 0.05, "y": 0, "z": 0}), (20, {"x": 1.05, "y": 0.5, "z": 0})])
+        tracker = ZoneTracker(tracker.index, tracker.state())
+        second = tracker.feed([(30, {"x": 1.0, "y": 0.9, "z": 0}), (40, {"x": 2.5, "y": 0.5, "z": 0.5})])
+        closing = tracker.close()
+        summary = [(event_type, payload["zone_id"], timestamp_ms) for event_type, payload, timestamp_ms in first + second + closing]
+        self.assertEqual(
+            summary,
+            [
+                ("hit", "target", 10),
+                ("zone_exit", "target", 20),
+                ("contact_duration", "target", 20),
+                ("hit", "nerve", 20),
+                ("zone_exit", "nerve", 40),
+                ("contact_duration", "nerve", 40),
+                ("hit", "field", 40),
+                ("zone_exit", "field", 40),
+                ("contact_duration", "field", 40),
+            ],
+        )
+        self.assertEqual(second[1][1]["duration_ms"], 20)
+
+    def test_client_zone_events_are_kept_for_audit_and_not_scored(self):
+        persist_events(
+            self.attempt.id,
+            [
+                ("hit", {"zone": "forbidden", "source": "server"}, 5),
+                ("contact_duration", {"zone": "forbidden", "duration_ms": 900}, 6),
+                ("move", {"x": 0.0, "y": 0.0, "z": 0.0}, 10),
+                ("move", {"x": 1.0, "y": 0.5, "z": 0.05}, 20),
+            ],
+        )
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post(f"/api/attempts/{self.attempt.id}/complete/", {"duration_seconds": 30}, format="json")
+        self.assertEqual(response.status_code, 200)
+        hits = [
+            (event.payload["source"], event.payload.get("zone_id"), event.payload["zone"])
+            for event in self.attempt.events.filter(event_type="hit").order_by("timestamp_ms")
+        ]
+        self.assertEqual(hits, [("client", None, "forbidden"), ("server", "target", "target"), ("server", "nerve", "forbidden")])
+        contacts = list(
+            self.attempt.events.filter(event_type="contact_duration", payload__source="server").values_list("payload", flat=True)
+        )
+        self.assertEqual([(contact["zone_id"], contact["duration_ms"]) for contact in contacts], [("target", 10), ("nerve", 0)])
+        self.attempt.refresh_from_db()
+        self.assertEqual(self.attempt.score_breakdown["forbidden_hits"], 1)
+        self.assertEqual(self.attempt.score_breakdown["forbidden_contact_ms"], 0)
+        for mode in ("stream", "aggregate"):
+            self.assertEqual(evaluate_attempt(self.attempt, mode=mode).breakdown, self.attempt.score_breakdown)
+        [(_, rescored)], _ = rescore_batch([self.attempt.id], use_cache=False)
+        self.assertEqual(rescored.breakdown, self.attempt.score_breakdown)
+
+    def test_procedure_zones_are_validated(self):
+        serializer = ProcedureSerializer(
+            data={"name": "Bad", "description": "Test", "zones": {"regions": [{"kind": "target", "shape": "cone"}]}}
+        )
+        self.assertFalse(serializer.is_valid())
+        self.assertIn("zones", serializer.errors)
+
+
+class ProcedurePlanTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="student", password="Pass123!", role="STUDENT")
+        self.procedure = Procedure.objects.create(
+            name="Plan",
+            description="Test",
+            steps=[
+                {"id": 1, "title": "Incisión", "instruments": ["SCALPEL"]},
+                {"id": 2, "title": "Cierre", "instruments": ["NEEDLE", ["not", "hashable"]]},
+                {"id": 1, "title": "Duplicado"},
+            ],
+            rubric={"penalties": {"forbidden_hit": 10}, "expected_time_seconds": 60},
+            zones={"target": {"x": 0.0, "y": 0.0, "z": 0.0, "radius": 0.2}},
+        )
+        procedure_cache.clear()
+
+    def test_plan_resolves_steps_penalties_and_zones(self):
+        plan = get_compiled_procedure(self.procedure)
+        self.assertEqual(plan.step_index, {1: 0, 2: 1})
+        self.assertEqual(plan.step(2)["title"], "Cierre")
+        self.assertIsNone(plan.step(3))
+        self.assertEqual(plan.step_instruments[0], frozenset({"SCALPEL"}))
+        self.assertEqual(plan.step_instruments[1], ("NEEDLE", ["not", "hashable"]))
+        self.assertEqual((plan.penalties.forbidden_hit, plan.penalties.wrong_action), (10, 4))
+        self.assertEqual(plan.expected_time, 60)
+        self.assertEqual(plan.completed_count({1}), 2)
+        self.assertEqual(plan.expected_tools({1}), ("NEEDLE", ["not", "hashable"]))
+        self.assertEqual(len(plan.zone_index), 1)
+        self.assertIs(get_compiled_procedure(self.procedure.id), plan)
+        self.assertEqual(procedure_cache.stats()["hits"], 1)
+
+    def test_save_bumps_revision_and_invalidates_plan(self):
+        plan = get_compiled_procedure(self.procedure)
+        self.procedure.rubric = {"penalties": {"forbidden_hit": 1}}
+        self.procedure.save(update_fields=["rubric"])
+        self.procedure.refresh_from_db()
+        self.assertEqual(self.procedure.revision, plan.revision + 1)
+        self.assertEqual(procedure_cache.stats()["size"], 0)
+        self.assertEqual(get_compiled_procedure(self.procedure).penalties.forbidden_hit, 1)
+
+    def test_stale_revision_from_another_process_is_rebuilt(self):
+        attempt = Attempt.objects.create(user=self.user, procedure=self.procedure)
+        persist_events(attempt.id, [("error", {}, 0)])
+        self.assertEqual(live_score(attempt.id)["breakdown"]["wrong_actions"], 1)
+        # A save in another worker bumps the revision without reaching this process's signals.
+        Procedure.objects.filter(id=self.procedure.id).update(
+            rubric={"penalties": {"wrong_action": 50}}, revision=self.procedure.revision + 1
+        )
+        self.assertEqual(live_score(attempt.id)["total"], 100 - 50 - 3 * 5)
+
+
+class TrajectoryStoreTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="student", password="Pass123!", role="STUDENT")
+        self.procedure = Procedure.objects.create(
+            name="Trajectory",
+            description="Test",
+            steps=[{"id": 1, "instruments": ["SCALPEL"], "actions": ["CUT"]}],
+            rubric={"expected_time_seconds": 60},
+        )
+        self.attempt = Attempt.objects.create(user=self.user, procedure=self.procedure, duration_seconds=1)
+
+    def _events(self):
+        moves = [
+            ("move", {"x": 0.5, "y": 1.25, "z": -0.5, "tool": "SCALPEL", "screen": {"x": 0.5, "y": 0.25}}, t)
+            for t in range(0, 800, 80)
+        ]
+        return moves + [
+            ("move", {"x": 1.0, "y": 1.0, "z": 1.0, "tool": None, "screen": None}, 805),
+            ("move", {"x": "bad"}, 810),
+            ("hit", {"zone": "forbidden"}, 400),
+            ("step_completed", {"step_id": 1}, 900),
+        ]
+
+    @override_settings(TRAJECTORY_CHUNK_SAMPLES=4)
+    def test_moves_are_packed_and_merged_back_in_order(self):
+        persist_events(self.attempt.id, self._events()[:6])
+        persist_events(self.attempt.id, self._events()[6:])
+        self.assertEqual(self.attempt.events.filter(event_type="move").count(), 1)
+        chunks = list(self.attempt.trajectory_chunks.order_by("sequence"))
+        self.assertEqual([chunk.sample_count for chunk in chunks], [4, 4, 3])
+        self.assertEqual(chunks[0].tools, ["SCALPEL"])
+
+        stream = list(iter_attempt_events(self.attempt.id))
+        self.assertEqual([event.timestamp_ms for event in stream], sorted(event[2] for event in self._events()))
+        first = stream[0]
+        self.assertEqual(first.payload, {"x": 0.5, "y": 1.25, "z": -0.5, "tool": "SCALPEL", "screen": {"x": 0.5, "y": 0.25}})
+        self.assertIsNone(stream[-3].payload["screen"])
+
+    def test_moves_beyond_the_packed_limits_are_kept(self):
+        persist_events(
+            self.attempt.id,
+            [
+                ("move", {"x": 1e39, "y": 0.0, "z": 0.0}, 10),
+                ("move", {"x": 0.0, "y": 0.0, "z": 0.0, "screen": {"x": -1e39, "y": 0.0}}, 20),
+            ],
+        )
+        self.assertEqual(self.attempt.events.filter(event_type="move").count(), 2)
+        moves = [("move", {"x": 0.0, "y": 0.0, "z": 0.0, "tool": f"TOOL{t}"}, t) for t in range(300)]
+        persist_events(self.attempt.id, moves[:10])
+        persist_events(self.attempt.id, moves[10:])
+        chunks = list(self.attempt.trajectory_chunks.order_by("sequence"))
+        self.assertEqual([len(chunk.tools) for chunk in chunks], [255, 45])
+        tools = [event.payload["tool"] for event in iter_attempt_events(self.attempt.id) if "tool" in event.payload]
+        self.assertEqual(tools, [f"TOOL{t}" for t in range(300)])
+
+    def test_pack_command_keeps_scoring_results(self):
+        for event_type, payload, timestamp_ms in self._events():
+            Event.objects.create(attempt=self.attempt, event_type=event_type, payload=payload, timestamp_ms=timestamp_ms)
+        before = evaluate_attempt(self.attempt)
+        call_command("pack_trajectories", stdout=StringIO())
+        self.assertEqual(self.attempt.events.filter(event_type="move").count(), 1)
+        self.assertEqual(TrajectoryChunk.objects.get().sample_count, 11)
+        self.assertEqual(evaluate_attempt(self.attempt), before)
+
+
+class BulkEventIngestTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username="student", password="Pass123!", role="STUDENT")
+        self.client.force_authenticate(self.user)
+        self.procedure = Procedure.objects.create(name="Bulk", description="Test")
+        self.attempt = Attempt.objects.create(user=self.user, procedure=self.procedure)
+        self.url = f"/api/attempts/{self.attempt.id}/events/bulk/"
+
+    @override_settings(EVENT_INGEST_CHUNK_SIZE=2)
+    def test_json_array_is_ingested_in_chunks(self):
+        events = [
+            {"event_type": "move", "payload": {"x": 1}, "timestamp_ms": 10},
+            {"event_type": "hit", "payload": {"zone": "target"}, "t_ms": 20},
+            {"payload": {"missing": "type"}},
+        ]
+        response = self.client.post(self.url, events, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 2)
+        self.assertEqual(response.data["rejected"], 1)
+        self.assertEqual([chunk["received"] for chunk in response.data["chunks"]], [2, 1])
+        self.assertEqual(response.data["chunks"][1]["errors"][0]["index"], 2)
+        self.assertEqual(sorted(self.attempt.events.values_list("timestamp_ms", flat=True)), [10, 20])
+
+    def test_ndjson_body_and_authorization(self):
+        body = "\n".join(
+            [json.dumps({"event_type": "move", "payload": {"x": index}, "timestamp_ms": index}) for index in range(5)]
+            + ["not json", ""]
+        )
+        response = self.client.post(self.url, body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 5)
+        self.assertEqual(response.data["rejected"], 1)
+
+        body = json.dumps({"event_type": "hit", "timestamp_ms": 9}).encode() + b"\n\xff\xfe\n"
+        response = self.client.post(self.url, body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("line 2", response.data["detail"])
+
+        other = User.objects.create_user(username="other", password="Pass123!", role="STUDENT")
+        self.client.force_authenticate(other)
+        response = self.client.post(self.url, body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.attempt.events.count(), 5)
+
+    def test_non_finite_numbers_are_rejected(self):
+        body = "\n".join(
+            [
+                '{"event_type": "move", "payload": {"x": NaN}, "timestamp_ms": 1}',
+                '{"event_type": "move", "payload": {"x": [1e400]}, "timestamp_ms": 2}',
+                '{"event_type": "move", "payload": {"x": 1}, "timestamp_ms": 3}',
+            ]
+        )
+        response = self.client.post(self.url, body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["created"], 1)
+        self.assertEqual(response.data["rejected"], 2)
+
+        response = self.client.post(
+            self.url, '[{"event_type": "move", "payload": {"x": -1e400}}]', content_type="application/json"
+        )
+        self.assertEqual(response.data["rejected"], 1)
+        response = self.client.post(
+            f"/api/attempts/{self.attempt.id}/event/",
+            '{"event_type": "hit", "payload": {"severity": 1e999}}',
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.attempt.events.count(), 1)
+
+
+class AttemptConsumerTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="student", password="Pass123!", role="STUDENT")
+        self.procedure = Procedure.objects.create(name="Socket", description="Test")
+        self.attempt = Attempt.objects.create(user=self.user, procedure=self.procedure)
+
+    @override_settings(EVENT_BUFFER_MAX_EVENTS=2)
+    def test_events_are_buffered_until_threshold_and_disconnect(self):
+        ingest_stats.reset()
+
+        async def scenario():
+            communicator = websocket_communicator(f"/ws/attempts/{self.attempt.id}/", self.user)
+            await communicator.send_input({"type": "websocket.connect"})
+            self.assertEqual((await communicator.receive_output())["type"], "websocket.accept")
+            for index in range(3):
+                frame = {"event_type": "move", "timestamp_ms": index * 80, "payload": {"x": index}}
+                await communicator.send_input({"type": "websocket.receive", "text": json.dumps(frame)})
+                self.assertEqual(json.loads((await communicator.receive_output())["text"]), {"status": "ok"})
+            stored_before_disconnect = await Event.objects.acount()
+            await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+            await communicator.wait()
+            return stored_before_disconnect
+
+        self.assertEqual(async_to_sync(scenario)(), 2)
+        self.assertEqual(Event.objects.count(), 3)
+        self.assertEqual(ingest_stats.snapshot()["flushes"], 2)
+
+    def test_malformed_text_frames_are_rejected(self):
+        frames = [
+            "not json",
+            json.dumps({"timestamp_ms": 10}),
+            json.dumps({"event_type": 5}),
+            json.dumps({"event_type": "hit", "payload": [1, 2]}),
+            json.dumps({"event_type": "hit", "timestamp_ms": "soon"}),
+            '{"event_type": "move", "payload": {"x": NaN, "y": 0, "z": 0}}',
+            '{"event_type": "move", "payload": {"x": 1e400, "y": 0, "z": 0}}',
+            json.dumps({"event_type": "step_completed", "timestamp_ms": 20, "payload": {"step_id": 1}}),
+        ]
+
+        async def scenario():
+            communicator = websocket_communicator(f"/ws/attempts/{self.attempt.id}/", self.user)
+            await communicator.send_input({"type": "websocket.connect"})
+            await communicator.receive_output()
+            replies = []
+            for frame in frames:
+                await communicator.send_input({"type": "websocket.receive", "text": frame})
+                replies.append(json.loads((await communicator.receive_output())["text"])["status"])
+            await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+            await communicator.wait()
+            return replies
+
+        self.assertEqual(async_to_sync(scenario)(), ["error"] * 7 + ["ok"])
+        self.assertEqual(list(Event.objects.values_list("event_type", flat=True)), ["step_completed"])
+
+    def test_spool_appends_run_off_the_event_loop(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        overrides = override_settings(
+            EVENT_SPOOL_ENABLED=True, EVENT_SPOOL_DIR=directory.name, EVENT_SPOOL_FLUSH_INTERVAL_MS=3600000
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        spool._spool = None
+        self.addCleanup(setattr, spool, "_spool", None)
+        event_spool = spool.get_spool()
+        self.addCleanup(event_spool.flusher.stopped.set)
+        append_threads = []
+        append = event_spool.append
+
+        def recording_append(*args):
+            append_threads.append(threading.get_ident())
+            return append(*args)
+
+        async def scenario():
+            communicator = websocket_communicator(f"/ws/attempts/{self.attempt.id}/", self.user)
+            await communicator.send_input({"type": "websocket.connect"})
+            await communicator.receive_output()
+            frame = {"event_type": "step_completed", "timestamp_ms": 10, "payload": {"step_id": 1}}
+            await communicator.send_input({"type": "websocket.receive", "text": json.dumps(frame)})
+            await communicator.receive_output()
+            await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+            await communicator.wait()
+            return threading.get_ident()
+
+        with mock.patch.object(event_spool, "append", recording_append):
+            loop_thread = async_to_sync(scenario)()
+        self.assertTrue(append_threads)
+        self.assertNotIn(loop_thread, append_threads)
+        self.assertEqual(event_spool.appended, 1)
+
+    def test_forbidden_warning_comes_from_the_zone_engine(self):
+        self.procedure.zones = {"forbidden": {"x": 1.0, "y": 0.0, "z": 0.0, "radius": 0.2}}
+        self.procedure.save()
+
+        async def scenario():
+            communicator = websocket_communicator(f"/ws/attempts/{self.attempt.id}/", self.user)
+            await communicator.send_input({"type": "websocket.connect"})
+            await communicator.receive_output()
+            frames = [
+                {"event_type": "hit", "timestamp_ms": 10, "payload": {"zone": "forbidden"}},
+                {"event_type": "move", "timestamp_ms": 20, "payload": {"x": 0.0, "y": 0.0, "z": 0.0}},
+                {"event_type": "move", "timestamp_ms": 40, "payload": {"x": 1.0, "y": 0.0, "z": 0.0}},
+                {"event_type": "move", "timestamp_ms": 60, "payload": {"x": 1.1, "y": 0.0, "z": 0.0}},
+            ]
+            replies = []
+            for frame in frames:
+                await communicator.send_input({"type": "websocket.receive", "text": json.dumps(frame)})
+                replies.append(json.loads((await communicator.receive_output())["text"]))
+            await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+            await communicator.wait()
+            return replies
+
+        replies = async_to_sync(scenario)()
+        self.assertEqual(["warning" in reply for reply in replies], [False, False, True, False])
+        sources = sorted(payload["source"] for payload in self.attempt.events.filter(event_type="hit").values_list("payload", flat=True))
+        self.assertEqual(sources, ["client", "server"])
+
+    @override_settings(EVENT_BUFFER_FLUSH_INTERVAL_MS=3600000, LIVE_SCORE_INTERVAL_MS=3600000)
+    def test_completion_flushes_sockets_of_other_workers(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        layers = override_settings(
+            CHANNEL_LAYERS={
+                "default": {
+                    "BACKEND": "simulator.channel_layers.SQLiteChannelLayer",
+                    "CONFIG": {"path": os.path.join(directory.name, "channels.sqlite3")},
+                }
+            }
+        )
+        layers.enable()
+        self.addCleanup(layers.disable)
+        client = APIClient()
+        client.force_authenticate(self.user)
+
+        async def scenario():
+            communicator = websocket_communicator(f"/ws/attempts/{self.attempt.id}/", self.user)
+            await communicator.send_input({"type": "websocket.connect"})
+            await communicator.receive_output()
+            frame = {"event_type": "step_completed", "timestamp_ms": 10, "payload": {"step_id": 1}}
+            await communicator.send_input({"type": "websocket.receive", "text": json.dumps(frame)})
+            await communicator.receive_output()
+            stored_before = await Event.objects.acount()
+            # The buffer belongs to another worker: this process cannot flush it directly.
+            with mock.patch("simulator.ingest.flush_attempt_buffers", return_value=0):
+                response = await sync_to_async(client.post, thread_sensitive=False)(
+                    f"/api/attempts/{self.attempt.id}/complete/", {"duration_seconds": 30}, format="json"
+                )
+            stored_at_completion = await Event.objects.acount()
+            await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+            await communicator.wait()
+            return stored_before, response, stored_at_completion
+
+        stored_before, response, stored_at_completion = async_to_sync(scenario)()
+        self.assertEqual(stored_before, 0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(stored_at_completion, 1)
+
+    def test_binary_subprotocol_packs_samples_and_only_acks_warnings(self):
+        moves = [(index * 80, 0.1 * index, 1.2, 0.3, protocol.TOOL_CODES["FORCEPS"], float("nan"), float("nan")) for index in range(3)]
+        hit = [(300, protocol.ZONE_CODES["forbidden"], -0.3, 1.1, 0.2, protocol.SEVERITY_CODES["high"], 0.4, 0.6)]
+
+        async def scenario():
+            communicator = websocket_communicator(
+                f"/ws/attempts/{self.attempt.id}/", self.user, subprotocols=[protocol.SUBPROTOCOL]
+            )
+            await communicator.send_input({"type": "websocket.connect"})
+            accepted = await communicator.receive_output()
+            await communicator.send_input({"type": "websocket.receive", "bytes": protocol.encode_frame("move", moves)})
+            self.assertTrue(await communicator.receive_nothing())
+            await communicator.send_input({"type": "websocket.receive", "bytes": protocol.encode_frame("hit", hit)})
+            warning = json.loads((await communicator.receive_output())["text"])
+            await communicator.send_input({"type": "websocket.receive", "bytes": b"\x09\x01\x00\x00"})
+            error = json.loads((await communicator.receive_output())["text"])
+            invalid = [
+                [(400, float("nan"), 1.2, 0.3, 0, float("nan"), float("nan"))],
+                [(410, 0.1, 1.2, 0.3, 0, 0.5, float("nan"))],
+            ]
+            for records in invalid:
+                await communicator.send_input({"type": "websocket.receive", "bytes": protocol.encode_frame("move", records)})
+                self.assertEqual(json.loads((await communicator.receive_output())["text"])["status"], "error")
+            await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+            await communicator.wait()
+            return accepted, warning, error
+
+        accepted, warning, error = async_to_sync(scenario)()
+        self.assertEqual(accepted["subprotocol"], protocol.SUBPROTOCOL)
+        self.assertIn("warning", warning)
+        self.assertEqual(error["status"], "error")
+        stored = list(iter_attempt_events(self.attempt.id))
+        self.assertEqual([event.event_type for event in stored], ["move", "move", "move", "hit"])
+        self.assertEqual(self.attempt.trajectory_chunks.get().sample_count, 3)
+        self.assertEqual(stored[1].payload["tool"], "FORCEPS")
+        self.assertIsNone(stored[1].payload["screen"])
+        self.assertEqual(stored[3].payload["zone"], "forbidden")
+        self.assertEqual(stored[3].payload["severity"], "high")
+
+    @override_settings(LIVE_SCORE_INTERVAL_MS=50)
+    def test_live_score_is_pushed_to_student_and_observers(self):
+        instructor = User.objects.create_user(username="teacher", password="Pass123!", role="INSTRUCTOR")
+
+        async def scenario():
+            path = f"/ws/attempts/{self.attempt.id}/"
+            student = websocket_communicator(path, self.user)
+            observer = websocket_communicator(path, instructor)
+            for communicator in (student, observer):
+                await communicator.send_input({"type": "websocket.connect"})
+                await communicator.receive_output()
+            frame = {"event_type": "hit", "timestamp_ms": 100, "payload": {"zone": "forbidden"}}
+            await student.send_input({"type": "websocket.receive", "text": json.dumps(frame)})
+            self.assertIn("warning", json.loads((await student.receive_output())["text"]))
+            snapshots = [json.loads((await communicator.receive_output(1))["text"]) for communicator in (student, observer)]
+            for communicator in (student, observer):
+                await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+                await communicator.wait()
+            return snapshots
+
+        for snapshot in async_to_sync(scenario)():
+            self.assertEqual(snapshot["status"], "score")
+            self.assertEqual(snapshot["breakdown"]["forbidden_hits"], 1)
+            self.assertLess(snapshot["subscores"]["safety"], 100)
+        self.attempt.refresh_from_db()
+        self.assertEqual(self.attempt.live_state["event_count"], 1)
+
+    @override_settings(EVENT_RATE_PER_ATTEMPT=0, EVENT_BURST_PER_ATTEMPT=3, EVENT_RATE_CLOSE_AFTER=3)
+    def test_rate_limit_throttles_then_closes_and_records_counters(self):
+        async def scenario():
+            communicator = websocket_communicator(f"/ws/attempts/{self.attempt.id}/", self.user)
+            await communicator.send_input({"type": "websocket.connect"})
+            await communicator.receive_output()
+            for timestamp_ms in (0, 5, 10, 20, 30, 40, 50):
+                frame = {"event_type": "move", "timestamp_ms": timestamp_ms, "payload": {"x": 1, "y": 0, "z": 0}}
+                await communicator.send_input({"type": "websocket.receive", "text": json.dumps(frame)})
+            replies = []
+            while not replies or replies[-1]["type"] != "websocket.close":
+                replies.append(await communicator.receive_output())
+            return replies
+
+        replies = async_to_sync(scenario)()
+        statuses = [json.loads(reply["text"])["status"] for reply in replies[:-1]]
+        # The sample at 5 ms is coalesced into the one at 10 ms; the burst admits 0, 10 and 20 ms.
+        self.assertEqual(statuses, ["ok", "ok", "ok", "ok", "throttled"])
+        self.assertEqual(replies[-1]["code"], 4429)
+        self.attempt.refresh_from_db()
+        self.assertEqual(self.attempt.moves_coalesced, 1)
+        self.assertEqual(self.attempt.events_dropped, 3)
+        self.assertEqual(self.attempt.trajectory_chunks.get().sample_count, 3)
+
+    @override_settings(
+        EVENT_DISCRETE_RATE_PER_USER=0, EVENT_DISCRETE_BURST_PER_USER=2, EVENT_DISCRETE_CLOSE_AFTER=2
+    )
+    def test_discrete_event_flood_is_throttled_then_closed(self):
+        async def scenario():
+            communicator = websocket_communicator(f"/ws/attempts/{self.attempt.id}/", self.user)
+            await communicator.send_input({"type": "websocket.connect"})
+            await communicator.receive_output()
+            for timestamp_ms in range(0, 50, 10):
+                frame = {"event_type": "error", "timestamp_ms": timestamp_ms, "payload": {}}
+                await communicator.send_input({"type": "websocket.receive", "text": json.dumps(frame)})
+            replies = []
+            while not replies or replies[-1]["type"] != "websocket.close":
+                replies.append(await communicator.receive_output())
+            return replies
+
+        replies = async_to_sync(scenario)()
+        statuses = [json.loads(reply["text"])["status"] for reply in replies[:-1]]
+        self.assertEqual(statuses, ["ok", "ok", "throttled"])
+        self.assertEqual(replies[-1]["code"], 4429)
+        self.attempt.refresh_from_db()
+        self.assertEqual(self.attempt.events_dropped, 2)
+        self.assertEqual(self.attempt.events.count(), 2)
+
+
+class IngestPolicyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="student", password="Pass123!", role="STUDENT")
+        self.procedure = Procedure.objects.create(name="Policy", description="Test")
+        self.attempt = Attempt.objects.create(user=self.user, procedure=self.procedure)
+
+    def test_moves_are_coalesced_and_released_before_discrete_events(self):
+        policy = IngestPolicy(self.attempt.id, self.user.id, move_interval_ms=10)
+        moves = [("move", {"x": index}, index * 4) for index in range(5)]
+        self.assertEqual([event[2] for event in policy.admit(moves)], [0, 12])
+        admitted = policy.admit([("action", {"type": "CUT"}, 17)])
+        self.assertEqual([event[2] for event in admitted], [16, 17])
+        self.assertEqual(policy.coalesced, 2)
+        self.assertEqual(policy.release(), [])
+
+    @override_settings(EVENT_RATE_PER_USER=0, EVENT_BURST_PER_USER=4)
+    def test_user_bucket_is_shared_between_connections(self):
+        other = Attempt.objects.create(user=self.user, procedure=self.procedure)
+        first = IngestPolicy(self.attempt.id, self.user.id, move_interval_ms=0)
+        second = IngestPolicy(other.id, self.user.id, move_interval_ms=0)
+        events = [("move", {}, 0), ("move", {}, 1), ("move", {}, 2)]
+        self.assertEqual(len(first.admit(events)), 3)
+        self.assertEqual(len(second.admit(events)), 1)
+        self.assertTrue(second.throttled)
+        self.assertEqual(second.admit(events), [])
+        self.assertEqual(second.take_counters(), (5, 0))
+        record_attempt_counters(other.id, 3, 0)
+        other.refresh_from_db()
+        self.assertEqual(other.events_dropped, 3)
+
+    @override_settings(EVENT_RATE_PER_ATTEMPT=0, EVENT_BURST_PER_ATTEMPT=2)
+    def test_discrete_events_do_not_take_move_tokens_and_moves_are_charged_one_by_one(self):
+        policy = IngestPolicy(self.attempt.id, self.user.id, move_interval_ms=0)
+        frame = [("move", {}, 0), ("step_completed", {"step_id": 1}, 1), ("move", {}, 2), ("move", {}, 3), ("error", {}, 4)]
+        self.assertEqual([event[2] for event in policy.admit(frame)], [0, 1, 2, 4])
+        self.assertEqual(policy.dropped, 1)
+        self.assertTrue(policy.throttled)
+        self.assertEqual([event[0] for event in policy.admit([("move", {}, 5), ("hit", {}, 6)])], ["hit"])
+        self.assertEqual(policy.dropped, 2)
+        self.assertEqual(policy.buckets[0].tokens, 0)
+
+    @override_settings(EVENT_DISCRETE_RATE_PER_ATTEMPT=0, EVENT_DISCRETE_BURST_PER_ATTEMPT=2)
+    def test_discrete_events_have_their_own_stricter_bucket(self):
+        policy = IngestPolicy(self.attempt.id, self.user.id, move_interval_ms=0, discrete_close_after=3)
+        frame = [("action", {}, 0), ("move", {}, 1), ("error", {}, 2), ("hit", {}, 3)]
+        self.assertEqual([event[2] for event in policy.admit(frame)], [0, 1, 2])
+        self.assertEqual(policy.dropped, 1)
+        self.assertTrue(policy.throttled)
+        self.assertFalse(policy.over_limit)
+        self.assertEqual([event[0] for event in policy.admit([("move", {}, 4)])], ["move"])
+        self.assertEqual(policy.admit([("action", {}, 5), ("action", {}, 6)]), [])
+        self.assertTrue(policy.over_limit)
+        self.assertEqual(policy.drop_streak, 0)
+
+
+class SQLiteChannelLayerTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "channels.sqlite3")
+
+    def test_group_send_reaches_channels_of_other_layer_instances(self):
+        async def scenario():
+            worker_a = SQLiteChannelLayer(path=self.path)
+            worker_b = SQLiteChannelLayer(path=self.path)
+            channel_a = await worker_a.new_channel()
+            channel_b = await worker_b.new_channel()
+            await worker_a.group_add("attempt_1", channel_a)
+            await worker_b.group_add("attempt_1", channel_b)
+            await worker_b.group_send("attempt_1", {"type": "score.update", "blob": b"\x00\x01"})
+            await worker_a.group_discard("attempt_1", channel_a)
+            await worker_a.group_send("attempt_1", {"type": "score.update", "blob": b""})
+            received = [
+                await worker_a.receive(channel_a),
+                await worker_b.receive(channel_b),
+                await worker_b.receive(channel_b),
+            ]
+            await worker_a.close()
+            await worker_b.close()
+            return received
+
+        first, second, third = async_to_sync(scenario)()
+        self.assertEqual(first, {"type": "score.update", "blob": b"\x00\x01"})
+        self.assertEqual(second, first)
+        self.assertEqual(third["blob"], b"")
+
+    def test_idle_receivers_share_one_poller(self):
+        async def scenario():
+            layer = SQLiteChannelLayer(path=self.path)
+            reads = 0
+            read = layer._read
+
+            def counting_read(*args):
+                nonlocal reads
+                reads += 1
+                return read(*args)
+
+            layer._read = counting_read
+            channels = [await layer.new_channel() for _ in range(50)]
+            receives = [asyncio.ensure_future(layer.receive(channel)) for channel in channels]
+            await asyncio.sleep(0.3)
+            idle_reads = reads
+            cancelled = asyncio.ensure_future(layer.receive(channels[0]))
+            await asyncio.sleep(0.01)
+            cancelled.cancel()
+            for index, channel in enumerate(channels):
+                await layer.send(channel, {"type": "test", "index": index})
+            received = await asyncio.gather(*receives)
+            await layer.close()
+            return idle_reads, received
+
+        idle_reads, received = async_to_sync(scenario)()
+        # 50 receivers polling on their own would read at least 50 times per backoff step.
+        self.assertLess(idle_reads, 20)
+        self.assertEqual([message["index"] for message in received], list(range(50)))
+
+    def test_capacity_and_expiry(self):
+        async def scenario():
+            layer = SQLiteChannelLayer(path=self.path, capacity=2, expiry=60, channel_capacity={"slow.*": 1})
+            await layer.send("fast", {"type": "a"})
+            await layer.send("fast", {"type": "b"})
+            with self.assertRaises(ChannelFull):
+                await layer.send("fast", {"type": "c"})
+            await layer.send("slow.one", {"type": "a"})
+            with self.assertRaises(ChannelFull):
+                await layer.send("slow.one", {"type": "b"})
+            layer.expiry = -1
+            await layer.send("expired", {"type": "old"})
+            layer.expiry = 60
+            await layer.group_add("group", "expired")
+            layer._last_cleanup = 0
+            await layer.send("expired", {"type": "new"})
+            message = await layer.receive("expired")
+            await layer.group_send("group", {"type": "after-expiry"})
+            queued = layer._read(
+                lambda connection: connection.execute(
+                    "SELECT COUNT(*) FROM channel_messages WHERE channel = 'expired'"
+                ).fetchone()[0]
+            )
+            await layer.close()
+            return message, queued
+
+        message, queued = async_to_sync(scenario)()
+        self.assertEqual(message, {"type": "new"})
+        self.assertEqual(queued, 0)
+
+
+class BenchmarkTests(TransactionTestCase):
+    def test_synthetic_events_are_deterministic(self):
+        profile = AttemptProfile(events=500, steps=3, seed=7)
+        events = generate_events(profile)
+        self.assertEqual(len(events), 500)
+        self.assertEqual(events, generate_events(profile))
+        self.assertNotEqual(events, generate_events(AttemptProfile(events=500, steps=3, seed=8)))
+        self.assertEqual([e[1]["step_id"] for e in events if e[0] == "step_completed"], [1, 2, 3])
+        self.assertEqual([e[2] for e in events], sorted(e[2] for e in events))
+
+    def test_run_benchmarks_reports_every_case_and_compares(self):
+        output = StringIO()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "baseline.json")
+            # Tests run with DEBUG off, like a production server.
+            with self.assertRaisesMessage(CommandError, "--allow-live-db"):
+                call_command("run_benchmarks", "--sizes", "200", stdout=StringIO())
+            call_command("run_benchmarks", "--sizes", "200", "--json", "--output", path, "--allow-live-db", stdout=output)
+            report = json.loads(output.getvalue())
+            cases = {(row["suite"], row["case"]) for row in report["results"]}
+            self.assertIn(("ingest", "consumer"), cases)
+            self.assertIn(("scoring", "evaluate_aggregate"), cases)
+            self.assertIn(("reports", "report_pdf"), cases)
+            self.assertIn(("reports", "report_render"), cases)
+            self.assertTrue(all(row["events"] == 200 for row in report["results"]))
+            self.assertEqual(User.objects.count(), 0)
+            self.assertEqual(Procedure.objects.count(), 0)
+
+            for row in report["results"]:
+                row["seconds"] = 1e-9
+            with open(path, "w", encoding="utf-8") as handle:
+                json.dump(report, handle)
+            with self.assertRaisesMessage(CommandError, "Slower than the baseline"):
+                call_command(
+                    "run_benchmarks", "--sizes", "200", "--suites", "scoring", "--compare", path, "--allow-live-db", stdout=StringIO()
+                )
@@ -0,0 +1,298 @@
+"""Report data of an attempt in pieces: event counts, event pages and a downsampled trajectory.
+
+Events are paged with a keyset cursor instead of an offset, in the order of
+``iter_attempt_events``: by timestamp, ``Event`` rows before packed moves of
+the same millisecond, rows by id and moves by chunk sequence and position.
+The cursor is the position ``(timestamp_ms, source, key, index)`` of the
+last event of a page, so a page costs the same however deep it is: rows
+come from the ``(attempt, timestamp_ms, id)`` index and only chunks ending at
+or after the cursor are decoded.
+
+The trajectory is reduced with Largest-Triangle-Three-Buckets: the samples
+are split into equal buckets and each bucket keeps the sample forming the
+largest triangle (in space) with the sample kept before it and the mean of
+the next bucket. Corners and spikes survive; long straight runs collapse.
+
+``event_histograms`` bins the events per type on a ``width`` x ``height``
+screen grid and into ``buckets`` equal time slices with ``np.histogram2d`` and
+``np.bincount``. Results of completed attempts are kept in
+``histogram_cache`` while the attempt's events stay the same.
+"""
+from __future__ import annotations
+
+import base64
+import math
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Iterable
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max, Q, Sum
+
+from .kinematics import MOVE_DTYPE, load_samples
+from .models import Attempt, Event, TrajectoryChunk
+from .protocol import MOVE_RECORD
+from .trajectory import StreamEvent, move_event
+
+TIMELINE_PAGE_SIZE = 100
+TIMELINE_MAX_PAGE_SIZE = 1000
+TRAJECTORY_POINTS = 1000
+TRAJECTORY_MAX_POINTS = 10000
+HEATMAP_SIZE = (32, 24)
+HEATMAP_MAX_SIZE = 256
+HISTOGRAM_BUCKETS = 30
+HISTOGRAM_MAX_BUCKETS = 500
+
+ROW, MOVE = 0, 1
+Position = tuple[int, int, int, int]
+
+
+def encode_cursor(position: Position) -> str:
+    return base64.urlsafe_b64encode(".".join(map(str, position)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Position:
+    """The position encoded in ``cursor``; raises ValueError for anything else."""
+    try:
+        text = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp_ms, source, key, index = (int(part) for part in text.split("."))
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+    if source not in (ROW, MOVE):
+        raise ValueError("Invalid cursor")
+    return timestamp_ms, source, key, index
+
+
+def event_counts(attempt_id: int) -> dict[str, int]:
+    counts = dict(
+        Event.objects.filter(attempt_id=attempt_id)
+        .values_list("event_type")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    packed = TrajectoryChunk.objects.filter(attempt_id=attempt_id).aggregate(samples=Sum("sample_count"))["samples"]
+    if packed:
+        counts["move"] = counts.get("move", 0) + packed
+    return counts
+
+
+def _row_events(
+    attempt_id: int, event_types: list[str] | None, after: Position | None, limit: int
+) -> list[tuple[Position, StreamEvent]]:
+    rows = Event.objects.filter(attempt_id=attempt_id)
+    if event_types:
+        rows = rows.filter(event_type__in=event_types)
+    if after is not None:
+        timestamp_ms, source, key, _ = after
+        later = Q(timestamp_ms__gt=timestamp_ms)
+        if source == ROW:
+            later |= Q(timestamp_ms=timestamp_ms, id__gt=key)
+        rows = rows.filter(later)
+    return [
+        ((timestamp_ms, ROW, row_id, 0), StreamEvent(event_type, timestamp_ms, payload))
+        for row_id, event_type, timestamp_ms, payload in rows.order_by("timestamp_ms", "id").values_list(
+            "id", "event_type", "timestamp_ms", "payload"
+        )[:limit]
+    ]
+
+
+def _move_events(attempt_id: int, after: Position | None, limit: int) -> list[tuple[Position, StreamEvent]]:
+    chunks = TrajectoryChunk.objects.filter(attempt_id=attempt_id).order_by("start_ms", "sequence")
+    if after is not None:
+        chunks = chunks.filter(end_ms__gte=after[0])
+    selected: list[tuple[Position, StreamEvent]] = []
+    for chunk in chunks.only("sequence", "start_ms", "tools", "samples").iterator(chunk_size=8):
+        # Chunks come by start time: once one starts after the last selected move, none can be earlier.
+        if len(selected) == limit and chunk.start_ms > selected[-1][0][0]:
+            break
+        samples = bytes(chunk.samples)
+        times = np.frombuffer(samples, dtype=MOVE_DTYPE)["t_ms"].astype(np.int64)
+        later = np.ones(len(times), dtype=bool)
+        if after is not None:
+            timestamp_ms, source, key, index = after
+            later = times > timestamp_ms
+            if source == ROW or chunk.sequence > key:
+                later |= times == timestamp_ms
+            elif chunk.sequence == key:
+                later[index + 1 :] |= times[index + 1 :] == timestamp_ms
+        # Samples are sorted by time within a chunk, so the first matches are the earliest.
+        for position in np.flatnonzero(later)[:limit].tolist():
+            record = MOVE_RECORD.unpack_from(samples, position * MOVE_RECORD.size)
+            selected.append(((record[0], MOVE, chunk.sequence, position), move_event(record, chunk.tools)))
+        selected.sort(key=lambda entry: entry[0])
+        del selected[limit:]
+    return selected
+
+
+def event_page(
+    attempt_id: int,
+    event_types: Iterable[str] | None = None,
+    after: Position | None = None,
+    limit: int = TIMELINE_PAGE_SIZE,
+) -> tuple[list[dict[str, Any]], str | None]:
+    """Up to ``limit`` events after ``after`` and the cursor of the next page (None on the last page)."""
+    event_types = list(event_types) if event_types else None
+    entries = _row_events(attempt_id, event_types, after, limit + 1)
+    if event_types is None or "move" in event_types:
+        entries += _move_events(attempt_id, after, limit + 1)
+    entries.sort(key=lambda entry: entry[0])
+    page = entries[:limit]
+    events = [
+        {"event_type": event.event_type, "payload": event.payload, "timestamp_ms": event.timestamp_ms}
+        for _, event in page
+    ]
+    return events, encode_cursor(page[-1][0]) if len(entries) > limit else None
+
+
+def lttb(points: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of at most ``threshold`` rows of ``points`` (``(n, d)``) kept by Largest-Triangle-Three-Buckets."""
+    if threshold < 3:
+        raise ValueError("LTTB keeps at least three points")
+    count = len(points)
+    if threshold >= count:
+        return np.arange(count)
+    # First and last samples are always kept; the rest is split into threshold - 2 buckets.
+    edges = np.linspace(1, count - 1, threshold - 1).astype(np.int64)
+    means = np.add.reduceat(points[1 : count - 1], edges[:-1] - 1, axis=0) / np.diff(edges)[:, None]
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, count - 1
+    previous = points[0]
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        following = means[bucket + 1] if bucket + 1 < len(means) else points[-1]
+        candidates = points[start:end] - previous
+        base = following - previous
+        # Squared doubled triangle areas, |a|^2 |b|^2 - (a.b)^2, in any dimension.
+        areas = np.einsum("ij,ij->i", candidates, candidates) * base.dot(base) - candidates.dot(base) ** 2
+        selected[bucket + 1] = start + int(np.argmax(areas))
+        previous = points[selected[bucket + 1]]
+    return selected
+
+
+def downsample_trajectory(attempt_id: int, points: int = TRAJECTORY_POINTS) -> dict[str, Any]:
+    """Columns of the attempt's trajectory reduced to at most ``points`` samples; unknown screen positions are null."""
+    t_ms, xyz, screen = load_samples(attempt_id)
+    finite = np.isfinite(xyz).all(axis=1)
+    t_ms, xyz, screen = t_ms[finite], xyz[finite], screen[finite]
+    kept = lttb(xyz, points)
+    screen = screen[kept].round(5)
+    known = np.isfinite(screen).all(axis=1).tolist()
+    return {
+        "samples": len(t_ms),
+        "points": len(kept),
+        "t_ms": t_ms[kept].astype(np.int64).tolist(),
+        "x": xyz[kept, 0].round(5).tolist(),
+        "y": xyz[kept, 1].round(5).tolist(),
+        "z": xyz[kept, 2].round(5).tolist(),
+        "screen_x": [value if ok else None for value, ok in zip(screen[:, 0].tolist(), known)],
+        "screen_y": [value if ok else None for value, ok in zip(screen[:, 1].tolist(), known)],
+    }
+
+
+class HistogramCache:
+    """Bounded LRU of histogram results keyed by attempt and parameters, each with the event version it was built from."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[tuple, tuple[tuple, dict[str, Any]]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, version: tuple) -> dict[str, Any] | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: tuple, version: tuple, result: dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = (version, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"size": len(self._entries), "max_size": self.max_size, "hits": self.hits, "misses": self.misses}
+
+
+histogram_cache = HistogramCache(settings.REPORT_HISTOGRAM_CACHE_SIZE)
+
+
+def _events_version(attempt_id: int) -> tuple:
+    """Changes whenever an event or packed sample of the attempt is added or removed."""
+    rows = Event.objects.filter(attempt_id=attempt_id).aggregate(count=Count("id"), last_id=Max("id"))
+    chunks = TrajectoryChunk.objects.filter(attempt_id=attempt_id).aggregate(
+        samples=Sum("sample_count"), last_id=Max("id")
+    )
+    return rows["count"], rows["last_id"], chunks["samples"], chunks["last_id"]
+
+
+def _compute_histograms(attempt_id: int, width: int, height: int, buckets: int) -> dict[str, Any]:
+    t_ms, _, screen = load_samples(attempt_id)
+    times = {"move": t_ms}
+    screens = {"move": screen}
+    row_times, row_screens = defaultdict(list), defaultdict(list)
+    # Moves, packed or not, come from load_samples.
+    for event_type, timestamp_ms, payload in (
+        Event.objects.filter(attempt_id=attempt_id).exclude(event_type="move").values_list(
+            "event_type", "timestamp_ms", "payload"
+        )
+    ):
+        row_times[event_type].append(timestamp_ms)
+        position = payload.get("screen") if isinstance(payload, dict) else None
+        if isinstance(position, dict):
+            row_screens[event_type].append((position.get("x"), position.get("y")))
+    for event_type, values in row_times.items():
+        times[event_type] = np.asarray(values, dtype=np.float64)
+    for event_type, values in row_screens.items():
+        coordinates = [pair for pair in values if all(isinstance(value, (int, float)) for value in pair)]
+        screens[event_type] = np.asarray(coordinates, dtype=np.float64).reshape(-1, 2)
+
+    heatmaps = {}
+    for event_type, points in screens.items():
+        points = points[np.isfinite(points).all(axis=1)]
+        if len(points):
+            # Rows follow screen y, as the canvas draws them.
+            counts, _, _ = np.histogram2d(points[:, 1], points[:, 0], bins=(height, width), range=((0, 1), (0, 1)))
+            heatmaps[event_type] = counts.astype(np.int64).tolist()
+
+    times = {event_type: values for event_type, values in times.items() if len(values)}
+    start_ms = min((values.min() for values in times.values()), default=0)
+    end_ms = max((values.max() for values in times.values()), default=0)
+    bucket_ms = max(math.ceil((end_ms - start_ms + 1) / buckets), 1)
+    timeline = {
+        event_type: np.bincount(((values - start_ms) // bucket_ms).astype(np.int64), minlength=buckets)[:buckets].tolist()
+        for event_type, values in times.items()
+    }
+    return {
+        "heatmap": {"width": width, "height": height, "counts": heatmaps},
+        "timeline": {"start_ms": int(start_ms), "bucket_ms": int(bucket_ms), "buckets": buckets, "counts": timeline},
+    }
+
+
+def event_histograms(
+    attempt: Attempt, width: int = HEATMAP_SIZE[0], height: int = HEATMAP_SIZE[1], buckets: int = HISTOGRAM_BUCKETS
+) -> dict[str, Any]:
+    """Per event type: a ``height`` x ``width`` grid of screen positions and counts per time bucket."""
+    if attempt.status != Attempt.Status.COMPLETED:
+        return _compute_histograms(attempt.id, width, height, buckets)
+    key = (attempt.id, width, height, buckets)
+    version = _events_version(attempt.id)
+    result = histogram_cache.get(key, version)
+    if result is None:
+        result = _compute_histograms(attempt.id, width, height, buckets)
+        histogram_cache.set(key, version, result)
+    return result
@@ -0,0 +1,217 @@
+"""Packed storage for ``move`` samples.
+
+Move samples are appended to ``TrajectoryChunk`` rows instead of one ``Event``
+row each. A chunk holds up to ``TRAJECTORY_CHUNK_SAMPLES`` samples sorted by
+timestamp and packed as ``protocol.MOVE_RECORD`` structs (t_ms, x, y, z, tool,
+screen x, screen y). Tool codes index the chunk's ``tools`` list, 0 meaning no
+tool, so a chunk names at most ``MAX_CHUNK_TOOLS`` tools; a missing screen
+position is stored as NaN. Coordinates are kept as float32, and moves with
+coordinates outside its range stay ``Event`` rows.
+
+Discrete events stay in ``Event``; ``iter_attempt_events`` merges both
+sources back into one timestamp-ordered stream.
+"""
+from __future__ import annotations
+
+import heapq
+import math
+from collections import namedtuple
+from operator import attrgetter, itemgetter
+from typing import Any, Iterable, Iterator
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Event, TrajectoryChunk
+from .protocol import MOVE_RECORD
+
+StreamEvent = namedtuple("StreamEvent", ["event_type", "timestamp_ms", "payload"])
+
+MOVE_KEYS = {"x", "y", "z", "tool", "screen"}
+FLOAT32_MAX = 3.4028234663852886e38
+MAX_CHUNK_TOOLS = 255
+_by_timestamp = attrgetter("timestamp_ms")
+
+
+def _is_number(value: Any) -> bool:
+    return (
+        isinstance(value, (int, float))
+        and not isinstance(value, bool)
+        and math.isfinite(value)
+        and abs(value) <= FLOAT32_MAX
+    )
+
+
+def is_packable_move(event_type: str, payload: Any, timestamp_ms: Any) -> bool:
+    """Whether a move can be packed without losing any of its fields."""
+    if event_type != "move" or not isinstance(payload, dict) or not payload.keys() <= MOVE_KEYS:
+        return False
+    if not isinstance(timestamp_ms, int) or isinstance(timestamp_ms, bool) or not 0 <= timestamp_ms < 2**32:
+        return False
+    if not all(_is_number(payload.get(axis)) for axis in ("x", "y", "z")):
+        return False
+    tool = payload.get("tool")
+    if tool is not None and not isinstance(tool, str):
+        return False
+    screen = payload.get("screen")
+    if screen is None:
+        return True
+    return (
+        isinstance(screen, dict)
+        and screen.keys() == {"x", "y"}
+        and _is_number(screen["x"])
+        and _is_number(screen["y"])
+    )
+
+
+def split_moves(events: Iterable[tuple[str, Any, Any]]) -> tuple[list[tuple[int, dict]], list[tuple[str, Any, Any]]]:
+    """Split ``(event_type, payload, timestamp_ms)`` tuples into packable moves and the rest."""
+    moves = []
+    others = []
+    for event_type, payload, timestamp_ms in events:
+        if is_packable_move(event_type, payload, timestamp_ms):
+            moves.append((timestamp_ms, payload))
+        else:
+            others.append((event_type, payload, timestamp_ms))
+    return moves, others
+
+
+def _fitting(samples: list[tuple[int, dict]], start: int, limit: int, tools: list[str]) -> int:
+    """How many samples from ``start`` (at most ``limit``) fit in a chunk already naming ``tools``."""
+    names = set(tools)
+    count = 0
+    for _, payload in samples[start : start + limit]:
+        tool = payload.get("tool")
+        if tool is not None and tool not in names:
+            if len(names) == MAX_CHUNK_TOOLS:
+                break
+            names.add(tool)
+        count += 1
+    return count
+
+
+def _pack(samples: list[tuple[int, dict]], tools: list[str]) -> bytes:
+    codes = {name: index + 1 for index, name in enumerate(tools)}
+    packed = bytearray()
+    for timestamp_ms, payload in samples:
+        tool = payload.get("tool")
+        code = 0
+        if tool is not None:
+            code = codes.get(tool)
+            if code is None:
+                tools.append(tool)
+                code = codes[tool] = len(tools)
+        screen = payload.get("screen") or {"x": math.nan, "y": math.nan}
+        packed += MOVE_RECORD.pack(
+            timestamp_ms, payload["x"], payload["y"], payload["z"], code, screen["x"], screen["y"]
+        )
+    return bytes(packed)
+
+
+def append_moves(attempt_id: int, samples: list[tuple[int, dict]]) -> int:
+    """Append ``(timestamp_ms, payload)`` move samples to an attempt's trajectory."""
+    if not samples:
+        return 0
+    samples = sorted(samples, key=itemgetter(0))
+    chunk_size = settings.TRAJECTORY_CHUNK_SAMPLES
+    with transaction.atomic():
+        last = (
+            TrajectoryChunk.objects.select_for_update()
+            .filter(attempt_id=attempt_id)
+            .order_by("-sequence")
+            .first()
+        )
+        position = 0
+        if last and last.sample_count < chunk_size and samples[0][0] >= last.end_ms:
+            position = _fitting(samples, 0, chunk_size - last.sample_count, last.tools)
+        if position:
+            head = samples[:position]
+            tools = list(last.tools)
+            last.samples = bytes(last.samples) + _pack(head, tools)
+            last.tools = tools
+            last.sample_count += len(head)
+            last.end_ms = head[-1][0]
+            last.save(update_fields=["samples", "tools", "sample_count", "end_ms"])
+        sequence = last.sequence + 1 if last else 0
+        chunks = []
+        while position < len(samples):
+            part = samples[position : position + _fitting(samples, position, chunk_size, [])]
+            position += len(part)
+            tools = []
+            chunks.append(
+                TrajectoryChunk(
+                    attempt_id=attempt_id,
+                    sequence=sequence,
+                    start_ms=part[0][0],
+                    end_ms=part[-1][0],
+                    sample_count=len(part),
+                    samples=_pack(part, tools),
+                    tools=tools,
+                )
+            )
+            sequence += 1
+        TrajectoryChunk.objects.bulk_create(chunks)
+    return len(samples)
+
+
+def iter_chunk_records(chunk: TrajectoryChunk) -> Iterator[tuple]:
+    """Raw ``MOVE_RECORD`` tuples of a chunk, without building payload dicts."""
+    return MOVE_RECORD.iter_unpack(chunk.samples)
+
+
+def move_event(record: tuple, tools: list[str]) -> StreamEvent:
+    """The move of a raw ``MOVE_RECORD`` tuple, given its chunk's ``tools``."""
+    timestamp_ms, x, y, z, tool, screen_x, screen_y = record
+    return StreamEvent(
+        "move",
+        timestamp_ms,
+        {
+            "x": x,
+            "y": y,
+            "z": z,
+            "tool": tools[tool - 1] if tool else None,
+            "screen": None if math.isnan(screen_x) else {"x": screen_x, "y": screen_y},
+        },
+    )
+
+
+def iter_chunk_events(chunk: TrajectoryChunk) -> Iterator[StreamEvent]:
+    tools = chunk.tools
+    for record in iter_chunk_records(chunk):
+        yield move_event(record, tools)
+
+
+def iter_attempt_events(attempt_id: int) -> Iterator[StreamEvent]:
+    """All events of an attempt, ``Event`` rows and packed moves, ordered by timestamp."""
+    rows = (
+        StreamEvent(*row)
+        for row in Event.objects.filter(attempt_id=attempt_id)
+        .order_by("timestamp_ms", "id")
+        .values_list("event_type", "timestamp_ms", "payload")
+        .iterator(chunk_size=2000)
+    )
+    chunks = TrajectoryChunk.objects.filter(attempt_id=attempt_id).order_by("start_ms", "sequence")
+    moves = heapq.merge(*(iter_chunk_events(chunk) for chunk in chunks), key=_by_timestamp)
+    return heapq.merge(rows, moves, key=_by_timestamp)
+
+
+def pack_attempt_moves(attempt_id: int) -> int:
+    """Move an attempt's packable ``move`` rows into its trajectory chunks."""
+    with transaction.atomic():
+        rows = list(
+            Event.objects.filter(attempt_id=attempt_id, event_type="move")
+            .order_by("timestamp_ms", "id")
+            .values_list("id", "payload", "timestamp_ms")
+        )
+        packable = [
+            (row_id, payload, timestamp_ms)
+            for row_id, payload, timestamp_ms in rows
+            if is_packable_move("move", payload, timestamp_ms)
+        ]
+        if not packable:
+            return 0
+        append_moves(attempt_id, [(timestamp_ms, payload) for _, payload, timestamp_ms in packable])
+        packed_ids = [row_id for row_id, _, _ in packable]
+        for start in range(0, len(packed_ids), 500):
+            Event.objects.filter(id__in=packed_ids[start : start + 500]).delete()
+    return len(packable)
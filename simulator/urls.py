@@ -14,12 +14,22 @@ urlpatterns = [
     path("", include(router.urls)),
     path("attempts/start/", views.attempt_start, name="attempt_start"),
     path("attempts/me/", views.my_attempts, name="attempts_me"),
+    path("progress/", views.learning_curves, name="learning_curves"),
     path("attempts/<int:attempt_id>/event/", views.attempt_event, name="attempt_event"),
+    path("attempts/<int:attempt_id>/events/bulk/", views.attempt_events_bulk, name="attempt_events_bulk"),
     path("reports/<int:attempt_id>/", views.attempt_report, name="attempt_report"),
+    path("reports/<int:attempt_id>/summary/", views.attempt_report_summary, name="attempt_report_summary"),
+    path("reports/<int:attempt_id>/events/", views.attempt_report_events, name="attempt_report_events"),
+    path("reports/<int:attempt_id>/trajectory/", views.attempt_report_trajectory, name="attempt_report_trajectory"),
+    path("reports/<int:attempt_id>/histograms/", views.attempt_report_histograms, name="attempt_report_histograms"),
     path("reports/<int:attempt_id>/pdf/", views.attempt_report_pdf, name="attempt_report_pdf"),
     path("ai/guide/", views.ai_guidance, name="ai_guidance"),
     path("ai/chat/", views.ai_chat, name="ai_chat"),
     path("admin/", include(admin_router.urls)),
     path("admin/analytics/", views.analytics_overview, name="analytics_overview"),
+    path("admin/analytics/rollups/", views.analytics_rollups, name="analytics_rollups"),
+    path("admin/metrics/", views.runtime_metrics, name="runtime_metrics"),
+    path("admin/shadow-scores/", views.shadow_score_report, name="shadow_score_report"),
     path("admin/export/csv/", views.export_attempts_csv, name="export_attempts_csv"),
+    path("admin/export/reports.zip", views.export_reports_zip, name="export_reports_zip"),
 ]
@@ -1,36 +1,76 @@
 from __future__ import annotations
 
 import csv
-from io import BytesIO, StringIO
+from io import StringIO
 
-from django.db.models import Avg
-from django.http import HttpResponse
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date
+from django.utils.http import http_date
 from rest_framework import permissions, status, viewsets
-from rest_framework.decorators import action, api_view, permission_classes, renderer_classes
+from rest_framework.decorators import action, api_view, parser_classes, permission_classes, renderer_classes
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
 from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.styles import ParagraphStyle
-from reportlab.lib.units import inch
-from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
 
+from accounts.authentication import user_cache
 from accounts.models import AISettings
 from accounts.utils import decrypt_api_key
 from django.conf import settings
 from simulator.ai_providers import build_provider
-from .models import Attempt, Event, Procedure
+from .ingest import flush_pending_events, ingest_event_stream, ingest_stats, store_events
+from .models import Attempt, Event, LearningCurve, Procedure, ReferenceTrajectory
+from .parsers import NDJSONParser
 from .permissions import IsInstructorOrAdmin
-from .scoring import evaluate_attempt
+from .plans import get_compiled_procedure, procedure_cache
+from .progress import record_completion
+from .references import create_reference
+from .rollups import GRANULARITIES, GROUPS, record_attempt, score_rollups
+from .reports import (
+    iter_report_archive,
+    render_report_pdf,
+    report_hash,
+    report_snapshot,
+    schedule_report_render,
+    store_report,
+)
+from .score_cache import score_cache_stats
+from .scoring import score_attempt
 from .serializers import (
     AttemptCreateSerializer,
     AttemptSerializer,
     AttemptStartSerializer,
+    EventIngestSerializer,
     EventSerializer,
+    LearningCurveSerializer,
     ProcedureSerializer,
+    ReferenceTrajectorySerializer,
+)
+from .shadow import compare_shadow_scores, schedule_shadow_scoring
+from .spool import get_spool
+from .timeline import (
+    HEATMAP_MAX_SIZE,
+    HEATMAP_SIZE,
+    HISTOGRAM_BUCKETS,
+    HISTOGRAM_MAX_BUCKETS,
+    TIMELINE_MAX_PAGE_SIZE,
+    TIMELINE_PAGE_SIZE,
+    TRAJECTORY_MAX_POINTS,
+    TRAJECTORY_POINTS,
+    decode_cursor,
+    downsample_trajectory,
+    event_counts,
+    event_histograms,
+    event_page,
+    histogram_cache,
 )
+from .trajectory import iter_attempt_events
 
 
 # ---- Template Views ----
@@ -87,6 +127,22 @@ class ProcedureViewSet(viewsets.ModelViewSet):
             return [permissions.IsAuthenticated()]
         return [IsInstructorOrAdmin()]
 
+    @action(detail=True, methods=["get", "post"], url_path="references")
+    def references(self, request, pk=None):
+        procedure = self.get_object()
+        if request.method == "GET":
+            references = ReferenceTrajectory.objects.filter(procedure=procedure)
+            return Response(ReferenceTrajectorySerializer(references, many=True).data)
+        attempt_id = request.data.get("attempt_id")
+        if not isinstance(attempt_id, int):
+            return Response({"detail": "attempt_id must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        attempt = get_object_or_404(Attempt, id=attempt_id, procedure=procedure)
+        try:
+            reference = create_reference(attempt, name=str(request.data.get("name") or ""))
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(ReferenceTrajectorySerializer(reference).data, status=status.HTTP_201_CREATED)
+
 
 class AttemptViewSet(viewsets.ModelViewSet):
     queryset = Attempt.objects.select_related("procedure", "user").all()
@@ -118,7 +174,8 @@ class AttemptViewSet(viewsets.ModelViewSet):
         attempt.ended_at = timezone.now()
         attempt.status = Attempt.Status.COMPLETED
 
-        result = evaluate_attempt(attempt)
+        flush_pending_events(attempt.id)
+        result = score_attempt(attempt)
         attempt.score_total = result.total
         attempt.subscores = result.subscores
         attempt.score_breakdown = result.breakdown
@@ -147,7 +204,36 @@ class AttemptViewSet(viewsets.ModelViewSet):
                     attempt.feedback = ai_feedback
                 except Exception:
                     attempt.ai_used = False
-        attempt.save()
+        completed_fields = [
+            "duration_seconds",
+            "ended_at",
+            "status",
+            "score_total",
+            "subscores",
+            "score_breakdown",
+            "feedback",
+            "algorithm_version",
+            "ai_used",
+            "ai_provider",
+            "ai_model",
+            "ai_feedback",
+        ]
+        # The attempt and the statistics it feeds are committed together. Only the request whose
+        # conditional update wins records them: overlapping completes (double click, client retry)
+        # all pass the check above, and the running statistics cannot take an attempt twice.
+        with transaction.atomic():
+            # Ingest counters and live state are updated concurrently with F() / row locks.
+            won = (
+                Attempt.objects.filter(pk=attempt.pk)
+                .exclude(status=Attempt.Status.COMPLETED)
+                .update(**{field: getattr(attempt, field) for field in completed_fields})
+            )
+            if not won:
+                return Response({"detail": "Attempt already completed."}, status=status.HTTP_400_BAD_REQUEST)
+            record_completion(attempt)
+            record_attempt(attempt)
+        schedule_shadow_scoring(attempt.id)
+        schedule_report_render(attempt.id)
         return Response(
             {
                 "attempt_id": attempt.id,
@@ -187,9 +273,10 @@ class AttemptViewSet(viewsets.ModelViewSet):
         attempt = self.get_object()
         if request.user.role == "STUDENT" and attempt.user != request.user:
             return Response({"detail": "No autorizado"}, status=status.HTTP_403_FORBIDDEN)
-        serializer = EventSerializer(data={**request.data, "attempt_id": attempt.id})
+        serializer = EventIngestSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
+        data = serializer.validated_data
+        store_events(attempt.id, [(data["event_type"], data["payload"], data["timestamp_ms"])])
         return Response({"ok": True}, status=status.HTTP_201_CREATED)
 
 
@@ -231,12 +318,32 @@ def attempt_event(request, attempt_id: int):
     attempt = get_object_or_404(Attempt, id=attempt_id)
     if request.user.role == "STUDENT" and attempt.user != request.user:
         return Response({"detail": "No autorizado"}, status=status.HTTP_403_FORBIDDEN)
-    serializer = EventSerializer(data={**request.data, "attempt_id": attempt.id})
+    serializer = EventIngestSerializer(data=request.data)
     serializer.is_valid(raise_exception=True)
-    serializer.save()
+    data = serializer.validated_data
+    store_events(attempt.id, [(data["event_type"], data["payload"], data["timestamp_ms"])])
     return Response({"ok": True}, status=status.HTTP_201_CREATED)
 
 
+@api_view(["POST"])
+@permission_classes([permissions.IsAuthenticated])
+@parser_classes([JSONParser, NDJSONParser])
+def attempt_events_bulk(request, attempt_id: int):
+    attempt = get_object_or_404(Attempt.objects.only("id", "user_id"), id=attempt_id)
+    if request.user.role == "STUDENT" and attempt.user_id != request.user.id:
+        return Response({"detail": "No autorizado"}, status=status.HTTP_403_FORBIDDEN)
+    items = request.data
+    if isinstance(items, dict):
+        items = items.get("events", [])
+    if isinstance(items, (str, bytes)) or not hasattr(items, "__iter__"):
+        return Response({"detail": "Se esperaba una lista de eventos."}, status=status.HTTP_400_BAD_REQUEST)
+    chunks = ingest_event_stream(attempt.id, items)
+    created = sum(chunk["created"] for chunk in chunks)
+    rejected = sum(chunk["rejected"] for chunk in chunks)
+    response_status = status.HTTP_201_CREATED if created or not rejected else status.HTTP_400_BAD_REQUEST
+    return Response({"created": created, "rejected": rejected, "chunks": chunks}, status=response_status)
+
+
 @api_view(["GET"])
 @permission_classes([permissions.IsAuthenticated])
 def my_attempts(request):
@@ -244,17 +351,98 @@ def my_attempts(request):
     return Response(AttemptSerializer(queryset, many=True).data)
 
 
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+def learning_curves(request):
+    """The requesting student's curves; instructors and admins may pass ``user``."""
+    curves = LearningCurve.objects.select_related("procedure")
+    user_id = request.query_params.get("user")
+    if user_id is not None and request.user.role in {"INSTRUCTOR", "ADMIN"}:
+        if not user_id.isdigit():
+            return Response({"detail": "user must be an id."}, status=status.HTTP_400_BAD_REQUEST)
+        curves = curves.filter(user_id=int(user_id))
+    else:
+        curves = curves.filter(user=request.user)
+    procedure_id = request.query_params.get("procedure")
+    if procedure_id is not None:
+        if not procedure_id.isdigit():
+            return Response({"detail": "procedure must be an id."}, status=status.HTTP_400_BAD_REQUEST)
+        curves = curves.filter(procedure_id=int(procedure_id))
+    return Response(LearningCurveSerializer(curves, many=True).data)
+
+
 @api_view(["GET"])
 @permission_classes([permissions.IsAuthenticated])
 def analytics_overview(request):
+    """Mean score per procedure between ``since`` and ``until``, best first, from the daily rollups."""
     if request.user.role not in {"INSTRUCTOR", "ADMIN"}:
         return Response({"detail": "No autorizado"}, status=status.HTTP_403_FORBIDDEN)
-    summary = (
-        Attempt.objects.filter(status=Attempt.Status.COMPLETED)
-        .values("procedure__name")
-        .annotate(avg_score=Avg("score_total"))
+    rollups = score_rollups("procedure", since=_date_param(request, "since"), until=_date_param(request, "until"))
+    summary = [
+        {
+            "procedure_id": item["key"],
+            "procedure__name": item["label"],
+            "avg_score": item["mean"],
+            "attempts": item["attempts"],
+            "std": item["std"],
+            "min": item["min"],
+            "max": item["max"],
+        }
+        for item in rollups
+    ]
+    summary.sort(key=lambda item: -(item["avg_score"] or 0))
+    return Response(summary)
+
+
+@api_view(["GET"])
+@permission_classes([IsInstructorOrAdmin])
+def analytics_rollups(request):
+    """Score statistics per procedure or specialty (``group``) and ``granularity`` period between ``since`` and ``until``."""
+    group = request.query_params.get("group", "procedure")
+    if group not in GROUPS:
+        raise ParseError(f"group must be one of: {', '.join(GROUPS)}.")
+    granularity = request.query_params.get("granularity", "day")
+    if granularity not in GRANULARITIES:
+        raise ParseError(f"granularity must be one of: {', '.join(GRANULARITIES)}.")
+    keys = [value.strip() for value in request.query_params.get(group, "").split(",") if value.strip()]
+    if group == "procedure" and not all(value.isdigit() for value in keys):
+        raise ParseError("procedure must be comma-separated ids.")
+    series = score_rollups(
+        group,
+        granularity,
+        since=_date_param(request, "since"),
+        until=_date_param(request, "until"),
+        keys=keys or None,
     )
-    return Response(list(summary))
+    return Response({"group": group, "granularity": granularity, "series": series})
+
+
+@api_view(["GET"])
+@permission_classes([IsInstructorOrAdmin])
+def runtime_metrics(request):
+    spool = get_spool()
+    return Response(
+        {
+            "ingest": ingest_stats.snapshot(),
+            "auth_user_cache": user_cache.stats(),
+            "event_spool": spool.stats() if spool else None,
+            "procedure_cache": procedure_cache.stats(),
+            "score_cache": score_cache_stats.snapshot(),
+            "report_histogram_cache": histogram_cache.stats(),
+        }
+    )
+
+
+@api_view(["GET"])
+@permission_classes([IsInstructorOrAdmin])
+def shadow_score_report(request):
+    procedure_id = request.query_params.get("procedure")
+    if procedure_id is not None and not procedure_id.isdigit():
+        return Response({"detail": "procedure must be an id."}, status=status.HTTP_400_BAD_REQUEST)
+    scorers = compare_shadow_scores(
+        scorer=request.query_params.get("scorer"), procedure_id=int(procedure_id) if procedure_id else None
+    )
+    return Response({"configured": settings.SHADOW_SCORERS, "scorers": scorers})
 
 
 @api_view(["GET"])
@@ -283,6 +471,59 @@ def export_attempts_csv(request):
     return response
 
 
+def _date_param(request, name: str):
+    """The ``name`` query parameter as a date or None when missing; anything but YYYY-MM-DD is a 400."""
+    value = request.query_params.get(name)
+    if value is None:
+        return None
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        raise ParseError(f"{name} must be a date (YYYY-MM-DD).")
+    return day
+
+
+async def _iterate_in_thread(iterator):
+    """Pull a blocking iterator one item at a time from the sync thread, so ASGI sends each chunk as it is produced."""
+    finished = object()
+    next_item = sync_to_async(next)
+    while (item := await next_item(iterator, finished)) is not finished:
+        yield item
+
+
+@api_view(["GET"])
+@permission_classes([IsInstructorOrAdmin])
+def export_reports_zip(request):
+    """ZIP of the PDF reports of the completed attempts matching ``procedure``, ``students``, ``since`` and ``until``."""
+    attempts = Attempt.objects.filter(status=Attempt.Status.COMPLETED).select_related("user", "procedure")
+    procedure_id = request.query_params.get("procedure")
+    if procedure_id is not None:
+        if not procedure_id.isdigit():
+            return Response({"detail": "procedure must be an id."}, status=status.HTTP_400_BAD_REQUEST)
+        attempts = attempts.filter(procedure_id=int(procedure_id))
+    students = request.query_params.get("students")
+    if students is not None:
+        student_ids = [value.strip() for value in students.split(",") if value.strip()]
+        if not all(value.isdigit() for value in student_ids):
+            return Response({"detail": "students must be comma-separated ids."}, status=status.HTTP_400_BAD_REQUEST)
+        attempts = attempts.filter(user_id__in=[int(value) for value in student_ids])
+    since, until = _date_param(request, "since"), _date_param(request, "until")
+    if since is not None:
+        attempts = attempts.filter(started_at__date__gte=since)
+    if until is not None:
+        attempts = attempts.filter(started_at__date__lte=until)
+
+    chunks = iter_report_archive(attempts.order_by("id").iterator(chunk_size=500))
+    if isinstance(request._request, ASGIRequest):
+        # A sync iterator would be read to the end before the first byte is sent.
+        chunks = _iterate_in_thread(chunks)
+    response = StreamingHttpResponse(chunks, content_type="application/zip")
+    response["Content-Disposition"] = "attachment; filename=reports.zip"
+    return response
+
+
 @api_view(["GET"])
 @permission_classes([permissions.IsAuthenticated])
 def attempt_report(request, attempt_id: int):
@@ -290,7 +531,10 @@ def attempt_report(request, attempt_id: int):
     if request.user.role == "STUDENT" and attempt.user != request.user:
         return Response({"detail": "No autorizado"}, status=status.HTTP_403_FORBIDDEN)
 
-    events = EventSerializer(attempt.events.all(), many=True).data
+    events = [
+        {"event_type": event.event_type, "payload": event.payload, "timestamp_ms": event.timestamp_ms}
+        for event in iter_attempt_events(attempt.id)
+    ]
     return Response(
         {
             "attempt": AttemptSerializer(attempt).data,
@@ -301,92 +545,124 @@ def attempt_report(request, attempt_id: int):
 
 @api_view(["GET"])
 @permission_classes([permissions.IsAuthenticated])
-def attempt_report_pdf(request, attempt_id: int):
-    attempt = get_object_or_404(Attempt.objects.select_related("procedure", "user"), id=attempt_id)
+def attempt_report_summary(request, attempt_id: int):
+    attempt = get_object_or_404(Attempt.objects.select_related("procedure"), id=attempt_id)
     if request.user.role == "STUDENT" and attempt.user != request.user:
         return Response({"detail": "No autorizado"}, status=status.HTTP_403_FORBIDDEN)
 
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter, title="SmartSurgSim Report")
-    styles = {
-        "title": ParagraphStyle(name="title", fontSize=18, leading=22, textColor=colors.HexColor("#0F172A")),
-        "h2": ParagraphStyle(name="h2", fontSize=12, leading=14, textColor=colors.HexColor("#1E293B")),
-        "body": ParagraphStyle(name="body", fontSize=10, leading=12),
-    }
-    elements = [
-        Paragraph("SmartSurgSim – Reporte Clínico Profesional", styles["title"]),
-        Spacer(1, 0.2 * inch),
-        Paragraph("Centro de Simulación Quirúrgica Inteligente", styles["body"]),
-        Spacer(1, 0.15 * inch),
-        Paragraph(f"Estudiante: {attempt.user.username}", styles["body"]),
-        Paragraph(f"Procedimiento: {attempt.procedure.name}", styles["body"]),
-        Paragraph(f"Fecha: {attempt.ended_at or attempt.started_at}", styles["body"]),
-        Spacer(1, 0.2 * inch),
-        Paragraph("Resumen de desempeño", styles["h2"]),
+    completed_steps = [
+        payload.get("step_id")
+        for payload in Event.objects.filter(attempt_id=attempt.id, event_type="step_completed")
+        .order_by("timestamp_ms", "id")
+        .values_list("payload", flat=True)
+        if isinstance(payload, dict)
     ]
-
-    subscores = attempt.subscores or {}
-    data = [
-        ["Score total", f"{attempt.score_total or 0:.1f}"],
-        ["Precisión", subscores.get("precision", 0)],
-        ["Eficiencia", subscores.get("efficiency", 0)],
-        ["Seguridad", subscores.get("safety", 0)],
-        ["Adherencia", subscores.get("protocol_adherence", 0)],
-        ["Manejo instrumental", subscores.get("instrument_handling", 0)],
-    ]
-    table = Table(data, hAlign="LEFT", colWidths=[2.5 * inch, 1.5 * inch])
-    table.setStyle(
-        TableStyle(
-            [
-                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#E2E8F0")),
-                ("TEXTCOLOR", (0, 0), (-1, 0), colors.HexColor("#0F172A")),
-                ("GRID", (0, 0), (-1, -1), 0.5, colors.HexColor("#CBD5F5")),
-                ("FONTNAME", (0, 0), (-1, -1), "Helvetica"),
-            ]
-        )
-    )
-    elements.append(table)
-    breakdown = attempt.score_breakdown or {}
-    elements.append(Spacer(1, 0.2 * inch))
-    elements.append(Paragraph("Métricas clave", styles["h2"]))
-    metrics_table = Table(
-        [
-            ["Contacto zona prohibida (ms)", breakdown.get("forbidden_contact_ms", 0)],
-            ["Acciones intensas", breakdown.get("forceful_actions", 0)],
-            ["Movimientos erráticos", breakdown.get("erratic_moves", 0)],
-        ],
-        hAlign="LEFT",
-        colWidths=[2.5 * inch, 1.5 * inch],
+    return Response(
+        {
+            "attempt": AttemptSerializer(attempt).data,
+            "event_counts": event_counts(attempt.id),
+            "completed_steps": completed_steps,
+        }
     )
-    metrics_table.setStyle(
-        TableStyle(
-            [
-                ("GRID", (0, 0), (-1, -1), 0.5, colors.HexColor("#CBD5F5")),
-                ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#E2E8F0")),
-            ]
+
+
+def _bounded_int(value: str | None, default: int, minimum: int, maximum: int) -> int | None:
+    """``value`` as an int within bounds, ``default`` when missing and None when invalid."""
+    if value is None:
+        return default
+    if not value.isdigit() or not minimum <= int(value) <= maximum:
+        return None
+    return int(value)
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+def attempt_report_events(request, attempt_id: int):
+    """A page of the attempt's events; ``type`` filters by comma-separated types, ``after`` is the ``next`` cursor."""
+    attempt = get_object_or_404(Attempt, id=attempt_id)
+    if request.user.role == "STUDENT" and attempt.user_id != request.user.id:
+        return Response({"detail": "No autorizado"}, status=status.HTTP_403_FORBIDDEN)
+
+    limit = _bounded_int(request.query_params.get("limit"), TIMELINE_PAGE_SIZE, 1, TIMELINE_MAX_PAGE_SIZE)
+    if limit is None:
+        return Response(
+            {"detail": f"limit must be between 1 and {TIMELINE_MAX_PAGE_SIZE}."}, status=status.HTTP_400_BAD_REQUEST
         )
-    )
-    elements.append(metrics_table)
-    elements.append(Spacer(1, 0.2 * inch))
-    elements.append(Paragraph("Hallazgos principales", styles["h2"]))
-    feedback = attempt.feedback or []
-    feedback_text = "<br/>".join([f"• {item}" for item in feedback]) or "Sin observaciones críticas."
-    elements.append(Paragraph(feedback_text, styles["body"]))
-    elements.append(Spacer(1, 0.25 * inch))
-    elements.append(Paragraph("Recomendaciones", styles["h2"]))
-    elements.append(
-        Paragraph(
-            "Refuerza la técnica con práctica deliberada, priorizando seguridad y secuencia clínica.",
-            styles["body"],
+    after = request.query_params.get("after")
+    try:
+        after = decode_cursor(after) if after else None
+    except ValueError:
+        return Response({"detail": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+    event_types = [name.strip() for name in request.query_params.get("type", "").split(",") if name.strip()]
+    events, next_cursor = event_page(attempt.id, event_types, after, limit)
+    return Response({"results": events, "next": next_cursor})
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+def attempt_report_trajectory(request, attempt_id: int):
+    """The instrument path reduced to ``points`` samples (LTTB)."""
+    attempt = get_object_or_404(Attempt, id=attempt_id)
+    if request.user.role == "STUDENT" and attempt.user_id != request.user.id:
+        return Response({"detail": "No autorizado"}, status=status.HTTP_403_FORBIDDEN)
+
+    points = _bounded_int(request.query_params.get("points"), TRAJECTORY_POINTS, 3, TRAJECTORY_MAX_POINTS)
+    if points is None:
+        return Response(
+            {"detail": f"points must be between 3 and {TRAJECTORY_MAX_POINTS}."}, status=status.HTTP_400_BAD_REQUEST
         )
-    )
-    elements.append(Spacer(1, 0.2 * inch))
-    elements.append(Paragraph("Firma instructor: ____________________", styles["body"]))
+    return Response(downsample_trajectory(attempt.id, points))
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+def attempt_report_histograms(request, attempt_id: int):
+    """Screen heatmap (``width`` x ``height`` cells) and counts per time bucket (``buckets``) of each event type."""
+    attempt = get_object_or_404(Attempt, id=attempt_id)
+    if request.user.role == "STUDENT" and attempt.user_id != request.user.id:
+        return Response({"detail": "No autorizado"}, status=status.HTTP_403_FORBIDDEN)
+
+    parameters = {
+        "width": (HEATMAP_SIZE[0], 1, HEATMAP_MAX_SIZE),
+        "height": (HEATMAP_SIZE[1], 1, HEATMAP_MAX_SIZE),
+        "buckets": (HISTOGRAM_BUCKETS, 1, HISTOGRAM_MAX_BUCKETS),
+    }
+    values = {}
+    for name, (default, minimum, maximum) in parameters.items():
+        values[name] = _bounded_int(request.query_params.get(name), default, minimum, maximum)
+        if values[name] is None:
+            return Response(
+                {"detail": f"{name} must be between {minimum} and {maximum}."}, status=status.HTTP_400_BAD_REQUEST
+            )
+    return Response(event_histograms(attempt, **values))
+
+
+@api_view(["GET"])
+@permission_classes([permissions.IsAuthenticated])
+def attempt_report_pdf(request, attempt_id: int):
+    attempt = get_object_or_404(Attempt.objects.select_related("procedure", "user"), id=attempt_id)
+    if request.user.role == "STUDENT" and attempt.user != request.user:
+        return Response({"detail": "No autorizado"}, status=status.HTTP_403_FORBIDDEN)
 
-    doc.build(elements)
-    buffer.seek(0)
-    response = HttpResponse(buffer.read(), content_type="application/pdf")
-    response["Content-Disposition"] = f"attachment; filename=report_attempt_{attempt.id}.pdf"
+    snapshot = report_snapshot(attempt)
+    content_hash = report_hash(snapshot)
+    path = last_modified = None
+    if attempt.status == Attempt.Status.COMPLETED:
+        path = store_report(attempt.id, snapshot, content_hash)
+        last_modified = int(path.stat().st_mtime)
+    etag = f'"{content_hash}"'
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+    filename = f"report_attempt_{attempt.id}.pdf"
+    if path is not None:
+        response = FileResponse(path.open("rb"), as_attachment=True, filename=filename, content_type="application/pdf")
+        response["Last-Modified"] = http_date(last_modified)
+    else:
+        response = HttpResponse(render_report_pdf(snapshot), content_type="application/pdf")
+        response["Content-Disposition"] = f"attachment; filename={filename}"
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, no-cache"
     return response
 
 
@@ -396,6 +672,18 @@ def ai_guidance(request):
     procedure = request.data.get("procedure", {})
     step = request.data.get("step", {})
     context = request.data.get("context", {})
+    if request.data.get("procedure_id") is not None:
+        # Stored procedures are resolved from their compiled plan instead of the client's copy.
+        try:
+            procedure_id = int(request.data["procedure_id"])
+        except (TypeError, ValueError):
+            return Response({"detail": "procedure_id inválido"}, status=status.HTTP_400_BAD_REQUEST)
+        revision = Procedure.objects.filter(id=procedure_id).values_list("revision", flat=True).first()
+        if revision is None:
+            return Response({"detail": "Procedimiento no encontrado"}, status=status.HTTP_404_NOT_FOUND)
+        plan = get_compiled_procedure(procedure_id, revision)
+        procedure = {"name": plan.name}
+        step = plan.step(request.data.get("step_id")) or step
     ai_settings = AISettings.objects.filter(user=request.user).first()
     if not ai_settings or not ai_settings.use_ai or not ai_settings.api_key_encrypted:
         return Response(
@@ -0,0 +1,387 @@
+"""Server-side zone engine.
+
+``Procedure.zones`` is compiled into a ``ZoneIndex``: the legacy ``target``
+and ``forbidden`` spheres plus any number of ``regions``::
+
+    {"id": "artery", "kind": "forbidden", "shape": "sphere", "center": [x, y, z], "radius": r}
+    {"id": "nerve", "kind": "forbidden", "shape": "capsule", "a": [x, y, z], "b": [x, y, z], "radius": r}
+    {"id": "field", "kind": "target", "shape": "box", "min": [x, y, z], "max": [x, y, z]}
+
+Points may also be given as ``{"x": .., "y": .., "z": ..}`` and boxes as
+``center`` plus ``size``. Zones are bucketed into a uniform grid of cells, so
+a batch of samples is only tested against the zones of the cells it falls in;
+zones covering too many cells are tested against every sample instead.
+
+``ZoneTracker`` turns move samples into authoritative ``hit`` (entry),
+``zone_exit`` and ``contact_duration`` events, carrying the set of zones a
+trajectory is inside from one batch to the next. Zone events reported by the
+client are then kept for audit only, marked ``"source": "client"``, and are
+not scored.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+from typing import Any
+
+import numpy as np
+from django.conf import settings
+
+SPHERE, CAPSULE, BOX = 0, 1, 2
+SHAPES = {"sphere": SPHERE, "capsule": CAPSULE, "box": BOX}
+LEGACY_KINDS = ("target", "forbidden")
+SEVERITIES = {"forbidden": "high", "target": "low"}
+ZONE_EVENT_TYPES = ("hit", "contact_duration", "zone_exit")
+CLIENT_SOURCE = "client"
+MAX_CELLS_PER_ZONE = 512
+_KEY_MASK = (1 << 21) - 1
+
+
+class ZoneConfigError(ValueError):
+    pass
+
+
+def zones_signature(zones: Any) -> str:
+    return hashlib.sha1(json.dumps(zones, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def _point(value: Any, field: str) -> list[float]:
+    if isinstance(value, dict):
+        value = [value.get("x"), value.get("y"), value.get("z")]
+    if not isinstance(value, (list, tuple)) or len(value) != 3:
+        raise ZoneConfigError(f"{field} must be [x, y, z] or {{x, y, z}}")
+    try:
+        point = [float(coordinate) for coordinate in value]
+    except (TypeError, ValueError):
+        raise ZoneConfigError(f"{field} must contain numbers") from None
+    if not all(math.isfinite(coordinate) for coordinate in point):
+        raise ZoneConfigError(f"{field} must contain finite numbers")
+    return point
+
+
+def _radius(region: dict[str, Any]) -> float:
+    try:
+        radius = float(region.get("radius"))
+    except (TypeError, ValueError):
+        raise ZoneConfigError("radius must be a number") from None
+    if not radius > 0:
+        raise ZoneConfigError("radius must be positive")
+    return radius
+
+
+def _parse_region(region: Any, position: int) -> tuple[str, str, int, list[float], list[float], float]:
+    if not isinstance(region, dict):
+        raise ZoneConfigError(f"region {position} must be an object")
+    zone_id = str(region.get("id", position))
+    kind = region.get("kind")
+    if not isinstance(kind, str) or not kind:
+        raise ZoneConfigError(f"region {zone_id}: kind is required")
+    shape = SHAPES.get(region.get("shape", "sphere"))
+    if shape is None:
+        raise ZoneConfigError(f"region {zone_id}: shape must be one of {', '.join(SHAPES)}")
+    try:
+        if shape == SPHERE:
+            center = _point(region.get("center", region), "center")
+            return zone_id, kind, shape, center, center, _radius(region)
+        if shape == CAPSULE:
+            return zone_id, kind, shape, _point(region.get("a"), "a"), _point(region.get("b"), "b"), _radius(region)
+        if "center" in region:
+            center = np.array(_point(region["center"], "center"))
+            half = np.abs(_point(region.get("size"), "size")) / 2
+            lower, upper = (center - half).tolist(), (center + half).tolist()
+        else:
+            lower, upper = _point(region.get("min"), "min"), _point(region.get("max"), "max")
+        if any(low > high for low, high in zip(lower, upper)):
+            raise ZoneConfigError("min must not exceed max")
+        return zone_id, kind, shape, lower, upper, 0.0
+    except ZoneConfigError as exc:
+        raise ZoneConfigError(f"region {zone_id}: {exc}") from None
+
+
+def parse_zones(zones: Any) -> list[tuple[str, str, int, list[float], list[float], float]]:
+    """Normalize ``Procedure.zones`` into ``(id, kind, shape, p0, p1, radius)`` tuples."""
+    if not zones:
+        return []
+    if not isinstance(zones, dict):
+        raise ZoneConfigError("zones must be an object")
+    parsed = []
+    for kind in LEGACY_KINDS:
+        sphere = zones.get(kind)
+        if sphere:
+            parsed.append(_parse_region({"id": kind, "kind": kind, "shape": "sphere", **sphere}, len(parsed)))
+    regions = zones.get("regions", [])
+    if not isinstance(regions, list):
+        raise ZoneConfigError("regions must be a list")
+    for region in regions:
+        parsed.append(_parse_region(region, len(parsed)))
+    ids = [zone[0] for zone in parsed]
+    if len(set(ids)) != len(ids):
+        raise ZoneConfigError("zone ids must be unique")
+    return parsed
+
+
+class ZoneIndex:
+    """Compiled zones of a procedure with a uniform-grid broad phase."""
+
+    def __init__(self, zones: Any, cell_size: float | None = None) -> None:
+        parsed = parse_zones(zones)
+        self.signature = zones_signature(zones)
+        self.ids = [zone[0] for zone in parsed]
+        self.kinds = [zone[1] for zone in parsed]
+        self.shape = np.array([zone[2] for zone in parsed], dtype=np.int8)
+        self.p0 = np.array([zone[3] for zone in parsed], dtype=np.float64).reshape(-1, 3)
+        self.p1 = np.array([zone[4] for zone in parsed], dtype=np.float64).reshape(-1, 3)
+        self.radius = np.array([zone[5] for zone in parsed], dtype=np.float64)
+        self._build_grid(cell_size or settings.ZONE_GRID_CELL_SIZE)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _build_grid(self, cell_size: float) -> None:
+        lower = np.minimum(self.p0, self.p1) - self.radius[:, None]
+        upper = np.maximum(self.p0, self.p1) + self.radius[:, None]
+        if not cell_size:
+            extents = (upper - lower).max(axis=1) if len(self) else np.ones(1)
+            cell_size = max(float(np.median(extents)), 1e-3)
+        self.cell_size = cell_size
+        first = np.floor(lower / cell_size).astype(np.int64)
+        last = np.floor(upper / cell_size).astype(np.int64)
+        keys = []
+        members = []
+        global_zones = []
+        for zone, (low, high) in enumerate(zip(first, last)):
+            if np.prod(high - low + 1) > MAX_CELLS_PER_ZONE:
+                global_zones.append(zone)
+                continue
+            grid = np.stack(np.meshgrid(*(np.arange(a, b + 1) for a, b in zip(low, high)), indexing="ij"), -1)
+            cells = grid.reshape(-1, 3)
+            keys.append(self._keys(cells))
+            members.append(np.full(len(cells), zone, dtype=np.int64))
+        keys = np.concatenate(keys) if keys else np.empty(0, dtype=np.int64)
+        members = np.concatenate(members) if members else np.empty(0, dtype=np.int64)
+        order = np.argsort(keys, kind="stable")
+        keys, members = keys[order], members[order]
+        self.cell_keys, starts = np.unique(keys, return_index=True)
+        self.cell_offsets = np.append(starts, len(keys)).astype(np.int64)
+        self.cell_zones = members
+        self.global_zones = np.array(global_zones, dtype=np.int64)
+
+    @staticmethod
+    def _keys(cells: np.ndarray) -> np.ndarray:
+        # Coordinates wrap at 2**21 cells per axis; a collision only adds candidates.
+        cells = cells & _KEY_MASK
+        return (cells[:, 0] << 42) | (cells[:, 1] << 21) | cells[:, 2]
+
+    def query(self, points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """``(sample, zone)`` index pairs for every sample inside a zone."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        count = len(points)
+        if not count or not len(self):
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty
+        samples, zones = self._candidates(points)
+        inside = self._contains(points[samples], zones)
+        return samples[inside], zones[inside]
+
+    def _candidates(self, points: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        count = len(points)
+        samples = np.empty(0, dtype=np.int64)
+        zones = np.empty(0, dtype=np.int64)
+        if len(self.cell_keys):
+            keys = self._keys(np.floor(points / self.cell_size).astype(np.int64))
+            position = np.minimum(np.searchsorted(self.cell_keys, keys), len(self.cell_keys) - 1)
+            found = self.cell_keys[position] == keys
+            starts = np.where(found, self.cell_offsets[position], 0)
+            counts = np.where(found, self.cell_offsets[position + 1] - starts, 0)
+            samples = np.repeat(np.arange(count), counts)
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            zones = self.cell_zones[np.repeat(starts, counts) + offsets]
+        if len(self.global_zones):
+            samples = np.concatenate([samples, np.repeat(np.arange(count), len(self.global_zones))])
+            zones = np.concatenate([zones, np.tile(self.global_zones, count)])
+        return samples, zones
+
+    def _contains(self, points: np.ndarray, zones: np.ndarray) -> np.ndarray:
+        start, end = self.p0[zones], self.p1[zones]
+        # Spheres are capsules whose segment has zero length.
+        segment = end - start
+        length = np.einsum("ij,ij->i", segment, segment)
+        t = np.clip(np.einsum("ij,ij->i", points - start, segment) / np.maximum(length, 1e-12), 0, 1)
+        offset = points - (start + t[:, None] * segment)
+        in_capsule = np.einsum("ij,ij->i", offset, offset) <= self.radius[zones] ** 2
+        in_box = np.all((points >= start) & (points <= end), axis=1)
+        return np.where(self.shape[zones] == BOX, in_box, in_capsule)
+
+
+def _is_sample(payload: Any, timestamp_ms: Any) -> bool:
+    if not isinstance(payload, dict) or isinstance(timestamp_ms, bool) or not isinstance(timestamp_ms, (int, float)):
+        return False
+    return all(
+        isinstance(payload.get(axis), (int, float))
+        and not isinstance(payload.get(axis), bool)
+        and math.isfinite(payload[axis])
+        for axis in ("x", "y", "z")
+    )
+
+
+def move_samples(events: list[tuple[str, Any, Any]]) -> list[tuple[Any, dict]]:
+    """``(timestamp_ms, payload)`` of the trackable move samples among ``events``, sorted by timestamp."""
+    samples = [
+        (timestamp_ms, payload)
+        for event_type, payload, timestamp_ms in events
+        if event_type == "move" and _is_sample(payload, timestamp_ms)
+    ]
+    samples.sort(key=lambda sample: sample[0])
+    return samples
+
+
+def is_client_zone_event(event_type: str, payload: Any) -> bool:
+    """Whether a stored event is a client-reported zone event kept for audit only."""
+    return event_type in ZONE_EVENT_TYPES and isinstance(payload, dict) and payload.get("source") == CLIENT_SOURCE
+
+
+def _client_event(event: tuple[str, Any, Any]) -> tuple[str, Any, Any]:
+    event_type, payload, timestamp_ms = event
+    if isinstance(payload, dict):
+        payload = {**payload, "source": CLIENT_SOURCE}
+    else:
+        payload = {"payload": payload, "source": CLIENT_SOURCE}
+    return event_type, payload, timestamp_ms
+
+
+class ZoneTracker:
+    """Derives zone events from move samples, resuming from a saved state."""
+
+    def __init__(self, index: ZoneIndex, state: dict[str, Any] | None = None) -> None:
+        self.index = index
+        state = state or {}
+        if state.get("signature") != index.signature:
+            state = {}
+        self.inside = {int(zone): entered_ms for zone, entered_ms in state.get("inside", {}).items()}
+        self.last_ms = state.get("last_ms")
+
+    def state(self) -> dict[str, Any]:
+        return {
+            "signature": self.index.signature,
+            "inside": {str(zone): entered_ms for zone, entered_ms in self.inside.items()},
+            "last_ms": self.last_ms,
+        }
+
+    def feed(self, samples: list[tuple[Any, dict]]) -> list[tuple[str, dict, Any]]:
+        """Zone events for ``(timestamp_ms, payload)`` move samples sorted by timestamp.
+
+        Samples older than the last one already tracked are ignored.
+        """
+        if self.last_ms is not None:
+            samples = [sample for sample in samples if sample[0] >= self.last_ms]
+        if not samples:
+            return []
+        points = np.array([[payload["x"], payload["y"], payload["z"]] for _, payload in samples], dtype=np.float64)
+        hit_samples, hit_zones = self.index.query(points)
+        current = np.array(sorted(self.inside), dtype=np.int64)
+        involved = np.union1d(hit_zones, current)
+        membership = np.zeros((len(samples) + 1, len(involved)), dtype=np.int8)
+        membership[0, np.searchsorted(involved, current)] = 1
+        membership[hit_samples + 1, np.searchsorted(involved, hit_zones)] = 1
+        rows, columns = np.nonzero(np.diff(membership, axis=0))
+        changes = np.diff(membership, axis=0)[rows, columns]
+        events = []
+        # Exits of a sample are reported before its entries.
+        for row, change, column in sorted(zip(rows.tolist(), changes.tolist(), columns.tolist())):
+            timestamp_ms, payload = samples[row]
+            zone = int(involved[column])
+            kind, zone_id = self.index.kinds[zone], self.index.ids[zone]
+            if change > 0:
+                self.inside[zone] = timestamp_ms
+                events.append(
+                    (
+                        "hit",
+                        {
+                            "zone": kind,
+                            "zone_id": zone_id,
+                            "x": payload["x"],
+                            "y": payload["y"],
+                            "z": payload["z"],
+                            "severity": SEVERITIES.get(kind, "low"),
+                            "screen": payload.get("screen"),
+                            "source": "server",
+                        },
+                        timestamp_ms,
+                    )
+                )
+            else:
+                events.extend(self._exit(zone, timestamp_ms))
+        self.last_ms = samples[-1][0]
+        return events
+
+    def close(self) -> list[tuple[str, dict, Any]]:
+        """Exit every zone still in contact at the last tracked sample."""
+        events = []
+        for zone in sorted(self.inside):
+            events.extend(self._exit(zone, self.last_ms))
+        return events
+
+    def _exit(self, zone: int, timestamp_ms: Any) -> list[tuple[str, dict, Any]]:
+        entered_ms = self.inside.pop(zone)
+        kind, zone_id = self.index.kinds[zone], self.index.ids[zone]
+        return [
+            ("zone_exit", {"zone": kind, "zone_id": zone_id, "source": "server"}, timestamp_ms),
+            (
+                "contact_duration",
+                {"zone": kind, "zone_id": zone_id, "duration_ms": timestamp_ms - entered_ms, "source": "server"},
+                timestamp_ms,
+            ),
+        ]
+
+
+def _zone_tracker(row: tuple[int, int, Any] | None) -> ZoneTracker | None:
+    from .plans import get_compiled_procedure
+
+    if row is None:
+        return None
+    procedure_id, revision, state = row
+    index = get_compiled_procedure(procedure_id, revision).zone_index
+    return ZoneTracker(index, state) if index is not None else None
+
+
+def attempt_zone_tracker(attempt_id: int) -> ZoneTracker | None:
+    """A tracker resuming from the attempt's stored state, or None when the zone engine does not apply.
+
+    The tracker is not saved back; sockets use it to warn about zone entries
+    as soon as the samples arrive, before they are stored.
+    """
+    from .models import Attempt
+
+    if not settings.ZONE_ENGINE_ENABLED:
+        return None
+    return _zone_tracker(
+        Attempt.objects.filter(id=attempt_id).values_list("procedure_id", "procedure__revision", "zone_state").first()
+    )
+
+
+def apply_zone_engine(attempt_id: int, events: list[tuple[str, Any, Any]], close: bool = False) -> list[tuple[str, Any, Any]]:
+    """Derive zone events from the attempt's move samples; client-reported ones are kept for audit only.
+
+    Must run inside the transaction that stores ``events``; the attempt row is
+    locked while its tracker state is read and written. Attempts whose
+    procedure has no zones keep their events untouched.
+    """
+    from .models import Attempt
+
+    if not settings.ZONE_ENGINE_ENABLED:
+        return events
+    tracker = _zone_tracker(
+        Attempt.objects.select_for_update(of=("self",))
+        .filter(id=attempt_id)
+        .values_list("procedure_id", "procedure__revision", "zone_state")
+        .first()
+    )
+    if tracker is None:
+        return events
+    kept = [_client_event(event) if event[0] in ZONE_EVENT_TYPES else event for event in events]
+    derived = tracker.feed(move_samples(events))
+    if close:
+        derived += tracker.close()
+    Attempt.objects.filter(id=attempt_id).update(zone_state=tracker.state())
+    return kept + derived
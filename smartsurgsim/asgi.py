@@ -4,13 +4,13 @@ import os
 from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
 
-from simulator.middleware import JwtAuthMiddlewareStack
-from simulator.routing import websocket_urlpatterns
-
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "smartsurgsim.settings")
 
 django_asgi_app = get_asgi_application()
 
+from simulator.middleware import JwtAuthMiddlewareStack  # noqa: E402 - needs the app registry
+from simulator.routing import websocket_urlpatterns  # noqa: E402
+
 application = ProtocolTypeRouter(
     {
         "http": django_asgi_app,
@@ -88,21 +88,73 @@ AUTH_USER_MODEL = "accounts.User"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "accounts.authentication.CachedJWTAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
     ),
 }
 
+AUTH_USER_CACHE_SIZE = int(os.getenv("AUTH_USER_CACHE_SIZE", "4096"))
+# Upper bound on how long another worker process may keep serving a changed account.
+AUTH_USER_CACHE_TTL_SECONDS = float(os.getenv("AUTH_USER_CACHE_TTL_SECONDS", "30"))
+PROCEDURE_CACHE_SIZE = int(os.getenv("PROCEDURE_CACHE_SIZE", "256"))
+
 CHANNEL_LAYERS = {
     "default": {
         "BACKEND": "channels.layers.InMemoryChannelLayer",
     }
 }
+if os.getenv("CHANNEL_LAYER_BACKEND", "memory") == "sqlite":
+    # Shared by every ASGI worker on this host, see simulator/channel_layers.py.
+    CHANNEL_LAYERS["default"] = {
+        "BACKEND": "simulator.channel_layers.SQLiteChannelLayer",
+        "CONFIG": {
+            "path": os.getenv("CHANNEL_LAYER_PATH", str(BASE_DIR / "channels.sqlite3")),
+            "capacity": int(os.getenv("CHANNEL_LAYER_CAPACITY", "100")),
+            "expiry": int(os.getenv("CHANNEL_LAYER_EXPIRY", "60")),
+        },
+    }
 
 AI_PROVIDER = os.getenv("AI_PROVIDER", "openai_compatible")
 AI_ENDPOINT = os.getenv("AI_ENDPOINT", "https://api.openai.com/v1/chat/completions")
 AI_DEFAULT_MODEL = os.getenv("AI_DEFAULT_MODEL", "gpt-4o-mini")
 AI_AUTH_SCHEME = os.getenv("AI_AUTH_SCHEME", "bearer")
 AI_TIMEOUT_SECONDS = int(os.getenv("AI_TIMEOUT_SECONDS", "20"))
+
+EVENT_BUFFER_MAX_EVENTS = int(os.getenv("EVENT_BUFFER_MAX_EVENTS", "50"))
+EVENT_BUFFER_FLUSH_INTERVAL_MS = int(os.getenv("EVENT_BUFFER_FLUSH_INTERVAL_MS", "1000"))
+EVENT_BULK_BATCH_SIZE = int(os.getenv("EVENT_BULK_BATCH_SIZE", "500"))
+EVENT_INGEST_CHUNK_SIZE = int(os.getenv("EVENT_INGEST_CHUNK_SIZE", "1000"))
+EVENT_FLUSH_ACK_TIMEOUT_MS = int(os.getenv("EVENT_FLUSH_ACK_TIMEOUT_MS", "2000"))
+TRAJECTORY_CHUNK_SAMPLES = int(os.getenv("TRAJECTORY_CHUNK_SAMPLES", "4096"))
+EVENT_MOVE_MIN_INTERVAL_MS = int(os.getenv("EVENT_MOVE_MIN_INTERVAL_MS", "10"))
+EVENT_RATE_PER_ATTEMPT = float(os.getenv("EVENT_RATE_PER_ATTEMPT", "200"))
+EVENT_BURST_PER_ATTEMPT = float(os.getenv("EVENT_BURST_PER_ATTEMPT", "400"))
+EVENT_RATE_PER_USER = float(os.getenv("EVENT_RATE_PER_USER", "400"))
+EVENT_BURST_PER_USER = float(os.getenv("EVENT_BURST_PER_USER", "800"))
+EVENT_RATE_CLOSE_AFTER = int(os.getenv("EVENT_RATE_CLOSE_AFTER", "1000"))
+EVENT_DISCRETE_RATE_PER_ATTEMPT = float(os.getenv("EVENT_DISCRETE_RATE_PER_ATTEMPT", "20"))
+EVENT_DISCRETE_BURST_PER_ATTEMPT = float(os.getenv("EVENT_DISCRETE_BURST_PER_ATTEMPT", "100"))
+EVENT_DISCRETE_RATE_PER_USER = float(os.getenv("EVENT_DISCRETE_RATE_PER_USER", "40"))
+EVENT_DISCRETE_BURST_PER_USER = float(os.getenv("EVENT_DISCRETE_BURST_PER_USER", "200"))
+EVENT_DISCRETE_CLOSE_AFTER = int(os.getenv("EVENT_DISCRETE_CLOSE_AFTER", "100"))
+LIVE_SCORE_INTERVAL_MS = int(os.getenv("LIVE_SCORE_INTERVAL_MS", "1000"))
+SCORING_MODE = os.getenv("SCORING_MODE", "stream")
+SHADOW_SCORERS = [name.strip() for name in os.getenv("SHADOW_SCORERS", "").split(",") if name.strip()]
+SHADOW_SCORING_WORKERS = int(os.getenv("SHADOW_SCORING_WORKERS", "1"))
+LEARNING_CURVE_WINDOW = int(os.getenv("LEARNING_CURVE_WINDOW", "5"))
+REPORT_ARTIFACT_DIR = os.getenv("REPORT_ARTIFACT_DIR", str(BASE_DIR / "reports"))
+REPORT_PRERENDER = os.getenv("REPORT_PRERENDER", "true").lower() == "true"
+REPORT_RENDER_WORKERS = int(os.getenv("REPORT_RENDER_WORKERS", "1"))
+REPORT_EXPORT_WORKERS = int(os.getenv("REPORT_EXPORT_WORKERS", "2"))
+REPORT_HISTOGRAM_CACHE_SIZE = int(os.getenv("REPORT_HISTOGRAM_CACHE_SIZE", "256"))
+ZONE_ENGINE_ENABLED = os.getenv("ZONE_ENGINE_ENABLED", "true").lower() == "true"
+ZONE_GRID_CELL_SIZE = float(os.getenv("ZONE_GRID_CELL_SIZE", "0"))
+
+EVENT_SPOOL_ENABLED = os.getenv("EVENT_SPOOL_ENABLED", "false").lower() == "true"
+EVENT_SPOOL_DIR = os.getenv("EVENT_SPOOL_DIR", str(BASE_DIR / "spool"))
+EVENT_SPOOL_FSYNC_EVERY = int(os.getenv("EVENT_SPOOL_FSYNC_EVERY", "64"))
+EVENT_SPOOL_FSYNC_INTERVAL_MS = int(os.getenv("EVENT_SPOOL_FSYNC_INTERVAL_MS", "50"))
+EVENT_SPOOL_SEGMENT_BYTES = int(os.getenv("EVENT_SPOOL_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+EVENT_SPOOL_FLUSH_INTERVAL_MS = int(os.getenv("EVENT_SPOOL_FLUSH_INTERVAL_MS", "1000"))
@@ -569,19 +569,105 @@ const App = (() => {
       errorList.appendChild(li);
     };
 
+    // Binary telemetry (simulator/protocol.py): move/hit/contact samples are packed
+    // into fixed-width little-endian records behind a <BBH> header. The server only
+    // replies to these frames when it has a warning or hint to show.
+    const telemetryProtocol = 'smartsurgsim.telemetry.v1';
+    const telemetryTools = ['', 'SCALPEL', 'FORCEPS', 'NEEDLE_DRIVER', 'CAUTERY'];
+    const telemetryZones = ['', 'target', 'forbidden'];
+    const telemetrySeverities = ['', 'low', 'high'];
+    const telemetryRecords = {
+      move: { kind: 1, size: 25 },
+      hit: { kind: 2, size: 26 },
+      contact_duration: { kind: 3, size: 9 },
+    };
+    const moveBatchSize = 8;
+    const moveBatchMs = 250;
+    let binarySocket = false;
+    let pendingMoves = [];
+    let moveBatchTimer = null;
+    let throttledUntil = 0;
+
+    const codeOf = (table, value) => Math.max(table.indexOf(value || ''), 0);
+
+    const packTelemetry = (eventType, events) => {
+      const { kind, size } = telemetryRecords[eventType];
+      const buffer = new ArrayBuffer(4 + size * events.length);
+      const view = new DataView(buffer);
+      view.setUint8(0, 1);
+      view.setUint8(1, kind);
+      view.setUint16(2, events.length, true);
+      events.forEach((event, index) => {
+        const payload = event.payload;
+        let offset = 4 + index * size;
+        view.setUint32(offset, Math.max(Math.round(event.timestamp_ms), 0), true);
+        offset += 4;
+        if (eventType === 'contact_duration') {
+          view.setUint8(offset, codeOf(telemetryZones, payload.zone));
+          view.setUint32(offset + 1, Math.max(Math.round(payload.duration_ms || 0), 0), true);
+          return;
+        }
+        if (eventType === 'hit') {
+          view.setUint8(offset, codeOf(telemetryZones, payload.zone));
+          offset += 1;
+        }
+        view.setFloat32(offset, payload.x, true);
+        view.setFloat32(offset + 4, payload.y, true);
+        view.setFloat32(offset + 8, payload.z, true);
+        offset += 12;
+        view.setUint8(
+          offset,
+          eventType === 'hit' ? codeOf(telemetrySeverities, payload.severity) : codeOf(telemetryTools, payload.tool)
+        );
+        view.setFloat32(offset + 1, payload.screen ? payload.screen.x : NaN, true);
+        view.setFloat32(offset + 5, payload.screen ? payload.screen.y : NaN, true);
+      });
+      return buffer;
+    };
+
+    const flushMoves = () => {
+      clearTimeout(moveBatchTimer);
+      moveBatchTimer = null;
+      if (!pendingMoves.length) return;
+      if (socketOpen && Date.now() < throttledUntil) {
+        // Backpressure from the server: keep only the latest sample until the window reopens.
+        pendingMoves = pendingMoves.slice(-1);
+        moveBatchTimer = setTimeout(flushMoves, throttledUntil - Date.now());
+        return;
+      }
+      const batch = pendingMoves;
+      pendingMoves = [];
+      if (socketOpen) {
+        socket.send(packTelemetry('move', batch));
+        return;
+      }
+      batch.forEach((event) => postEvent(event));
+    };
+
     const connectSocket = () => {
       const token = getToken();
       const wsProtocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
       const wsUrl = `${wsProtocol}://${window.location.host}/ws/attempts/${attemptId}/?token=${token}`;
-      socket = new WebSocket(wsUrl);
+      socket = new WebSocket(wsUrl, [telemetryProtocol]);
+      socket.binaryType = 'arraybuffer';
       socket.onopen = () => {
         socketOpen = true;
+        binarySocket = socket.protocol === telemetryProtocol;
       };
       socket.onclose = () => {
         socketOpen = false;
+        binarySocket = false;
+        flushMoves();
       };
       socket.onmessage = (event) => {
         const data = JSON.parse(event.data);
+        if (data.status === 'score') {
+          document.getElementById('liveScore').textContent = data.total.toFixed(1);
+          return;
+        }
+        if (data.status === 'throttled') {
+          throttledUntil = Date.now() + (data.retry_after_ms || 0);
+        }
         if (data.warning) {
           pushLiveAlert(`⚠️ ${data.warning}`);
         }
@@ -591,20 +677,60 @@ const App = (() => {
       };
     };
 
+    // REST fallback: events are buffered locally and flushed as NDJSON to the
+    // bulk endpoint, so a socket outage does not turn into one POST per event.
+    const fallbackBatchSize = 500;
+    const fallbackBatchMs = 1000;
+    let fallbackEvents = [];
+    let fallbackTimer = null;
+
+    const flushFallbackEvents = async () => {
+      clearTimeout(fallbackTimer);
+      fallbackTimer = null;
+      if (!fallbackEvents.length) return;
+      const batch = fallbackEvents;
+      fallbackEvents = [];
+      await apiFetch(`${apiBase}/attempts/${attemptId}/events/bulk/`, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/x-ndjson' },
+        body: batch.map((event) => JSON.stringify(event)).join('\n'),
+      });
+    };
+
+    const postEvent = async (event) => {
+      fallbackEvents.push(event);
+      if (fallbackEvents.length >= fallbackBatchSize) {
+        await flushFallbackEvents();
+      } else if (!fallbackTimer) {
+        fallbackTimer = setTimeout(flushFallbackEvents, fallbackBatchMs);
+      }
+    };
+
     const sendEvent = async (eventType, payload = {}, timestampMs = null) => {
       const event = {
         event_type: eventType,
         payload,
         timestamp_ms: timestampMs ?? Date.now() - startTime,
       };
+      if (socketOpen && binarySocket && eventType === 'move') {
+        pendingMoves.push(event);
+        if (pendingMoves.length >= moveBatchSize) {
+          flushMoves();
+        } else if (!moveBatchTimer) {
+          moveBatchTimer = setTimeout(flushMoves, moveBatchMs);
+        }
+        return;
+      }
+      flushMoves();
+      if (socketOpen && binarySocket && telemetryRecords[eventType]) {
+        socket.send(packTelemetry(eventType, [event]));
+        return;
+      }
       if (socketOpen) {
         socket.send(JSON.stringify(event));
         return;
       }
-      await apiFetch(`${apiBase}/attempts/${attemptId}/event/`, {
-        method: 'POST',
-        body: JSON.stringify(event),
-      });
+      await postEvent(event);
     };
 
     const liveAlerts = document.getElementById('liveAlerts');
@@ -640,6 +766,8 @@ const App = (() => {
     document.getElementById('finishAttempt').addEventListener('click', async () => {
       const durationSeconds = Math.floor((Date.now() - startTime) / 1000);
       await flushContactDuration();
+      flushMoves();
+      await flushFallbackEvents();
       await apiFetch(`${apiBase}/attempts/${attemptId}/finish/`, {
         method: 'POST',
         body: JSON.stringify({ duration_seconds: durationSeconds }),
@@ -844,6 +972,35 @@ const App = (() => {
       danger.position.set(forbidden.x, forbidden.y, forbidden.z);
       scene.add(danger);
 
+      // Extra zones from procedure.zones.regions; hit detection for them is done by the server.
+      (procedure.zones?.regions || []).forEach((region) => {
+        const toVector = (value) =>
+          Array.isArray(value) ? new THREE.Vector3(...value) : new THREE.Vector3(value.x, value.y, value.z);
+        const material = new THREE.MeshStandardMaterial({
+          color: region.kind === 'forbidden' ? '#ef4444' : '#22c55e',
+          opacity: 0.25,
+          transparent: true,
+        });
+        let mesh;
+        if (region.shape === 'box') {
+          const min = region.center ? toVector(region.center).sub(toVector(region.size).multiplyScalar(0.5)) : toVector(region.min);
+          const max = region.center ? toVector(region.center).add(toVector(region.size).multiplyScalar(0.5)) : toVector(region.max);
+          const size = max.clone().sub(min);
+          mesh = new THREE.Mesh(new THREE.BoxGeometry(size.x, size.y, size.z), material);
+          mesh.position.copy(min.add(max).multiplyScalar(0.5));
+        } else if (region.shape === 'capsule') {
+          const a = toVector(region.a);
+          const b = toVector(region.b);
+          mesh = new THREE.Mesh(new THREE.CapsuleGeometry(region.radius, a.distanceTo(b), 8, 16), material);
+          mesh.position.copy(a.clone().add(b).multiplyScalar(0.5));
+          mesh.quaternion.setFromUnitVectors(new THREE.Vector3(0, 1, 0), b.clone().sub(a).normalize());
+        } else {
+          mesh = new THREE.Mesh(new THREE.SphereGeometry(region.radius, 20, 20), material);
+          mesh.position.copy(toVector(region.center || region));
+        }
+        scene.add(mesh);
+      });
+
       const fieldRing = new THREE.Mesh(
         new THREE.RingGeometry(0.45, 0.65, 40),
         new THREE.MeshBasicMaterial({ color: '#38bdf8', side: THREE.DoubleSide, opacity: 0.6, transparent: true })
@@ -1096,13 +1253,21 @@ const App = (() => {
 
   const loadReport = async (attemptId) => {
     await loadShell();
-    const response = await apiFetch(`${apiBase}/reports/${attemptId}/`);
+    const response = await apiFetch(`${apiBase}/reports/${attemptId}/summary/`);
     if (!response.ok) {
       window.location.href = '/dashboard/';
       return;
     }
     const data = await response.json();
     const attempt = data.attempt;
+    const fetchJson = async (path, fallback) => {
+      const result = await apiFetch(`${apiBase}/reports/${attemptId}/${path}`);
+      return result.ok ? result.json() : fallback;
+    };
+    const [timelinePage, histograms] = await Promise.all([
+      fetchJson('events/?limit=60', { results: [] }),
+      fetchJson('histograms/?width=32&height=24&buckets=30', null),
+    ]);
     const scoreSummary = document.getElementById('scoreSummary');
     scoreSummary.innerHTML = `
       <div class="d-flex align-items-center justify-content-between">
@@ -1126,8 +1291,7 @@ const App = (() => {
     `;
 
     const timeline = document.getElementById('timeline');
-    timeline.innerHTML = data.events
-      .slice(0, 60)
+    timeline.innerHTML = timelinePage.results
       .map((event) => {
         const detail = event.payload?.tool ? `(${event.payload.tool})` : '';
         const action = event.payload?.type ? `: ${event.payload.type}` : '';
@@ -1138,18 +1302,28 @@ const App = (() => {
     const heatmap = document.getElementById('heatmap');
     const ctx = heatmap.getContext('2d');
     ctx.clearRect(0, 0, heatmap.width, heatmap.height);
-    ctx.fillStyle = '#f87171';
-    data.events
-      .filter((event) => event.event_type === 'error' || event.event_type === 'hit' || event.event_type === 'move')
-      .forEach((event) => {
-        const screen = event.payload?.screen;
-        if (!screen) return;
-        const x = screen.x * heatmap.width;
-        const y = screen.y * heatmap.height;
-        ctx.beginPath();
-        ctx.arc(x, y, event.event_type === 'hit' ? 6 : 3, 0, Math.PI * 2);
-        ctx.fill();
+    if (histograms) {
+      const { width, height, counts } = histograms.heatmap;
+      const cellWidth = heatmap.width / width;
+      const cellHeight = heatmap.height / height;
+      const layers = [
+        ['move', '248, 113, 113'],
+        ['hit', '220, 38, 38'],
+        ['error', '127, 29, 29'],
+      ];
+      layers.forEach(([eventType, rgb]) => {
+        const grid = counts[eventType];
+        if (!grid) return;
+        const peak = Math.log1p(Math.max(...grid.flat()));
+        grid.forEach((row, y) => {
+          row.forEach((count, x) => {
+            if (!count) return;
+            ctx.fillStyle = `rgba(${rgb}, ${(0.15 + 0.85 * (Math.log1p(count) / peak)).toFixed(3)})`;
+            ctx.fillRect(x * cellWidth, y * cellHeight, cellWidth, cellHeight);
+          });
+        });
       });
+    }
 
     const scoreChart = document.getElementById('scoreChart');
     if (scoreChart) {
@@ -1177,24 +1351,25 @@ const App = (() => {
     }
 
     const timelineChart = document.getElementById('timelineChart');
-    if (timelineChart) {
-      const counts = data.events.reduce((acc, event) => {
-        acc[event.event_type] = (acc[event.event_type] || 0) + 1;
-        return acc;
-      }, {});
+    if (timelineChart && histograms) {
+      const { start_ms: startMs, bucket_ms: bucketMs, buckets, counts } = histograms.timeline;
+      const palette = ['#0ea5e9', '#f97316', '#22c55e', '#a855f7', '#ef4444', '#eab308', '#64748b'];
       new Chart(timelineChart, {
         type: 'bar',
         data: {
-          labels: Object.keys(counts),
-          datasets: [{ label: 'Eventos', data: Object.values(counts), backgroundColor: '#0ea5e9' }],
+          labels: Array.from({ length: buckets }, (_, index) => `${((startMs + index * bucketMs) / 1000).toFixed(0)}s`),
+          datasets: Object.entries(counts).map(([eventType, values], index) => ({
+            label: `${eventType} (${data.event_counts[eventType] ?? 0})`,
+            data: values,
+            backgroundColor: palette[index % palette.length],
+          })),
         },
+        options: { scales: { x: { stacked: true }, y: { stacked: true } } },
       });
     }
 
     const stepChecklist = document.getElementById('stepChecklist');
-    const completedSteps = data.events
-      .filter((event) => event.event_type === 'step_completed')
-      .map((event) => event.payload.step_id);
+    const completedSteps = data.completed_steps;
     stepChecklist.innerHTML = (attempt.procedure_detail?.steps || [])
       .map((step) => {
         const checked = completedSteps.includes(step.id) ? '✅' : '⬜';